@@ -1,17 +1,23 @@
 from __future__ import annotations
 
-from typing import Dict, List, Any, Optional
+import asyncio
+import logging
+import time
+from functools import wraps
+from typing import Annotated, Awaitable, Callable, Dict, List, Any, Optional
 
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, SystemMessage
 
 from langchain_openai import ChatOpenAI
 import os
 
-from db import SessionLocal, Doctor, DoctorProfile, PlanFeedback, TreatmentPlan
+from db.doctor_cache import doctor_cache
+from agent.prompt import atoken_counter, build_plan_prompt
 from agent.validators import run_rules
 
-from scripts.search_price import search_by_query, load_items, match_guideline
+from scripts.compact_catalog import load_compact_catalog
+from scripts.search_price import asearch_by_query, match_guideline
 
 # Для MVP используем openai/gpt-4o-mini или мок с ReAct. Здесь создаём ллм-клиент,
 # но реальный ключ надо положить в окружение OPENAI_API_KEY
@@ -22,6 +28,10 @@ if api_key:
 else:
     llm = None
 
+def merge_timings(left: Optional[Dict[str, float]], right: Optional[Dict[str, float]]) -> Dict[str, float]:
+    # Параллельные узлы пишут свои времена в одном шаге графа — складываем словари
+    return {**(left or {}), **(right or {})}
+
 class AgentState(dict):
     doctor: str
     doctor_id: Optional[int]
@@ -35,95 +45,77 @@ class AgentState(dict):
     doctor_profile: Optional[Dict[str, Any]]
     doctor_feedback: List[Dict[str, Any]]
     validation: List[Dict[str, Any]]
-
-def collect_context(state: AgentState) -> AgentState:
+    timings: Annotated[Dict[str, float], merge_timings]
+    prompt_stats: Dict[str, Any]
+
+# Узлы возвращают только свои ключи: collect_context и retrieve_pricing идут параллельно,
+# и два полных состояния в одном шаге графа конфликтовали бы
+def timed_node(name: str, node: Callable[[AgentState], Awaitable[Dict[str, Any]]]) -> Callable[[AgentState], Awaitable[Dict[str, Any]]]:
+    @wraps(node)
+    async def run(state: AgentState) -> Dict[str, Any]:
+        started = time.perf_counter()
+        update = await node(state)
+        elapsed = round(time.perf_counter() - started, 4)
+        logging.info("Agent node %s took %.4fs", name, elapsed)
+        return {**update, "timings": {name: elapsed}}
+
+    return run
+
+async def collect_context(state: AgentState) -> Dict[str, Any]:
     doctor_name = state.get("doctor")
     if not doctor_name:
-        return state
-
-    with SessionLocal() as session:
-        doctor: Optional[Doctor] = (
-            session.query(Doctor).filter(Doctor.name == doctor_name).first()
-        )
-        if not doctor:
-            return state
-
-        state["doctor_id"] = doctor.id
-        profile_payload: Dict[str, Any] = {
-            "specialization": doctor.specialization,
-            "experience_years": doctor.experience_years,
-            "preferences": doctor.preferences or {},
-        }
-
-        profile: Optional[DoctorProfile] = (
-            session.query(DoctorProfile)
-            .filter(DoctorProfile.doctor_id == doctor.id)
-            .order_by(DoctorProfile.updated_at.desc())
-            .first()
-        )
-        if profile:
-            profile_payload.update(
-                {
-                    "profile_name": profile.profile_name,
-                    "llm_prompt": profile.llm_prompt,
-                    "pricing_bias": profile.pricing_bias or {},
-                    "protocol_overrides": profile.protocol_overrides or {},
-                }
-            )
-        state["doctor_profile"] = profile_payload
-
-        feedback: List[PlanFeedback] = (
-            session.query(PlanFeedback)
-            .join(TreatmentPlan, PlanFeedback.plan_id == TreatmentPlan.id)
-            .filter(PlanFeedback.doctor_id == doctor.id)
-            .order_by(PlanFeedback.created_at.desc())
-            .limit(5)
-            .all()
-        )
-        state["doctor_feedback"] = [
-            {
-                "rating": fb.rating,
-                "accepted": fb.accepted,
-                "comments": fb.comments,
-                "diff": fb.diff_json,
-            }
-            for fb in feedback
-        ]
+        return {}
+
+    # Профиль и корректировки врача меняет только бот — читаем из кэша, БД лишь при промахе
+    doctor = await doctor_cache().aget_by_name(doctor_name)
+    if doctor is None:
+        return {}
+    return {
+        "doctor_id": doctor.id,
+        "doctor_profile": doctor.profile_payload(),
+        "doctor_feedback": doctor.feedback_payload(),
+    }
 
-    return state
+def lookup_codes(codes: List[str]) -> List[Dict[str, Any]]:
+    catalog = load_compact_catalog()
+    rows: List[Dict[str, Any]] = []
+    for code in codes:
+        item = catalog.get(code)
+        if item is not None:
+            rows.append(item.to_dict())
+    return rows
+
+def attach_guidelines(pricing_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for entry in pricing_rows:
+        code = entry.get("code")
+        guideline = match_guideline(code) if code else None
+        if guideline:
+            entry.setdefault("guideline_summary", guideline.get("summary"))
+            entry.setdefault("guideline_ref", guideline.get("reference"))
+    return pricing_rows
 
-def retrieve_pricing(state: AgentState) -> AgentState:
+async def retrieve_pricing(state: AgentState) -> Dict[str, Any]:
     codes = state.get("codes") or []
     intake = state.get("intake") or ""
 
+    # Каталог (пересборка после смены прайса) и рекомендации (первое чтение JSON) грузятся
+    # синхронно — в поток, чтобы не задерживать остальные запросы на цикле событий
     # приоритет — явные коды
     pricing_rows: List[Dict[str, Any]] = []
     if codes:
-        df = load_items()
-        for code in codes:
-            row = df.loc[df["code"] == code]
-            if not row.empty:
-                pricing_rows.append(row.iloc[0].to_dict())
+        pricing_rows = await asyncio.to_thread(lookup_codes, codes)
 
     # если кодов нет или часть не найдена — делаем семантический поиск
     if not pricing_rows and intake:
         try:
-            matches = search_by_query(intake, top_k=5)
+            matches = await asearch_by_query(intake, top_k=5)
         except Exception:
             matches = []
         for match in matches:
             payload = match.payload or {}
             pricing_rows.append(payload)
 
-    for entry in pricing_rows:
-        code = entry.get("code")
-        guideline = match_guideline(code) if code else None
-        if guideline:
-            entry.setdefault("guideline_summary", guideline.get("summary"))
-            entry.setdefault("guideline_ref", guideline.get("reference"))
-
-    state["pricing"] = pricing_rows
-    return state
+    return {"pricing": await asyncio.to_thread(attach_guidelines, pricing_rows)}
 
 def generate_stub_plan(state: AgentState) -> str:
     doctor = state.get("doctor", "")
@@ -140,56 +132,28 @@ def generate_stub_plan(state: AgentState) -> str:
         "3. Контрольный визит."
     )
 
-def build_plan(state: AgentState) -> AgentState:
+async def build_plan(state: AgentState) -> Dict[str, Any]:
     if llm is None:
-        state["plan_draft"] = generate_stub_plan(state)
-        return state
-
-    doctor = state.get("doctor", "")
-    patient = state.get("patient", "")
-    intake = state.get("intake", "")
-    codes = ", ".join(state.get("codes", []))
-
-    doctor_profile = state.get("doctor_profile") or {}
-    doctor_prefs = doctor_profile.get("preferences") or {}
-    specialization = doctor_profile.get("specialization")
-    base_prompt = doctor_profile.get("llm_prompt")
-
-    feedback_section = ""
-    feedback_list = state.get("doctor_feedback") or []
-    if feedback_list:
-        serialized = []
-        for item in feedback_list:
-            serialized.append(
-                f"accepted={item['accepted']} rating={item['rating']} comments={item['comments']} diff={item['diff']}"
-            )
-        feedback_section = "\nНедавние корректировки врача: " + " | ".join(serialized)
-
-    preference_section = ""
-    if doctor_prefs:
-        preference_section += "\nПредпочтения врача: " + str(doctor_prefs)
-    if specialization:
-        preference_section += f"\nСпециализация врача: {specialization}"
-
-    system_prompt = base_prompt or (
-        "Ты ассистент стоматологической клиники. Составь план лечения на русском языке,"
-        " учитывая предоставленные данные, специализацию врача и его недавние корректировки."
-        " Включи поэтапное описание, бюджет с диапазоном и рекомендации пациенту."
-    )
-
-    human_prompt = (
-        f"Доктор: {doctor}\nПациент: {patient}\nКоды услуг: {codes}"
-        f"\nОписание консультации: {intake}{preference_section}{feedback_section}"
+        return {"plan_draft": generate_stub_plan(state)}
+
+    # Профиль, предпочтения и отзывы врача режутся по бюджетам токенов — размер промпта предсказуем
+    prompt = build_plan_prompt(state, counter=await atoken_counter())
+    logging.info(
+        "Plan prompt: %s tokens (system %s, human %s), feedback %s kept / %s dropped",
+        prompt.stats["total_tokens"],
+        prompt.stats["system_tokens"],
+        prompt.stats["human_tokens"],
+        prompt.stats["sections"]["feedback"]["entries"],
+        prompt.stats["sections"]["feedback"]["dropped"],
     )
 
-    response = llm.invoke([
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=human_prompt),
+    response = await llm.ainvoke([
+        SystemMessage(content=prompt.system),
+        HumanMessage(content=prompt.human),
     ])
-    state["plan_draft"] = response.content
-    return state
+    return {"plan_draft": response.content, "prompt_stats": prompt.stats}
 
-def finalize(state: AgentState) -> AgentState:
+async def finalize(state: AgentState) -> Dict[str, Any]:
     plan_text = state.get("plan_draft", "")
     codes = state.get("codes", [])
     pricing = state.get("pricing", [])
@@ -201,28 +165,30 @@ def finalize(state: AgentState) -> AgentState:
     }
 
     results = run_rules(context)
-    state["validation"] = [
-        {
-            "rule_id": res.rule_id,
-            "passed": res.passed,
-            "message": res.message,
-            "severity": res.severity,
-        }
-        for res in results
-    ]
-
-    return state
+    return {
+        "validation": [
+            {
+                "rule_id": res.rule_id,
+                "passed": res.passed,
+                "message": res.message,
+                "severity": res.severity,
+            }
+            for res in results
+        ]
+    }
 
 def build_graph() -> StateGraph:
     graph = StateGraph(AgentState)
-    graph.add_node("collect_context", collect_context)
-    graph.add_node("retrieve_pricing", retrieve_pricing)
-    graph.add_node("build_plan", build_plan)
-    graph.add_node("finalize", finalize)
-
-    graph.set_entry_point("collect_context")
-    graph.add_edge("collect_context", "retrieve_pricing")
-    graph.add_edge("retrieve_pricing", "build_plan")
+    graph.add_node("collect_context", timed_node("collect_context", collect_context))
+    graph.add_node("retrieve_pricing", timed_node("retrieve_pricing", retrieve_pricing))
+    graph.add_node("build_plan", timed_node("build_plan", build_plan))
+    graph.add_node("finalize", timed_node("finalize", finalize))
+
+    # Профиль врача (БД) и прайс (каталог, Qdrant) независимы: запускаем одновременно
+    # и ждём оба перед build_plan
+    graph.add_edge(START, "collect_context")
+    graph.add_edge(START, "retrieve_pricing")
+    graph.add_edge(["collect_context", "retrieve_pricing"], "build_plan")
     graph.add_edge("build_plan", "finalize")
     graph.add_edge("finalize", END)
     return graph
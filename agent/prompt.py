@@ -0,0 +1,199 @@
+"""Prompt for ``build_plan`` assembled under per-section token budgets.
+
+Each section of the human message (codes, intake, doctor preferences, recent
+feedback) and the doctor's own system prompt is cut to its
+``PROMPT_*_TOKENS`` budget, measured with the tokenizer of the plan model.
+Feedback is added newest first; each entry keeps a truncated comment and a
+one-line summary of its diff instead of the raw ``diff_json`` dump. The
+returned stats (tokens per section, what was cut or dropped) go to the log
+and to the ``/agent/draft`` response.
+
+tiktoken downloads the encoding on first use; the app image pre-fetches it
+into ``TIKTOKEN_CACHE_DIR``, and async callers go through ``atoken_counter``
+so a slow or missing network never blocks the event loop.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import tiktoken
+
+PROMPT_TOKEN_MODEL = os.getenv("PROMPT_TOKEN_MODEL", "gpt-4o-mini")
+SECTION_BUDGETS: Dict[str, int] = {
+    "system": int(os.getenv("PROMPT_SYSTEM_TOKENS", "600")),
+    "codes": int(os.getenv("PROMPT_CODES_TOKENS", "200")),
+    "intake": int(os.getenv("PROMPT_INTAKE_TOKENS", "1000")),
+    "preferences": int(os.getenv("PROMPT_PREFERENCES_TOKENS", "300")),
+    "feedback": int(os.getenv("PROMPT_FEEDBACK_TOKENS", "600")),
+}
+FEEDBACK_COMMENT_TOKENS = int(os.getenv("PROMPT_FEEDBACK_COMMENT_TOKENS", "80"))
+FEEDBACK_DIFF_TOKENS = int(os.getenv("PROMPT_FEEDBACK_DIFF_TOKENS", "60"))
+# Без словаря tiktoken (нет сети при первом запуске) считаем грубо: ~3 символа кириллицы на токен
+APPROX_CHARS_PER_TOKEN = 3
+ELLIPSIS = "…"
+
+DEFAULT_SYSTEM_PROMPT = (
+    "Ты ассистент стоматологической клиники. Составь план лечения на русском языке,"
+    " учитывая предоставленные данные, специализацию врача и его недавние корректировки."
+    " Включи поэтапное описание, бюджет с диапазоном и рекомендации пациенту."
+)
+
+_counter_cache: Optional["TokenCounter"] = None
+
+
+class TokenCounter:
+    """Token counts and token-exact truncation for one model's encoding."""
+
+    def __init__(self, model: str = PROMPT_TOKEN_MODEL):
+        self.model = model
+        self.encoding: Optional[Any] = None
+        try:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            logging.warning("tiktoken encoding for %s is unavailable, prompt tokens are approximated", model)
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is None:
+            return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text))
+
+    def truncate(self, text: str, budget: int) -> str:
+        if self.count(text) <= budget:
+            return text
+        if budget <= 0:
+            return ""
+        if self.encoding is None:
+            return text[: (budget - 1) * APPROX_CHARS_PER_TOKEN].rstrip() + ELLIPSIS
+        tokens = self.encoding.encode(text)
+        return self.encoding.decode(tokens[: budget - 1]).rstrip() + ELLIPSIS
+
+
+def token_counter() -> TokenCounter:
+    global _counter_cache
+    if _counter_cache is None:
+        _counter_cache = TokenCounter()
+    return _counter_cache
+
+
+async def atoken_counter() -> TokenCounter:
+    if _counter_cache is not None:
+        return _counter_cache
+    return await asyncio.to_thread(token_counter)
+
+
+@dataclass
+class PlanPrompt:
+    system: str
+    human: str
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def summarize_diff(diff: Any, budget: int, counter: TokenCounter) -> str:
+    """The diff itself if it fits, otherwise what was changed (keys / size) rather than how."""
+    if diff in (None, "", {}, []):
+        return ""
+    text = diff if isinstance(diff, str) else compact_json(diff)
+    if counter.count(text) <= budget:
+        return text
+    if isinstance(diff, dict):
+        text = f"изменены поля ({len(diff)}): " + ", ".join(str(key) for key in diff)
+    elif isinstance(diff, list):
+        text = f"{len(diff)} изменений: " + "; ".join(compact_json(item) for item in diff[:3])
+    return counter.truncate(text, budget)
+
+
+def feedback_line(item: Dict[str, Any], counter: TokenCounter) -> str:
+    parts = [f"accepted={item.get('accepted')}", f"rating={item.get('rating')}"]
+    comments = counter.truncate(str(item.get("comments") or ""), FEEDBACK_COMMENT_TOKENS)
+    if comments:
+        parts.append(f"comments={comments}")
+    diff = summarize_diff(item.get("diff"), FEEDBACK_DIFF_TOKENS, counter)
+    if diff:
+        parts.append(f"diff={diff}")
+    return " ".join(parts)
+
+
+def build_plan_prompt(
+    state: Dict[str, Any],
+    budgets: Optional[Dict[str, int]] = None,
+    counter: Optional[TokenCounter] = None,
+) -> PlanPrompt:
+    budgets = {**SECTION_BUDGETS, **(budgets or {})}
+    counter = counter or token_counter()
+    sections: Dict[str, Dict[str, Any]] = {}
+
+    def fit(name: str, text: str, fitted: Optional[Callable[[], str]] = None) -> str:
+        raw = counter.count(text)
+        result = fitted() if fitted is not None else counter.truncate(text, budgets[name])
+        tokens = counter.count(result)
+        sections[name] = {"tokens": tokens, "raw_tokens": raw, "budget": budgets[name], "truncated": tokens < raw}
+        return result
+
+    doctor_profile = state.get("doctor_profile") or {}
+    system_prompt = fit("system", doctor_profile.get("llm_prompt") or DEFAULT_SYSTEM_PROMPT)
+    codes = fit("codes", ", ".join(state.get("codes") or []))
+    intake = fit("intake", state.get("intake") or "")
+
+    preference_section = ""
+    doctor_prefs = doctor_profile.get("preferences") or {}
+    if doctor_prefs:
+        preference_section += "\nПредпочтения врача: " + compact_json(doctor_prefs)
+    specialization = doctor_profile.get("specialization")
+    if specialization:
+        preference_section += f"\nСпециализация врача: {specialization}"
+    preference_section = fit("preferences", preference_section)
+
+    # Отзывы идут от новых к старым: не влезающие в бюджет старые отбрасываем целиком
+    feedback_list = state.get("doctor_feedback") or []
+    lines = [feedback_line(item, counter) for item in feedback_list]
+    kept: List[str] = []
+
+    def fit_feedback() -> str:
+        prefix = "\nНедавние корректировки врача: "
+        used = counter.count(prefix)
+        for line in lines:
+            cost = counter.count(" | " + line)
+            if used + cost > budgets["feedback"]:
+                break
+            kept.append(line)
+            used += cost
+        return prefix + " | ".join(kept) if kept else ""
+
+    raw_feedback = "".join(
+        f" | accepted={item.get('accepted')} rating={item.get('rating')} comments={item.get('comments')} diff={item.get('diff')}"
+        for item in feedback_list
+    )
+    feedback_section = fit("feedback", raw_feedback, fit_feedback)
+    sections["feedback"]["entries"] = len(kept)
+    sections["feedback"]["dropped"] = len(feedback_list) - len(kept)
+
+    human_prompt = (
+        f"Доктор: {state.get('doctor', '')}\nПациент: {state.get('patient', '')}\nКоды услуг: {codes}"
+        f"\nОписание консультации: {intake}{preference_section}{feedback_section}"
+    )
+    stats = {
+        "model": counter.model,
+        "exact": counter.exact,
+        "system_tokens": counter.count(system_prompt),
+        "human_tokens": counter.count(human_prompt),
+        "sections": sections,
+    }
+    stats["total_tokens"] = stats["system_tokens"] + stats["human_tokens"]
+    return PlanPrompt(system_prompt, human_prompt, stats)
@@ -3,6 +3,11 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Callable, Dict, Any, List
 
+from scripts.code_ranges import CodeRanges
+
+# Хирургия имплантации — весь раздел 809xxx
+IMPLANT_CODES = CodeRanges(prefixes=("809",))
+
 
 @dataclass
 class RuleResult:
@@ -31,7 +36,7 @@ def _has_anesthesia_before_implant(context: Dict[str, Any]) -> bool:
     codes: List[str] = context.get("codes", [])
     text: str = context.get("plan_text", "").lower()
 
-    implant_codes = {code for code in codes if code.startswith("809")}
+    implant_codes = IMPLANT_CODES.select(codes)
     if not implant_codes:
         return True
 
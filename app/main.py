@@ -1,20 +1,32 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from pathlib import Path
-import asyncio
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+import logging
 import os
 
 import pandas as pd
 from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
 from agent.graph import compiled_agent
+from db.price_modifiers import ModifierIndex, reprice_plans
+from db.pricing import PricingRepository
+from scripts.autocomplete import AUTOCOMPLETE_LIMIT, AutocompleteIndex
+from scripts.clinics import (
+    UnknownClinicError,
+    clinic_autocomplete,
+    clinic_catalog,
+    clinic_collection,
+    clinic_history,
+    clinic_registry,
+    clinic_repositories,
+    is_default_clinic,
+)
+from scripts.compact_catalog import CompactCatalog
+from scripts.catalog_versions import items_as_of
+from scripts.retrieval import similar_items
+from scripts.search_price import CODE_FACET_FIELDS, build_filter, load_model, quantization_search_params
 
-BASE_DIR = Path(os.getenv("DENT_AI_BASE", Path(__file__).resolve().parents[1]))
-CSV_PATH = Path(os.getenv("PRICING_CSV_PATH", BASE_DIR / "staging_price_items.csv"))
-COLLECTION = os.getenv("QDRANT_COLLECTION", "price_items_v1")
-MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "cointegrated/rubert-tiny2")
-model = SentenceTransformer(MODEL_NAME)
+model = load_model()
 
 def _make_qdrant_client() -> QdrantClient:
     qdrant_url = os.getenv("QDRANT_URL")
@@ -25,16 +37,42 @@ def _make_qdrant_client() -> QdrantClient:
     return QdrantClient(host=host, port=port)
 
 client = _make_qdrant_client()
+# catalog — снапшот в памяти + Qdrant; postgres — схема pricing (FTS + pgvector)
+PRICING_BACKEND = os.getenv("PRICING_BACKEND", "catalog")
+pricing_repo = PricingRepository() if PRICING_BACKEND == "postgres" else None
+# Клиника запроса — заголовок X-Clinic-Id; без него — прайс этого развёртывания
+# Фасеты считаются по keyword-индексам, которые создаёт ingest; по коду — префикс фиксированной длины
+FACET_FIELDS = ("section", *CODE_FACET_FIELDS.values())
 
 app = FastAPI(title="Dent AI Pricing API")
 
 class CodeRequest(BaseModel):
     code: str
 
-class QueryRequest(BaseModel):
+class SearchFilters(BaseModel):
+    sections: List[str] = []
+    code_prefix: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    def to_qdrant(self):
+        return build_filter(self.sections, self.code_prefix, self.min_price, self.max_price)
+
+    def to_kwargs(self) -> Dict[str, Any]:
+        return self.model_dump(include={"sections", "code_prefix", "min_price", "max_price"})
+
+class QueryRequest(SearchFilters):
     query: str
     top_k: int = 5
 
+class FacetRequest(SearchFilters):
+    field: str = "section"
+    limit: int = 50
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
 class PriceItem(BaseModel):
     code: str
     display_name: str
@@ -44,14 +82,29 @@ class PriceItem(BaseModel):
 
 class PlanRequest(BaseModel):
     codes: List[str]
+    # Цены версии прайса, действовавшей на эту дату (по умолчанию — текущий прайс)
+    as_of: Optional[datetime] = None
+
+class Adjustment(BaseModel):
+    label: str
+    type: str
+    amount: float
 
 class PlanItem(PriceItem):
     count: int
     sum: float
+    base_sum: float | None = None
+    adjustments: List[Adjustment] = []
 
 class PlanResponse(BaseModel):
     items: List[PlanItem]
     total: float
+    base_total: float | None = None
+    adjustments_total: float = 0.0
+
+class RepriceRequest(BaseModel):
+    plans: List[Dict[str, Any]]
+    as_of: Optional[datetime] = None
 
 class AgentDraftRequest(BaseModel):
     doctor: str
@@ -63,39 +116,182 @@ class AgentDraftRequest(BaseModel):
 class AgentDraftResponse(BaseModel):
     plan_draft: str
 
-def load_items() -> pd.DataFrame:
-    if not CSV_PATH.exists():
-        raise FileNotFoundError(f"CSV not found: {CSV_PATH}")
-    return pd.read_csv(CSV_PATH, dtype={"code": str})
+def modifier_index(clinic_id: Optional[str] = None) -> ModifierIndex:
+    # Скидки и наценки хранятся только в Postgres; для снапшота — пустой индекс
+    repo = clinic_repo(clinic_id)
+    return repo.modifier_index() if repo is not None else ModifierIndex()
+
+def clinic_repo(clinic_id: Optional[str] = None) -> Optional[PricingRepository]:
+    """Postgres repository of the clinic: catalogs are told apart by ``price_catalog.slug``."""
+    if pricing_repo is None or is_default_clinic(clinic_id):
+        return pricing_repo
+    return _clinic_lookup(clinic_repositories(pricing_repo).get, clinic_id)
+
+def _clinic_lookup(loader, clinic_id: Optional[str]):
+    try:
+        return loader(clinic_id)
+    except (UnknownClinicError, FileNotFoundError) as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+def catalog_for(clinic_id: Optional[str] = None) -> CompactCatalog:
+    # Снапшот перечитывается только при изменении файла на диске
+    return _clinic_lookup(clinic_catalog, clinic_id)
+
+def autocomplete_for(clinic_id: Optional[str] = None) -> AutocompleteIndex:
+    return _clinic_lookup(clinic_autocomplete, clinic_id)
+
+def collection_for(clinic_id: Optional[str] = None) -> str:
+    return _clinic_lookup(clinic_collection, clinic_id)
+
+def find_items(
+    codes: List[str],
+    as_of: Optional[datetime] = None,
+    clinic_id: Optional[str] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """code -> item for the codes present in the clinic's pricing backend (or its version at ``as_of``)."""
+    repo = clinic_repo(clinic_id)
+    if repo is not None:
+        return repo.get_items(codes, as_of=as_of)
+    if as_of is not None:
+        # У каждой клиники свой архив версий; даты раньше первой версии — по текущему прайсу (см. runbook)
+        found = items_as_of(codes, as_of, _clinic_lookup(clinic_history, clinic_id))
+        if found is not None:
+            return found
+        logging.warning("No archived catalog version at %s for clinic %s, pricing with the current catalog", as_of, clinic_id)
+    return catalog_for(clinic_id).items_for(codes)
+
+def _price_item(item: Dict[str, Any]) -> PriceItem:
+    return PriceItem(
+        code=item["code"],
+        display_name=item["display_name"],
+        base_price=float(item["base_price"]),
+        section=item["section"],
+        score=item.get("score"),
+    )
 
 @app.get("/ping")
 def ping():
     return {"status": "ok"}
 
+def catalog_info(clinic_id: Optional[str] = None) -> Dict[str, Any]:
+    catalog = catalog_for(clinic_id)
+    return {**catalog.info(), "memory": catalog.memory_report()}
+
+@app.get("/catalog")
+def catalog_status(x_clinic_id: Optional[str] = Header(None)) -> Dict[str, Any]:
+    return catalog_info(x_clinic_id)
+
+@app.get("/clinics")
+def clinics_status() -> Dict[str, Any]:
+    # Попадания, промахи и выселения LRU прайсов клиник
+    metrics = clinic_registry().metrics()
+    if pricing_repo is not None:
+        metrics["repositories"] = clinic_repositories(pricing_repo).metrics()
+    return metrics
+
+@app.get("/catalog/versions")
+def catalog_versions(x_clinic_id: Optional[str] = Header(None)) -> List[Dict[str, Any]]:
+    return [
+        {"version": entry.version, "valid_from": entry.valid_from.isoformat()}
+        for entry in _clinic_lookup(clinic_history, x_clinic_id).entries
+    ]
+
+def _audit_repo() -> PricingRepository:
+    if pricing_repo is None:
+        raise HTTPException(status_code=404, detail="Price audit is available with PRICING_BACKEND=postgres")
+    return pricing_repo
+
+@app.get("/catalog/runs")
+def catalog_runs(limit: int = 20) -> List[Dict[str, Any]]:
+    return _audit_repo().audit_runs(limit)
+
+@app.get("/catalog/runs/{run_id}")
+def catalog_run_changes(run_id: str) -> List[Dict[str, Any]]:
+    return _audit_repo().run_changes(run_id)
+
+@app.post("/catalog/reload")
+def reload_catalog(x_clinic_id: Optional[str] = Header(None)) -> Dict[str, Any]:
+    # Вызывается пайплайном после публикации снапшота: прогреваем новый прайс до первого запроса
+    autocomplete_for(x_clinic_id)
+    return catalog_info(x_clinic_id)
+
+@app.get("/codes", response_model=List[PriceItem])
+def codes_by_prefix(
+    prefix: str = "",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 200,
+    x_clinic_id: Optional[str] = Header(None),
+):
+    """All codes under a prefix (``/codes?prefix=809``) or within ``start..end``, in code order."""
+    if not prefix and (start is None or end is None):
+        raise HTTPException(status_code=422, detail="Pass prefix or both start and end")
+    repo = clinic_repo(x_clinic_id)
+    if repo is not None:
+        return [_price_item(item) for item in repo.code_range(prefix or None, start, end, limit)]
+    catalog = catalog_for(x_clinic_id)
+    try:
+        low, high = catalog.prefix_slice(prefix)
+        if start is not None and end is not None:
+            range_low, range_high = catalog.range_slice(start, end)
+            low, high = max(low, range_low), min(high, range_high)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Codes must be numeric")
+    return [_price_item(item.to_dict()) for item in catalog.slice_items((low, max(low, high)), limit)]
+
+@app.get("/autocomplete", response_model=List[PriceItem])
+def autocomplete(q: str, limit: int = AUTOCOMPLETE_LIMIT, x_clinic_id: Optional[str] = Header(None)):
+    # Подсказки по мере ввода: индекс в памяти, без модели и Qdrant
+    return [_price_item(item.to_dict()) for item in autocomplete_for(x_clinic_id).suggest(q, min(limit, 50))]
+
 @app.post("/code", response_model=List[PriceItem])
-def search_code(payload: CodeRequest):
-    df = load_items()
-    matches = df.loc[df["code"] == payload.code]
-    if matches.empty:
+def search_code(payload: CodeRequest, x_clinic_id: Optional[str] = Header(None)):
+    item = find_items([payload.code], clinic_id=x_clinic_id).get(payload.code)
+    if item is None:
         raise HTTPException(status_code=404, detail="Code not found")
-    items = [
+    return [_price_item(item)]
+
+@app.get("/code/{code}/similar", response_model=List[PriceItem])
+def similar_to_code(code: str, limit: int = 5, x_clinic_id: Optional[str] = Header(None)):
+    catalog = catalog_for(x_clinic_id)
+    if catalog.get(code) is None:
+        raise HTTPException(status_code=404, detail=f"Code {code} not found")
+    if not is_default_clinic(x_clinic_id):
+        # Таблица соседей строится при загрузке основного прайса — для клиник её нет
+        raise HTTPException(status_code=422, detail="Similar services are available for the default clinic only")
+    # Соседи посчитаны заранее при загрузке прайса — без модели и Qdrant; цены — из каталога клиники
+    neighbours = similar_items(code, limit)
+    rows = catalog.items_for([item["code"] for item in neighbours])
+    return [
         PriceItem(
-            code=row.code,
-            display_name=row.display_name,
-            base_price=float(row.base_price),
-            section=row.section,
+            code=item["code"],
+            display_name=rows[item["code"]]["display_name"],
+            base_price=rows[item["code"]]["base_price"],
+            section=rows[item["code"]]["section"],
+            score=item["score"],
         )
-        for row in matches.itertuples()
+        for item in neighbours
+        if item["code"] in rows
     ]
-    return items
+
+@app.get("/code/{code}/history")
+def code_history(code: str, limit: int = 50) -> List[Dict[str, Any]]:
+    return _audit_repo().price_history(code, limit)
 
 @app.post("/search", response_model=List[PriceItem])
-def search_query(payload: QueryRequest):
+def search_query(payload: QueryRequest, x_clinic_id: Optional[str] = Header(None)):
     vector = model.encode(payload.query)
+    repo = clinic_repo(x_clinic_id)
+    if repo is not None:
+        found = repo.search(payload.query, vector, payload.top_k, **payload.to_kwargs())
+        return [_price_item(item) for item in found]
+    collection = collection_for(x_clinic_id)
     results = client.search(
-        collection_name=COLLECTION,
+        collection_name=collection,
         query_vector=vector,
+        query_filter=payload.to_qdrant(),
         limit=payload.top_k,
+        search_params=quantization_search_params(client, collection),
     )
     items = []
     for point in results:
@@ -111,15 +307,33 @@ def search_query(payload: QueryRequest):
         )
     return items
 
+@app.post("/search/facets", response_model=List[FacetCount])
+def search_facets(payload: FacetRequest, x_clinic_id: Optional[str] = Header(None)):
+    if payload.field not in FACET_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Facets available for: {', '.join(FACET_FIELDS)}")
+    repo = clinic_repo(x_clinic_id)
+    if repo is not None:
+        if payload.field != "section":
+            raise HTTPException(status_code=400, detail="Postgres backend supports facets by section only")
+        counts = repo.section_counts(payload.limit, **payload.to_kwargs())
+        return [FacetCount(value=value, count=count) for value, count in counts]
+    response = client.facet(
+        collection_name=collection_for(x_clinic_id),
+        key=payload.field,
+        facet_filter=payload.to_qdrant(),
+        limit=payload.limit,
+        exact=True,
+    )
+    return [FacetCount(value=str(hit.value), count=hit.count) for hit in response.hits]
+
 @app.post("/plan", response_model=PlanResponse)
-def build_plan(payload: PlanRequest):
-    df = load_items()
+def build_plan(payload: PlanRequest, x_clinic_id: Optional[str] = Header(None)):
+    found = find_items(payload.codes, payload.as_of, x_clinic_id)
     rows = []
     for code in payload.codes:
-        match = df.loc[df["code"] == code]
-        if match.empty:
+        if code not in found:
             raise HTTPException(status_code=404, detail=f"Code {code} not found")
-        rows.append(match.iloc[0])
+        rows.append(found[code])
 
     plan_df = pd.DataFrame(rows)
     plan_df["count"] = 1
@@ -140,7 +354,14 @@ def build_plan(payload: PlanRequest):
         for row in collapsed.itertuples()
     ]
     total = float(collapsed["sum"].sum())
-    return PlanResponse(items=items, total=total)
+    plan = PlanResponse(items=items, total=total).model_dump()
+    return PlanResponse(**reprice_plans([plan], modifier_index(x_clinic_id), payload.as_of)[0])
+
+@app.post("/plans/reprice", response_model=List[PlanResponse])
+def reprice(payload: RepriceRequest, x_clinic_id: Optional[str] = Header(None)):
+    # Один индекс модификаторов на все планы: пересчёт акции без запросов на каждый план
+    modifiers = modifier_index(x_clinic_id)
+    return [PlanResponse(**plan) for plan in reprice_plans(payload.plans, modifiers, payload.as_of)]
 
 @app.post("/agent/draft")
 async def agent_draft(payload: AgentDraftRequest) -> Dict[str, Any]:
@@ -155,10 +376,13 @@ async def agent_draft(payload: AgentDraftRequest) -> Dict[str, Any]:
         "comments": payload.intake,
     }
 
-    result_state = await asyncio.to_thread(compiled_agent.invoke, state)
+    # Узлы графа асинхронные: черновик занимает корутину, а не поток, на всё время ответа LLM
+    result_state = await compiled_agent.ainvoke(state)
 
     return {
         "plan": result_state.get("plan_draft", ""),
         "pricing": result_state.get("pricing", []),
         "validation": result_state.get("validation", []),
+        "timings": result_state.get("timings", {}),
+        "prompt": result_state.get("prompt_stats", {}),
     }
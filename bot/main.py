@@ -4,7 +4,7 @@ import os
 import re
 from contextlib import suppress, contextmanager
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 import aiohttp
 from aiogram import Bot, Dispatcher, F
@@ -26,29 +26,18 @@ from aiogram.types import (
 from faster_whisper import WhisperModel
 
 from .config import BotConfig
+from .plans import combine_plans
 from pdf_generator import generate_pdf
 from db import SessionLocal, Doctor, Patient, Session as DBSession, TreatmentPlan, PlanFeedback
-from scripts.search_price import load_items, search_by_query
-import json
+from db.doctor_cache import DoctorSnapshot, doctor_cache
+from scripts.code_ranges import parse_code_pattern
+from scripts.compact_catalog import load_compact_catalog
+from scripts.retrieval import retrieve, similar_items
 
 AGENT_TIMEOUT_SECONDS = 25.0
+CODE_PATTERN_LIMIT = int(os.getenv("CODE_PATTERN_LIMIT", "30"))
 
 BASE_DIR = Path(os.getenv("DENT_AI_BASE", Path(__file__).resolve().parents[1]))
-ALIASES_PATH = Path(os.getenv("SERVICE_ALIASES_PATH", BASE_DIR / "config" / "service_aliases.json"))
-if ALIASES_PATH.exists():
-    with ALIASES_PATH.open("r", encoding="utf-8") as fh:
-        SERVICE_ALIASES = json.load(fh)
-else:
-    SERVICE_ALIASES = {}
-
-
-def match_aliases(query: str) -> List[str]:
-    query_lower = query.lower()
-    matched_codes = []
-    for alias, codes in SERVICE_ALIASES.items():
-        if alias in query_lower:
-            matched_codes.extend(codes)
-    return matched_codes
 
 
 logging.basicConfig(level=logging.INFO)
@@ -68,8 +57,6 @@ VOICE_MODEL = WhisperModel(VOICE_MODEL_NAME, device=VOICE_DEVICE, compute_type=V
 AUDIO_DIR = Path(os.getenv("VOICE_STORAGE", BASE_DIR / "voice"))
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 
-SEMANTIC_TIMEOUT_SECONDS = float(os.getenv("SEMANTIC_TIMEOUT_SECONDS", "6.0"))
-
 HELP_SNIPPETS = [
     "Планирование синус-лифтинга: 'Открытый синус-лифтинг справа, имплантаты Straumann'",
     "Ортопедия: 'Две коронки e.max, одна коронка металлокерамика на 3.6'",
@@ -168,8 +155,8 @@ def parse_choice_indexes(raw: str) -> List[int]:
     return indexes
 
 
-async def fetch_plan_summary(codes: List[str]) -> dict:
-    payload = {"codes": codes}
+async def fetch_plan_summary(codes: List[str], as_of: Optional[str] = None) -> dict:
+    payload = {"codes": codes, "as_of": as_of}
     timeout = aiohttp.ClientTimeout(total=float(os.getenv("PLAN_API_TIMEOUT", "15")))
     async with aiohttp.ClientSession(timeout=timeout) as session:
         async with session.post(f"{config.api_base_url}/plan", json=payload) as resp:
@@ -181,12 +168,111 @@ async def fetch_plan_summary(codes: List[str]) -> dict:
             return await resp.json()
 
 
+def plan_priced_as_of(plan_id: Optional[int]) -> Optional[str]:
+    """Creation date of an existing plan: its prices come from the catalog version in force then."""
+    if not plan_id:
+        return None
+    with get_db() as db:
+        plan_record = db.get(TreatmentPlan, plan_id)
+        if plan_record is None or plan_record.created_at is None:
+            return None
+        return plan_record.created_at.isoformat()
+
+
+async def reprice_plan(plan: dict, as_of: Optional[str] = None) -> dict:
+    """Apply discounts/surcharges to the merged plan; base prices on API failure."""
+    timeout = aiohttp.ClientTimeout(total=float(os.getenv("PLAN_API_TIMEOUT", "15")))
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.post(f"{config.api_base_url}/plans/reprice", json={"plans": [plan], "as_of": as_of}) as resp:
+                resp.raise_for_status()
+                return (await resp.json())[0]
+    except Exception:
+        logging.exception("Plan repricing failed, keeping base prices")
+        return plan
+
+
+SIMILAR_REQUEST_RE = re.compile(r"^\s*(?:похож\w*|similar)(?:\s+(?:на|to))?\s+(\d+)\s*$", re.IGNORECASE)
+
+
+def parse_similar_request(raw: str, candidates: List[Dict[str, Any]]) -> Optional[str]:
+    """'похожие 809102' -> code, 'похожие 2' -> code of the 2nd shown candidate."""
+    match = SIMILAR_REQUEST_RE.match(raw or "")
+    if not match:
+        return None
+    value = match.group(1)
+    if len(value) == 6:
+        return value
+    idx = int(value) - 1
+    if 0 <= idx < len(candidates):
+        return candidates[idx]["code"]
+    return None
+
+
+def format_candidates(items: List[Dict[str, Any]]) -> str:
+    return "\n".join(
+        f"{idx + 1}. {item['code']} — {item['display_name']} ({item['base_price']} ₽)"
+        for idx, item in enumerate(items)
+    )
+
+
+async def show_similar(message: Message, state: FSMContext, code: str) -> None:
+    # Таблица соседей посчитана при загрузке прайса: без модели и Qdrant, но первое чтение
+    # (и перечитывание после смены прайса) — в потоке, чтобы не останавливать остальные чаты
+    picks = await asyncio.to_thread(similar_items, code, 7)
+    if not picks:
+        await message.answer(f"Для кода {code} нет похожих услуг. Укажи коды или опиши услуги.")
+        return
+    await state.update_data(candidate_codes=picks)
+    await message.answer(
+        f"Похожие на {code}:\n"
+        f"{format_candidates(picks)}\n\nНапиши номера через запятую (например: 1,3).",
+        reply_markup=MAIN_KEYBOARD,
+    )
+    await state.set_state(SessionState.plan_disambiguation)
+
+
+async def show_code_patterns(message: Message, state: FSMContext, prefixes: List[str]) -> None:
+    # «8091xx» / «809*» — выбор из раздела прайса по префиксу кода, без модели и Qdrant
+    picks, total = await asyncio.to_thread(expand_code_patterns, prefixes)
+    patterns = ", ".join(f"{prefix}*" for prefix in prefixes)
+    if not picks:
+        await message.answer(f"В прайсе нет кодов {patterns}. Укажи коды или опиши услуги.")
+        return
+    shown = f" (показаны первые {len(picks)} из {total})" if total > len(picks) else ""
+    await state.update_data(candidate_codes=picks)
+    await message.answer(
+        f"Коды {patterns}{shown}:\n"
+        f"{format_candidates(picks)}\n\nНапиши номера через запятую (например: 1,3).",
+        reply_markup=MAIN_KEYBOARD,
+    )
+    await state.set_state(SessionState.plan_disambiguation)
+
+
 def parse_codes(raw_codes: str) -> List[str]:
     tokens = [token.strip() for token in re.split(r"[\s,;]+", raw_codes) if token.strip()]
     return [token for token in tokens if token.isdigit()]
 
 
-def format_doctor_display(doctor: Doctor) -> str:
+def parse_code_patterns(raw_codes: str) -> List[str]:
+    """'8091xx, 809*' -> ['8091', '809']."""
+    tokens = [token.strip() for token in re.split(r"[\s,;]+", raw_codes) if token.strip()]
+    return [prefix for prefix in map(parse_code_pattern, tokens) if prefix]
+
+
+def expand_code_patterns(prefixes: List[str]) -> Tuple[List[Dict[str, Any]], int]:
+    """Catalog items under the prefixes (at most CODE_PATTERN_LIMIT each) and the total number of matches."""
+    catalog = load_compact_catalog()
+    picks: List[Dict[str, Any]] = []
+    total = 0
+    for prefix in prefixes:
+        low, high = catalog.prefix_slice(prefix)
+        total += high - low
+        picks.extend(item.to_dict() for item in catalog.with_prefix(prefix, CODE_PATTERN_LIMIT))
+    return picks, total
+
+
+def format_doctor_display(doctor: DoctorSnapshot) -> str:
     prefs = doctor.preferences or {}
     return format_doctor_display_obj(
         name=doctor.name,
@@ -219,65 +305,18 @@ def format_doctor_display_obj(
 
 
 async def suggest_codes_from_text(text_query: str) -> List[Dict[str, Any]]:
-    alias_codes = match_aliases(text_query)
-    results: List[Dict[str, Any]] = []
-    if alias_codes:
-        df = load_items_cached()
-        for code in alias_codes:
-            row = df.get(code)
-            if row:
-                results.append(row)
-    if results:
-        return results
-
-    loop = asyncio.get_running_loop()
-
-    def _search():
-        return search_by_query(text_query, top_k=7)
-
-    try:
-        results = await asyncio.wait_for(loop.run_in_executor(None, _search), timeout=SEMANTIC_TIMEOUT_SECONDS)
-    except asyncio.TimeoutError as timeout_err:
-        logging.error("Semantic search timed out for query '%s'", text_query)
-        raise SemanticSearchUnavailable("semantic timeout") from timeout_err
-    except Exception as exc:
-        logging.exception("Semantic search failed for query: %s", text_query)
-        raise SemanticSearchUnavailable("semantic failure") from exc
-
-    seen_codes = set()
-    suggestions: List[Dict[str, Any]] = []
-    for point in results:
-        payload = point.payload or {}
-        code = str(payload.get("code", "")).strip()
-        if not code or code in seen_codes:
-            continue
-        seen_codes.add(code)
-        suggestions.append(
-            {
-                "code": code,
-                "display_name": payload.get("display_name", ""),
-                "base_price": payload.get("base_price", 0),
-                "section": payload.get("section", ""),
-                "score": point.score,
-            }
-        )
-    return suggestions
-
-
-def load_items_cached() -> Dict[str, Dict[str, Any]]:
-    if not hasattr(load_items_cached, "_cache"):
-        df = load_items()
-        cache = {}
-        for row in df.itertuples():
-            cache[str(row.code)] = {
-                "code": str(row.code),
-                "display_name": row.display_name,
-                "base_price": float(row.base_price),
-                "section": row.section,
-                "score": None,
-            }
-        load_items_cached._cache = cache
-    return load_items_cached._cache
+    result = await asyncio.to_thread(retrieve, text_query, 7)
+    logging.info(
+        "Retrieval for '%s' served by %s stage (confidence %.2f, %.0f ms, degraded=%s)",
+        text_query,
+        result.stage,
+        result.confidence,
+        result.elapsed * 1000,
+        result.degraded,
+    )
+    if not result.items and result.error:
+        raise SemanticSearchUnavailable(result.error)
+    return result.items
 
 
 async def process_codes(message: Message, state: FSMContext, codes: List[str]) -> None:
@@ -285,9 +324,13 @@ async def process_codes(message: Message, state: FSMContext, codes: List[str]) -
     existing_codes: List[str] = data.get("codes", [])
     all_codes = existing_codes + codes
 
+    session_id = data.get("db_session_id")
+    plan_id = data.get("plan_id")
+    as_of = plan_priced_as_of(plan_id)
+
     await message.answer("⚙️ Считаю суммы по прайсу...", reply_markup=MAIN_KEYBOARD)
     try:
-        new_plan = await fetch_plan_summary(codes)
+        new_plan = await fetch_plan_summary(codes, as_of)
     except ValueError as err:
         await message.answer(f"⚠️ {err}. Уточни услуги или выбери другие позиции.")
         return
@@ -296,9 +339,7 @@ async def process_codes(message: Message, state: FSMContext, codes: List[str]) -
         await message.answer(f"Не удалось получить план: {exc}. Повтори или измени коды.")
         return
 
-    session_id = data.get("db_session_id")
-    plan_id = data.get("plan_id")
-    combined_plan = combine_plans(data.get("plan"), new_plan, all_codes)
+    combined_plan = await reprice_plan(combine_plans(data.get("plan"), new_plan, all_codes), as_of)
 
     with get_db() as db:
         session_record = db.get(DBSession, session_id) if session_id else None
@@ -422,57 +463,6 @@ async def finalize_current_plan(message: Message, state: FSMContext) -> None:
     await state.set_state(SessionState.patient)
 
 
-def combine_plans(existing: Optional[dict], new_part: dict, order_sequence: List[str]) -> dict:
-    existing_items = (existing or {}).get("items", [])
-    new_items = new_part.get("items", [])
-    merged: Dict[str, Dict[str, Any]] = {}
-
-    def add_item(item: Dict[str, Any]) -> None:
-        code = item.get("code")
-        if not code:
-            return
-        entry = merged.setdefault(
-            code,
-            {
-                "code": code,
-                "display_name": item.get("display_name", ""),
-                "section": item.get("section", ""),
-                "base_price": float(item.get("base_price", 0)),
-                "count": 0,
-            },
-        )
-        entry["count"] += int(item.get("count", 0))
-
-    for item in existing_items:
-        add_item(item)
-    for item in new_items:
-        add_item(item)
-
-    order_index: Dict[str, int] = {}
-    for idx, code in enumerate(order_sequence):
-        if code not in order_index:
-            order_index[code] = idx
-
-    items = []
-    total = 0.0
-    for entry in merged.values():
-        entry_sum = entry["base_price"] * entry["count"]
-        total += entry_sum
-        entry_dict = {
-            "code": entry["code"],
-            "display_name": entry["display_name"],
-            "section": entry["section"],
-            "base_price": entry["base_price"],
-            "count": entry["count"],
-            "sum": entry_sum,
-        }
-        items.append(entry_dict)
-
-    items.sort(key=lambda item: order_index.get(item["code"], len(order_index)))
-
-    return {"items": items, "total": total}
-
-
 def format_plan(plan: dict) -> str:
     lines = []
     for item in plan.get("items", []):
@@ -481,8 +471,12 @@ def format_plan(plan: dict) -> str:
         count = item.get("count", 1)
         item_sum = item.get("sum", 0)
         lines.append(f"• {code}: {name} × {count} → {item_sum} ₽")
+        for adjustment in item.get("adjustments", []):
+            lines.append(f"   {adjustment['label']}: {adjustment['amount']:+.2f} ₽")
     total = plan.get("total", 0)
     body = "\n".join(lines) if lines else "(пусто)"
+    if plan.get("adjustments_total"):
+        return f"{body}\n\nПо базовым ценам: {plan.get('base_total', 0)} ₽\nИтого: {total} ₽"
     return f"{body}\n\nИтого: {total} ₽"
 
 async def call_agent_draft(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -531,8 +525,7 @@ def format_agent_feedback(agent_result: Dict[str, Any]) -> str:
 async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
     telegram_id = str(message.from_user.id)
-    with get_db() as db:
-        doctor = db.query(Doctor).filter_by(telegram_id=telegram_id).one_or_none()
+    doctor = await doctor_cache().aget_by_telegram(telegram_id)
 
     await state.clear()
 
@@ -576,6 +569,7 @@ async def handle_doctor_name(message: Message, state: FSMContext):
             db.add(doctor)
         db.commit()
         doctor_id = doctor.id
+    doctor_cache().invalidate(doctor_id, telegram_id)
 
     await state.update_data(doctor=doctor_name, doctor_id=doctor_id)
     await message.answer("Укажи специализацию (например: стоматолог-ортопед).", reply_markup=MAIN_KEYBOARD)
@@ -631,6 +625,7 @@ async def handle_experience(message: Message, state: FSMContext):
             )
             doctor.experience_years = experience
             db.commit()
+    doctor_cache().invalidate(data["doctor_id"], telegram_id)
 
     display = format_doctor_display_obj(
         name=data["doctor"],
@@ -696,6 +691,14 @@ async def handle_intake(message: Message, state: FSMContext):
 @dp.message(SessionState.plan_codes)
 async def handle_plan_codes(message: Message, state: FSMContext):
     raw = message.text.strip()
+    similar_to = parse_similar_request(raw, [])
+    if similar_to:
+        await show_similar(message, state, similar_to)
+        return
+    prefixes = parse_code_patterns(raw)
+    if prefixes:
+        await show_code_patterns(message, state, prefixes)
+        return
     codes = parse_codes(raw)
 
     if not codes:
@@ -712,13 +715,10 @@ async def handle_plan_codes(message: Message, state: FSMContext):
             await message.answer("Не смог найти совпадения. Попробуй уточнить формулировку или указать код.")
             return
         await state.update_data(candidate_codes=picks, raw_text=raw)
-        options = "\n".join(
-            f"{idx + 1}. {item['code']} — {item['display_name']} ({item['base_price']} ₽)"
-            for idx, item in enumerate(picks)
-        )
         await message.answer(
             "Нашёл подходящие позиции:\n"
-            f"{options}\n\nНапиши номера через запятую (например: 1,3).",
+            f"{format_candidates(picks)}\n\nНапиши номера через запятую (например: 1,3). "
+            "«похожие 2» — соседние варианты позиции 2.",
             reply_markup=MAIN_KEYBOARD,
         )
         await state.set_state(SessionState.plan_disambiguation)
@@ -736,6 +736,11 @@ async def handle_plan_disambiguation(message: Message, state: FSMContext):
         await state.set_state(SessionState.plan_codes)
         return
 
+    similar_to = parse_similar_request(message.text, candidates)
+    if similar_to:
+        await show_similar(message, state, similar_to)
+        return
+
     indexes = parse_choice_indexes(message.text)
     if not indexes:
         await message.answer("Не понял выбор. Укажи номера через запятую, например 1,2.")
@@ -843,6 +848,8 @@ async def handle_feedback_comment(message: Message, state: FSMContext):
         if plan:
             plan.status = "final" if accepted else "needs_changes"
         db.commit()
+    # Новый отзыв попадает в контекст агента для следующего плана
+    doctor_cache().invalidate(doctor_id)
 
     await state.update_data(feedback_rating=None)
     await state.set_state(SessionState.plan_confirm)
@@ -872,6 +879,7 @@ async def update_profile(message: Message, state: FSMContext):
             doctor.experience_years = None
             doctor.preferences = {}
             db.commit()
+    doctor_cache().invalidate(telegram_id=telegram_id)
     await message.answer("Обновим профиль. Введи ФИО полностью.", reply_markup=MAIN_KEYBOARD)
     await state.set_state(SessionState.doctor_name)
 
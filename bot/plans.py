@@ -0,0 +1,54 @@
+"""Plan arithmetic shared by the bot and the benchmarks; no bot or model setup on import."""
+
+from typing import Any, Dict, List, Optional
+
+
+def combine_plans(existing: Optional[dict], new_part: dict, order_sequence: List[str]) -> dict:
+    existing_items = (existing or {}).get("items", [])
+    new_items = new_part.get("items", [])
+    merged: Dict[str, Dict[str, Any]] = {}
+
+    def add_item(item: Dict[str, Any]) -> None:
+        code = item.get("code")
+        if not code:
+            return
+        entry = merged.setdefault(
+            code,
+            {
+                "code": code,
+                "display_name": item.get("display_name", ""),
+                "section": item.get("section", ""),
+                "base_price": float(item.get("base_price", 0)),
+                "count": 0,
+            },
+        )
+        entry["count"] += int(item.get("count", 0))
+
+    for item in existing_items:
+        add_item(item)
+    for item in new_items:
+        add_item(item)
+
+    order_index: Dict[str, int] = {}
+    for idx, code in enumerate(order_sequence):
+        if code not in order_index:
+            order_index[code] = idx
+
+    items = []
+    total = 0.0
+    for entry in merged.values():
+        entry_sum = entry["base_price"] * entry["count"]
+        total += entry_sum
+        entry_dict = {
+            "code": entry["code"],
+            "display_name": entry["display_name"],
+            "section": entry["section"],
+            "base_price": entry["base_price"],
+            "count": entry["count"],
+            "sum": entry_sum,
+        }
+        items.append(entry_dict)
+
+    items.sort(key=lambda item: order_index.get(item["code"], len(order_index)))
+
+    return {"items": items, "total": total}
@@ -120,6 +120,16 @@ class PlanFeedback(Base):
     plan = relationship("TreatmentPlan", back_populates="feedback")
     doctor = relationship("Doctor", back_populates="feedback")
 
+
+class CacheVersion(Base):
+    """Shared change counter: processes drop their in-memory caches when it moves."""
+
+    __tablename__ = "cache_versions"
+
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 def init_db():
     Base.metadata.create_all(bind=engine)
     if engine.dialect.name == "sqlite":
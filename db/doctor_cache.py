@@ -0,0 +1,266 @@
+"""Read-through cache of doctor profiles and recent plan feedback.
+
+The agent reads a doctor's profile and last feedback on every draft and the
+bot looks the doctor up by Telegram id on every ``/start``; both change only
+when the bot writes them. Entries are cached per doctor id with name and
+Telegram id pointing at them. Writers call ``invalidate`` after commit: it
+drops the local entries and bumps the shared ``cache_versions`` row, which
+other processes (the API next to the bot) poll at most every
+``DOCTOR_CACHE_VERSION_CHECK_SECONDS`` before clearing their copies.
+``version`` is that shared counter, for caches derived from doctor data.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import CacheVersion, Doctor, DoctorProfile, PlanFeedback, SessionLocal, TreatmentPlan
+
+DOCTOR_CACHE_TTL_SECONDS = float(os.getenv("DOCTOR_CACHE_TTL_SECONDS", "300"))
+DOCTOR_CACHE_VERSION_CHECK_SECONDS = float(os.getenv("DOCTOR_CACHE_VERSION_CHECK_SECONDS", "2"))
+FEEDBACK_LIMIT = 5
+CACHE_NAME = "doctors"
+
+_cache: Optional["DoctorCache"] = None
+
+
+@dataclass(frozen=True)
+class DoctorSnapshot:
+    id: int
+    name: str
+    telegram_id: Optional[str]
+    specialization: Optional[str]
+    experience_years: Optional[float]
+    preferences: Dict[str, Any] = field(default_factory=dict)
+    profile: Optional[Dict[str, Any]] = None
+    feedback: Tuple[Dict[str, Any], ...] = ()
+
+    def profile_payload(self) -> Dict[str, Any]:
+        """The doctor_profile dict the agent passes to the LLM prompt."""
+        payload: Dict[str, Any] = {
+            "specialization": self.specialization,
+            "experience_years": self.experience_years,
+            "preferences": dict(self.preferences),
+        }
+        if self.profile:
+            payload.update(self.profile)
+        return payload
+
+    def feedback_payload(self) -> List[Dict[str, Any]]:
+        return [dict(item) for item in self.feedback]
+
+
+def load_snapshot(session: Any, doctor: Doctor) -> DoctorSnapshot:
+    profile: Optional[DoctorProfile] = (
+        session.query(DoctorProfile)
+        .filter(DoctorProfile.doctor_id == doctor.id)
+        .order_by(DoctorProfile.updated_at.desc())
+        .first()
+    )
+    feedback: List[PlanFeedback] = (
+        session.query(PlanFeedback)
+        .join(TreatmentPlan, PlanFeedback.plan_id == TreatmentPlan.id)
+        .filter(PlanFeedback.doctor_id == doctor.id)
+        .order_by(PlanFeedback.created_at.desc())
+        .limit(FEEDBACK_LIMIT)
+        .all()
+    )
+    return DoctorSnapshot(
+        id=doctor.id,
+        name=doctor.name,
+        telegram_id=doctor.telegram_id,
+        specialization=doctor.specialization,
+        experience_years=doctor.experience_years,
+        preferences=dict(doctor.preferences or {}),
+        profile=(
+            {
+                "profile_name": profile.profile_name,
+                "llm_prompt": profile.llm_prompt,
+                "pricing_bias": profile.pricing_bias or {},
+                "protocol_overrides": profile.protocol_overrides or {},
+            }
+            if profile
+            else None
+        ),
+        feedback=tuple(
+            {"rating": fb.rating, "accepted": fb.accepted, "comments": fb.comments, "diff": fb.diff_json}
+            for fb in feedback
+        ),
+    )
+
+
+class DoctorCache:
+    """doctor id -> DoctorSnapshot, with name and Telegram id lookups on top."""
+
+    def __init__(
+        self,
+        ttl: float = DOCTOR_CACHE_TTL_SECONDS,
+        version_check: float = DOCTOR_CACHE_VERSION_CHECK_SECONDS,
+    ):
+        self.ttl = ttl
+        self.version_check = version_check
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, Tuple[float, DoctorSnapshot]] = {}
+        self._ids_by_name: Dict[str, int] = {}
+        self._ids_by_telegram: Dict[str, int] = {}
+        self._version = 0
+        self._checked_at = 0.0
+        # Растёт при каждом invalidate/clear: снапшот, прочитанный до сброса, не кэшируем
+        self._generation = 0
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def version(self) -> int:
+        self._sync_version()
+        return self._version
+
+    def get_by_id(self, doctor_id: int) -> Optional[DoctorSnapshot]:
+        return self._lookup(self._cached(doctor_id), lambda session: session.get(Doctor, doctor_id))
+
+    def get_by_name(self, name: str) -> Optional[DoctorSnapshot]:
+        return self._lookup(
+            self._cached(self._ids_by_name.get(name)),
+            lambda session: session.query(Doctor).filter(Doctor.name == name).first(),
+        )
+
+    def get_by_telegram(self, telegram_id: str) -> Optional[DoctorSnapshot]:
+        return self._lookup(
+            self._cached(self._ids_by_telegram.get(telegram_id)),
+            lambda session: session.query(Doctor).filter_by(telegram_id=telegram_id).one_or_none(),
+        )
+
+    async def aget_by_name(self, name: str) -> Optional[DoctorSnapshot]:
+        """get_by_name for the event loop: hits stay on the loop, DB reads go to a worker thread."""
+        return await self._aget(self._ids_by_name.get(name), self.get_by_name, name)
+
+    async def aget_by_telegram(self, telegram_id: str) -> Optional[DoctorSnapshot]:
+        """get_by_telegram for the event loop, like ``aget_by_name``."""
+        return await self._aget(self._ids_by_telegram.get(telegram_id), self.get_by_telegram, telegram_id)
+
+    async def _aget(self, doctor_id: Optional[int], get: Any, key: str) -> Optional[DoctorSnapshot]:
+        # Сверка версии и промах — запросы к БД, их выполняем в потоке
+        if not self._version_due():
+            cached = self._cached(doctor_id)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
+        return await asyncio.to_thread(get, key)
+
+    def _version_due(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.version_check
+
+    def _cached(self, doctor_id: Optional[int]) -> Optional[DoctorSnapshot]:
+        self._sync_version()
+        if doctor_id is None:
+            return None
+        with self._lock:
+            entry = self._by_id.get(doctor_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def _lookup(self, cached: Optional[DoctorSnapshot], query: Any) -> Optional[DoctorSnapshot]:
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        self.stats["misses"] += 1
+        with self._lock:
+            generation = self._generation
+        # Отсутствующих врачей не кэшируем: после регистрации они должны находиться сразу
+        with SessionLocal() as session:
+            doctor = query(session)
+            if doctor is None:
+                return None
+            snapshot = load_snapshot(session, doctor)
+        with self._lock:
+            if generation != self._generation:
+                # Пока шёл запрос, бот записал изменения — отдаём прочитанное, но не кэшируем на весь TTL
+                return snapshot
+            self._by_id[snapshot.id] = (time.monotonic(), snapshot)
+            self._ids_by_name[snapshot.name] = snapshot.id
+            if snapshot.telegram_id:
+                self._ids_by_telegram[snapshot.telegram_id] = snapshot.id
+        return snapshot
+
+    def invalidate(self, doctor_id: Optional[int] = None, telegram_id: Optional[str] = None) -> None:
+        """Drop the doctor's entries here and signal other processes; call after the write is committed."""
+        with self._lock:
+            if doctor_id is None and telegram_id is not None:
+                doctor_id = self._ids_by_telegram.get(telegram_id)
+            self._forget(doctor_id)
+            self._generation += 1
+            self.stats["invalidations"] += 1
+        version = self._bump_shared_version()
+        if version is not None:
+            with self._lock:
+                # Свои изменения уже учтены — не сбрасываем весь кэш при следующей сверке
+                if version == self._version + 1:
+                    self._version = version
+                    self._checked_at = time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._by_id.clear()
+            self._ids_by_name.clear()
+            self._ids_by_telegram.clear()
+
+    def _forget(self, doctor_id: Optional[int]) -> None:
+        if doctor_id is None:
+            return
+        entry = self._by_id.pop(doctor_id, None)
+        self._ids_by_name = {name: id_ for name, id_ in self._ids_by_name.items() if id_ != doctor_id}
+        self._ids_by_telegram = {tg: id_ for tg, id_ in self._ids_by_telegram.items() if id_ != doctor_id}
+        if entry is not None:
+            logging.debug("Doctor %s dropped from cache", doctor_id)
+
+    def _sync_version(self) -> None:
+        if not self._version_due():
+            return
+        self._checked_at = time.monotonic()
+        version = self._read_shared_version()
+        if version is None or version == self._version:
+            return
+        with self._lock:
+            self._version = version
+        self.clear()
+
+    def _read_shared_version(self) -> Optional[int]:
+        try:
+            with SessionLocal() as session:
+                row = session.get(CacheVersion, CACHE_NAME)
+                return row.version if row is not None else 0
+        except SQLAlchemyError:
+            # Нет таблицы (миграции не применены) — остаётся только TTL
+            logging.warning("cache_versions is unavailable, doctor cache relies on TTL only")
+            return None
+
+    def _bump_shared_version(self) -> Optional[int]:
+        try:
+            with SessionLocal() as session:
+                bumped = session.execute(
+                    update(CacheVersion)
+                    .where(CacheVersion.name == CACHE_NAME)
+                    .values(version=CacheVersion.version + 1)
+                )
+                if bumped.rowcount == 0:
+                    session.add(CacheVersion(name=CACHE_NAME, version=1))
+                session.commit()
+                return session.get(CacheVersion, CACHE_NAME).version
+        except SQLAlchemyError:
+            logging.warning("cache_versions is unavailable, other processes see doctor changes after TTL")
+            return None
+
+
+def doctor_cache() -> DoctorCache:
+    global _cache
+    if _cache is None:
+        _cache = DoctorCache()
+    return _cache
@@ -0,0 +1,194 @@
+"""Discount/surcharge engine over ``pricing.price_modifier``.
+
+Modifiers are loaded once into an item -> validity-interval index;
+plans are then priced in memory, so re-pricing every stored plan after a
+promotion costs one modifier query and one plan query in total.
+
+Supported ``condition`` keys (all must hold; unknown keys disable the modifier):
+
+* ``min_count`` — the line has at least this many units;
+* ``min_plan_total`` — the plan total at base prices is at least this amount;
+* ``requires_codes`` — every listed code is present in the plan.
+"""
+
+import argparse
+import logging
+import sys
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+CENT = Decimal("0.01")
+HUNDRED = Decimal("100")
+KNOWN_CONDITIONS = frozenset({"min_count", "min_plan_total", "requires_codes"})
+
+
+def _utc(value: Optional[datetime]) -> datetime:
+    if value is None:
+        return datetime.now(timezone.utc)
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _money(value: Any) -> Decimal:
+    return Decimal(str(value or 0)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+@dataclass(frozen=True)
+class PriceModifier:
+    code: str
+    modifier_type: str
+    label: str
+    value: Decimal
+    is_percentage: bool
+    valid_from: datetime
+    valid_to: Optional[datetime] = None
+    condition: Dict[str, Any] = field(default_factory=dict)
+
+    def active_at(self, at: datetime) -> bool:
+        return self.valid_from <= at and (self.valid_to is None or at < self.valid_to)
+
+    def applies(self, count: int, plan_codes: Set[str], plan_base_total: Decimal) -> bool:
+        condition = self.condition or {}
+        if set(condition) - KNOWN_CONDITIONS:
+            return False
+        if count < int(condition.get("min_count", 0)):
+            return False
+        if plan_base_total < Decimal(str(condition.get("min_plan_total", 0))):
+            return False
+        return set(condition.get("requires_codes", [])) <= plan_codes
+
+    def amount(self, base_price: Decimal, count: int) -> Decimal:
+        """Signed adjustment for a line: negative for discounts."""
+        if self.is_percentage:
+            amount = base_price * count * self.value / HUNDRED
+        else:
+            amount = self.value * count
+        amount = _money(amount)
+        return -amount if self.modifier_type == "discount" else amount
+
+
+class ModifierIndex:
+    """code -> modifiers sorted by ``valid_from``; lookups bisect on the start of the window."""
+
+    def __init__(self, modifiers: Iterable[PriceModifier] = ()):
+        grouped: Dict[str, List[PriceModifier]] = {}
+        for modifier in modifiers:
+            grouped.setdefault(modifier.code, []).append(modifier)
+        self._starts: Dict[str, List[datetime]] = {}
+        self._modifiers: Dict[str, List[PriceModifier]] = {}
+        for code, items in grouped.items():
+            items.sort(key=lambda item: item.valid_from)
+            self._starts[code] = [item.valid_from for item in items]
+            self._modifiers[code] = items
+        self.size = sum(len(items) for items in self._modifiers.values())
+        self._warned: Set[Tuple[str, str]] = set()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def active(self, code: str, at: datetime) -> List[PriceModifier]:
+        starts = self._starts.get(code)
+        if not starts:
+            return []
+        started = self._modifiers[code][: bisect_right(starts, at)]
+        active = [modifier for modifier in started if modifier.active_at(at)]
+        for modifier in active:
+            unknown = set(modifier.condition or {}) - KNOWN_CONDITIONS
+            if unknown and (code, modifier.label) not in self._warned:
+                self._warned.add((code, modifier.label))
+                logging.warning("Modifier %r for %s skipped: unknown conditions %s", modifier.label, code, sorted(unknown))
+        return active
+
+
+def evaluate_plan(plan: Dict[str, Any], index: ModifierIndex, at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Return a copy of ``plan`` with per-line adjustments, adjusted sums and totals."""
+    at = _utc(at)
+    lines = [item for item in plan.get("items", []) if item.get("code")]
+    plan_codes = {str(item["code"]) for item in lines}
+    base_sums = [_money(item.get("base_price")) * int(item.get("count", 1)) for item in lines]
+    plan_base_total = sum(base_sums, Decimal("0"))
+
+    items: List[Dict[str, Any]] = []
+    total = Decimal("0")
+    for item, base_sum in zip(lines, base_sums):
+        code = str(item["code"])
+        count = int(item.get("count", 1))
+        base_price = _money(item.get("base_price"))
+        adjustments = [
+            {"label": modifier.label, "type": modifier.modifier_type, "amount": modifier.amount(base_price, count)}
+            for modifier in index.active(code, at)
+            if modifier.applies(count, plan_codes, plan_base_total)
+        ]
+        line_sum = max(base_sum + sum((adj["amount"] for adj in adjustments), Decimal("0")), Decimal("0"))
+        total += line_sum
+        items.append(
+            {
+                **item,
+                "base_price": float(base_price),
+                "count": count,
+                "base_sum": float(base_sum),
+                "adjustments": [{**adj, "amount": float(adj["amount"])} for adj in adjustments],
+                "sum": float(line_sum),
+            }
+        )
+
+    return {
+        **plan,
+        "items": items,
+        "base_total": float(plan_base_total),
+        "adjustments_total": float(total - plan_base_total),
+        "total": float(total),
+        "priced_at": at.isoformat(timespec="seconds"),
+    }
+
+
+def reprice_plans(
+    plans: Sequence[Dict[str, Any]],
+    index: ModifierIndex,
+    at: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """Price many plans against the same index and moment in time."""
+    at = _utc(at)
+    return [evaluate_plan(plan, index, at) for plan in plans]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Пересчёт сохранённых планов со скидками и наценками")
+    parser.add_argument("--status", default="draft", help="Статус планов для пересчёта (all — все)")
+    parser.add_argument("--catalog", help="slug каталога (по умолчанию PRICING_CATALOG_SLUG)")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать изменения итогов")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from db import SessionLocal, TreatmentPlan
+    from db.pricing import PRICING_CATALOG_SLUG, PricingRepository
+
+    args = build_parser().parse_args(argv)
+    index = PricingRepository(catalog=args.catalog or PRICING_CATALOG_SLUG).load_modifiers()
+    at = datetime.now(timezone.utc)
+
+    with SessionLocal() as db:
+        query = db.query(TreatmentPlan)
+        if args.status != "all":
+            query = query.filter(TreatmentPlan.status == args.status)
+        records = query.all()
+        repriced = reprice_plans([record.plan_json or {} for record in records], index, at)
+        changed = 0
+        for record, plan in zip(records, repriced):
+            before = float((record.plan_json or {}).get("total", 0) or 0)
+            if abs(before - plan["total"]) >= 0.005:
+                changed += 1
+                print(f"План {record.id}: {before:.2f} → {plan['total']:.2f} ₽")
+            if not args.dry_run:
+                record.plan_json = plan
+        if not args.dry_run:
+            db.commit()
+
+    print(f"Модификаторов: {len(index)}; планов: {len(records)}, изменился итог: {changed}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,561 @@
+"""Repository over the ``pricing`` schema (Postgres + pgvector).
+
+Every read is a single SQL statement: code lookup, full-text search, vector
+search and the hybrid of both (reciprocal rank fusion done inside Postgres).
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from db.price_modifiers import ModifierIndex, PriceModifier
+
+PRICING_DATABASE_URL = os.getenv("PRICING_DATABASE_URL") or os.getenv("DATABASE_URL", "")
+PRICING_CATALOG_SLUG = os.getenv("PRICING_CATALOG_SLUG", "main")
+SCHEMA_PATH = Path(__file__).with_name("pricing_schema.sql")
+# Сколько кандидатов берёт каждая ветка гибридного поиска и константа RRF
+HYBRID_CANDIDATES = 50
+RRF_K = 60
+# Как долго держать индекс скидок/наценок в памяти процесса
+PRICE_MODIFIER_TTL_SECONDS = float(os.getenv("PRICE_MODIFIER_TTL_SECONDS", "60"))
+AUDIT_CHANGED_BY = os.getenv("PRICING_AUDIT_USER", "pricing-ingest")
+
+_ITEM_COLUMNS = """
+    i.external_code as code,
+    i.name as display_name,
+    i.base_price,
+    coalesce(c.name, '') as section
+"""
+_ITEM_JOINS = """
+    join pricing.price_catalog pc on pc.id = i.catalog_id
+    left join pricing.price_category c on c.id = i.category_id
+"""
+_ACTIVE = "pc.slug = :catalog and not pc.archived and not i.archived"
+# Цена на дату: последнее событие аудита позиции до as_of (payload create/archive — плоский, update — before/after)
+_ITEMS_AS_OF_SQL = """
+    select i.external_code as code,
+           coalesce(a.payload->'after'->>'display_name', a.payload->>'display_name', i.name) as display_name,
+           coalesce(cast(coalesce(a.payload->'after'->>'base_price', a.payload->>'base_price') as numeric), i.base_price)
+               as base_price,
+           coalesce(a.payload->'after'->>'section', a.payload->>'section', c.name, '') as section
+    from pricing.price_item i
+    join pricing.price_catalog pc on pc.id = i.catalog_id
+    left join pricing.price_category c on c.id = i.category_id
+    left join lateral (
+        select change_type, payload from pricing.price_audit
+        where item_id = i.id and changed_at <= :as_of
+        order by changed_at desc, id desc
+        limit 1
+    ) a on true
+    where pc.slug = :catalog and not pc.archived
+      and pc.valid_from <= :as_of and :as_of < coalesce(pc.valid_to, 'infinity')
+      and i.external_code = any(cast(:codes as text[]))
+      and (a.change_type in ('create', 'update') or (a.change_type is null and i.created_at <= :as_of and not i.archived))
+"""
+
+
+def vector_literal(vector: Sequence[float]) -> str:
+    return "[" + ",".join(f"{float(value):.7g}" for value in vector) + "]"
+
+
+def filter_sql(
+    sections: Optional[Sequence[str]] = None,
+    code_prefix: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """Extra ``and ...`` clauses for the same filters /search accepts for Qdrant."""
+    clauses: List[str] = []
+    params: Dict[str, Any] = {}
+    if sections:
+        clauses.append("c.name = any(cast(:sections as text[]))")
+        params["sections"] = list(sections)
+    if code_prefix:
+        clauses.append("i.external_code like :code_prefix")
+        params["code_prefix"] = code_prefix.replace("%", "").replace("_", "") + "%"
+    if min_price is not None:
+        clauses.append("i.base_price >= :min_price")
+        params["min_price"] = min_price
+    if max_price is not None:
+        clauses.append("i.base_price <= :max_price")
+        params["max_price"] = max_price
+    return "".join(f" and {clause}" for clause in clauses), params
+
+
+def _row(mapping: Any, score: Optional[float] = None) -> Dict[str, Any]:
+    return {
+        "code": mapping["code"],
+        "display_name": mapping["display_name"],
+        "base_price": float(mapping["base_price"]),
+        "section": mapping["section"],
+        "score": score if score is not None else mapping.get("score"),
+    }
+
+
+class PricingRepository:
+    """Read/write access to one price catalog (``pricing.price_catalog.slug``)."""
+
+    def __init__(self, engine: Optional[Engine] = None, catalog: str = PRICING_CATALOG_SLUG):
+        if engine is None:
+            if not PRICING_DATABASE_URL.startswith("postgresql"):
+                raise RuntimeError("PRICING_DATABASE_URL должен указывать на Postgres с pgvector")
+            engine = create_engine(PRICING_DATABASE_URL, pool_pre_ping=True, future=True)
+        self.engine = engine
+        self.catalog = catalog
+        self._modifiers: Optional[Tuple[float, ModifierIndex]] = None
+
+    def apply_schema(self, path: Path = SCHEMA_PATH) -> None:
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(path.read_text(encoding="utf-8"))
+
+    def get_items(self, codes: Sequence[str], as_of: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """code -> item for all requested codes that exist, in one query.
+
+        With ``as_of`` the catalog must be valid at that moment
+        (``valid_from <= as_of < valid_to``) and every item is priced by its
+        latest audit event up to ``as_of``; items archived by then are absent.
+        Items without audit events before ``as_of`` (loaded before auditing)
+        keep their current row if they already existed.
+        """
+        unique = list(dict.fromkeys(codes))
+        if not unique:
+            return {}
+        if as_of is None:
+            sql = text(
+                f"select {_ITEM_COLUMNS} from pricing.price_item i {_ITEM_JOINS} "
+                f"where {_ACTIVE} and i.external_code = any(cast(:codes as text[]))"
+            )
+        else:
+            sql = text(_ITEMS_AS_OF_SQL)
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, {"catalog": self.catalog, "codes": unique, "as_of": as_of}).mappings()
+            return {row["code"]: _row(row) for row in rows}
+
+    def code_range(
+        self,
+        prefix: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Items by code prefix and/or inclusive code range, in code order (index range scan)."""
+        where, params = filter_sql(code_prefix=prefix)
+        if start is not None:
+            where += " and i.external_code >= :start"
+            params["start"] = start
+        if end is not None:
+            where += " and i.external_code <= :end"
+            params["end"] = end
+        sql = text(
+            f"select {_ITEM_COLUMNS} from pricing.price_item i {_ITEM_JOINS} "
+            f"where {_ACTIVE}{where} order by i.external_code limit :limit"
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, {"catalog": self.catalog, "limit": limit, **params})
+            return [_row(row) for row in rows.mappings()]
+
+    def search_text(self, query: str, limit: int = 5, **filters: Any) -> List[Dict[str, Any]]:
+        where, params = filter_sql(**filters)
+        sql = text(
+            f"select {_ITEM_COLUMNS}, ts_rank_cd(i.search_vector, q) as score "
+            f"from pricing.price_item i {_ITEM_JOINS}, websearch_to_tsquery('russian', :query) q "
+            f"where {_ACTIVE} and i.search_vector @@ q{where} "
+            "order by score desc limit :limit"
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, {"catalog": self.catalog, "query": query, "limit": limit, **params})
+            return [_row(row) for row in rows.mappings()]
+
+    def search_vector(self, embedding: Sequence[float], limit: int = 5, **filters: Any) -> List[Dict[str, Any]]:
+        where, params = filter_sql(**filters)
+        sql = text(
+            f"select {_ITEM_COLUMNS}, 1 - (i.embeddings <=> cast(:embedding as vector)) as score "
+            f"from pricing.price_item i {_ITEM_JOINS} "
+            f"where {_ACTIVE} and i.embeddings is not null{where} "
+            "order by i.embeddings <=> cast(:embedding as vector) limit :limit"
+        )
+        values = {"catalog": self.catalog, "embedding": vector_literal(embedding), "limit": limit, **params}
+        with self.engine.connect() as conn:
+            return [_row(row) for row in conn.execute(sql, values).mappings()]
+
+    def search(
+        self,
+        query: str,
+        embedding: Optional[Sequence[float]] = None,
+        limit: int = 5,
+        **filters: Any,
+    ) -> List[Dict[str, Any]]:
+        """Hybrid full-text + vector search fused with RRF in a single statement."""
+        if embedding is None:
+            return self.search_text(query, limit, **filters)
+        where, params = filter_sql(**filters)
+        candidates = f"from pricing.price_item i {_ITEM_JOINS}"
+        sql = text(
+            f"""
+            with lexical as (
+                select id, row_number() over (order by rank desc) as position from (
+                    select i.id, ts_rank_cd(i.search_vector, q) as rank
+                    {candidates}, websearch_to_tsquery('russian', :query) q
+                    where {_ACTIVE} and i.search_vector @@ q{where}
+                    order by rank desc limit :candidates
+                ) ranked
+            ),
+            semantic as (
+                select id, row_number() over (order by distance) as position from (
+                    select i.id, i.embeddings <=> cast(:embedding as vector) as distance
+                    {candidates}
+                    where {_ACTIVE} and i.embeddings is not null{where}
+                    order by distance limit :candidates
+                ) ranked
+            ),
+            fused as (
+                select id, sum(1.0 / (:rrf_k + position)) as score
+                from (select * from lexical union all select * from semantic) hits
+                group by id
+            )
+            select {_ITEM_COLUMNS}, f.score
+            from fused f
+            join pricing.price_item i on i.id = f.id
+            left join pricing.price_category c on c.id = i.category_id
+            order by f.score desc
+            limit :limit
+            """
+        )
+        values = {
+            "catalog": self.catalog,
+            "query": query,
+            "embedding": vector_literal(embedding),
+            "candidates": max(limit, HYBRID_CANDIDATES),
+            "rrf_k": RRF_K,
+            "limit": limit,
+            **params,
+        }
+        with self.engine.connect() as conn:
+            return [_row(row, float(row["score"])) for row in conn.execute(sql, values).mappings()]
+
+    def section_counts(self, limit: int = 50, **filters: Any) -> List[Tuple[str, int]]:
+        where, params = filter_sql(**filters)
+        sql = text(
+            f"select coalesce(c.name, '') as section, count(*) as items "
+            f"from pricing.price_item i {_ITEM_JOINS} where {_ACTIVE}{where} "
+            "group by 1 order by items desc, section limit :limit"
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, {"catalog": self.catalog, "limit": limit, **params})
+            return [(row.section, int(row.items)) for row in rows]
+
+    def catalog_slugs(self) -> List[str]:
+        """Slugs of all active catalogs in the database, not only this one."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("select slug from pricing.price_catalog where not archived order by slug"))
+            return [row[0] for row in rows]
+
+    def load_modifiers(self) -> ModifierIndex:
+        """All modifiers of the catalog, past ones included (plans are priced as of their date), in one query."""
+        sql = text(
+            "select i.external_code as code, m.modifier_type, m.label, m.value, m.is_percentage, "
+            "m.valid_from, m.valid_to, m.condition "
+            f"from pricing.price_modifier m join pricing.price_item i on i.id = m.item_id {_ITEM_JOINS} "
+            f"where {_ACTIVE} and i.external_code is not null"
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, {"catalog": self.catalog}).mappings().all()
+        return ModifierIndex(PriceModifier(**row) for row in rows)
+
+    def modifier_index(self, max_age: float = PRICE_MODIFIER_TTL_SECONDS) -> ModifierIndex:
+        now = time.monotonic()
+        if self._modifiers is None or now - self._modifiers[0] > max_age:
+            self._modifiers = (now, self.load_modifiers())
+        return self._modifiers[1]
+
+    def sync_catalog(
+        self,
+        items: Any,
+        embeddings: Optional[Any] = None,
+        title: str = "",
+        changed_by: str = AUDIT_CHANGED_BY,
+    ) -> Dict[str, Any]:
+        """Upsert the staging catalog (section, code, display_name, base_price) and archive missing codes.
+
+        Rows travel as arrays through ``unnest`` — one statement per table
+        regardless of catalog size. Every create/update/archive of the run is
+        written to ``pricing.price_audit`` with a single ``COPY`` under one
+        ``run_id``.
+        """
+        codes = items["code"].astype(str).tolist()
+        sections = items["section"].fillna("").astype(str).tolist()
+        vectors = [vector_literal(vector) for vector in embeddings] if embeddings is not None else None
+        run_id = str(uuid.uuid4())
+        with self.engine.begin() as conn:
+            catalog_id = conn.execute(
+                text(
+                    "insert into pricing.price_catalog (slug, title) values (:slug, :title) "
+                    "on conflict (slug) do update set archived = false returning id"
+                ),
+                {"slug": self.catalog, "title": title or self.catalog},
+            ).scalar_one()
+            conn.execute(
+                text(
+                    "insert into pricing.price_category (catalog_id, code, name) "
+                    "select :catalog_id, name, name from unnest(cast(:sections as text[])) name "
+                    "where name <> '' on conflict (catalog_id, code) do nothing"
+                ),
+                {"catalog_id": catalog_id, "sections": sorted(set(sections))},
+            )
+            previous = {
+                row.code: row
+                for row in conn.execute(
+                    text(
+                        "select i.external_code as code, i.name as display_name, i.base_price, "
+                        "coalesce(c.name, '') as section, i.archived "
+                        "from pricing.price_item i left join pricing.price_category c on c.id = i.category_id "
+                        "where i.catalog_id = :catalog_id and i.external_code is not null"
+                    ),
+                    {"catalog_id": catalog_id},
+                )
+            }
+            upserted = conn.execute(
+                text(
+                    """
+                    insert into pricing.price_item (catalog_id, category_id, external_code, name, base_price, embeddings)
+                    select :catalog_id, c.id, src.code, src.name, src.price,
+                           case when src.embedding is null then null else cast(src.embedding as vector) end
+                    from unnest(
+                        cast(:codes as text[]), cast(:names as text[]), cast(:prices as numeric[]),
+                        cast(:sections as text[]), cast(:embeddings as text[])
+                    ) as src(code, name, price, section, embedding)
+                    left join pricing.price_category c on c.catalog_id = :catalog_id and c.code = src.section
+                    on conflict (catalog_id, coalesce(external_code, name)) do update set
+                        category_id = excluded.category_id,
+                        name = excluded.name,
+                        base_price = excluded.base_price,
+                        embeddings = coalesce(excluded.embeddings, pricing.price_item.embeddings),
+                        archived = false
+                    where (pricing.price_item.category_id, pricing.price_item.name, pricing.price_item.base_price,
+                           pricing.price_item.archived)
+                          is distinct from (excluded.category_id, excluded.name, excluded.base_price, false)
+                       or (excluded.embeddings is not null
+                           and pricing.price_item.embeddings is distinct from excluded.embeddings)
+                    returning id, external_code as code, name as display_name, base_price, (xmax = 0) as created
+                    """
+                ),
+                {
+                    "catalog_id": catalog_id,
+                    "codes": codes,
+                    "names": items["display_name"].fillna("").astype(str).tolist(),
+                    "prices": [round(float(price), 2) for price in items["base_price"]],
+                    "sections": sections,
+                    "embeddings": vectors or [None] * len(codes),
+                },
+            ).all()
+            archived = conn.execute(
+                text(
+                    "update pricing.price_item set archived = true "
+                    "where catalog_id = :catalog_id and not archived "
+                    "and external_code <> all(cast(:codes as text[])) "
+                    "returning id, external_code as code"
+                ),
+                {"catalog_id": catalog_id, "codes": codes},
+            ).all()
+
+            section_by_code = dict(zip(codes, sections))
+            audit: List[Tuple[str, str, Dict[str, Any]]] = []
+            for row in upserted:
+                after = {
+                    "display_name": row.display_name,
+                    "base_price": float(row.base_price),
+                    "section": section_by_code.get(row.code, ""),
+                }
+                before = previous.get(row.code)
+                if row.created or before is None:
+                    audit.append((row.id, "create", {"code": row.code, **after}))
+                    continue
+                old = {"display_name": before.display_name, "base_price": float(before.base_price), "section": before.section}
+                if old != after or before.archived:
+                    # Перезапись только эмбеддингов — не изменение прайса
+                    audit.append((row.id, "update", {"code": row.code, "before": old, "after": after}))
+            for row in archived:
+                before = previous.get(row.code)
+                payload = {"code": row.code}
+                if before is not None:
+                    payload.update(display_name=before.display_name, base_price=float(before.base_price))
+                audit.append((row.id, "archive", payload))
+            copy_audit(conn, audit, changed_by, run_id)
+
+        created = sum(1 for row in upserted if row.created)
+        return {
+            "run_id": run_id,
+            "total": len(codes),
+            "created": created,
+            "updated": len(upserted) - created,
+            "unchanged": len(codes) - len(upserted),
+            "archived": len(archived),
+            "audited": len(audit),
+        }
+
+    def price_history(self, code: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Audit events of one code, newest first (idx_price_audit_item)."""
+        sql = text(
+            "select a.run_id, a.change_type, a.changed_by, a.changed_at, a.payload "
+            "from pricing.price_audit a join pricing.price_item i on i.id = a.item_id "
+            "join pricing.price_catalog pc on pc.id = i.catalog_id "
+            "where pc.slug = :catalog and i.external_code = :code "
+            "order by a.changed_at desc, a.id desc limit :limit"
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, {"catalog": self.catalog, "code": code, "limit": limit}).mappings()
+            return [_audit_row(row) for row in rows]
+
+    def audit_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Ingest runs with per-type event counts, newest first."""
+        sql = text(
+            "select a.run_id, min(a.changed_at) as changed_at, min(a.changed_by) as changed_by, "
+            "count(*) filter (where a.change_type = 'create') as created, "
+            "count(*) filter (where a.change_type = 'update') as updated, "
+            "count(*) filter (where a.change_type = 'archive') as archived "
+            "from pricing.price_audit a join pricing.price_item i on i.id = a.item_id "
+            "join pricing.price_catalog pc on pc.id = i.catalog_id "
+            "where pc.slug = :catalog and a.run_id is not null "
+            "group by a.run_id order by changed_at desc limit :limit"
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, {"catalog": self.catalog, "limit": limit}).mappings()
+            return [
+                {**row, "run_id": str(row["run_id"]), "changed_at": row["changed_at"].isoformat()}
+                for row in rows
+            ]
+
+    def run_changes(self, run_id: str) -> List[Dict[str, Any]]:
+        """All audit events written by one ingest run (idx_price_audit_run)."""
+        sql = text(
+            "select a.run_id, a.change_type, a.changed_by, a.changed_at, a.payload "
+            "from pricing.price_audit a where a.run_id = cast(:run_id as uuid) order by a.id"
+        )
+        with self.engine.connect() as conn:
+            return [_audit_row(row) for row in conn.execute(sql, {"run_id": run_id}).mappings()]
+
+
+def _audit_row(mapping: Any) -> Dict[str, Any]:
+    return {
+        "run_id": str(mapping["run_id"]) if mapping["run_id"] else None,
+        "change_type": mapping["change_type"],
+        "changed_by": mapping["changed_by"],
+        "changed_at": mapping["changed_at"].isoformat(),
+        "payload": mapping["payload"],
+    }
+
+
+def copy_audit(conn: Any, events: Sequence[Tuple[Any, str, Dict[str, Any]]], changed_by: str, run_id: str) -> None:
+    """Stream audit events into ``pricing.price_audit`` with one COPY on the caller's transaction."""
+    if not events:
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for item_id, change_type, payload in events:
+        writer.writerow([item_id, change_type, changed_by, json.dumps(payload, ensure_ascii=False), run_id])
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(
+            "copy pricing.price_audit (item_id, change_type, changed_by, payload, run_id) "
+            "from stdin with (format csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Прайс в Postgres (схема pricing)")
+    parser.add_argument("--catalog", default=PRICING_CATALOG_SLUG, help="slug каталога")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("init", help="Применить db/pricing_schema.sql")
+    load = sub.add_parser("load", help="Загрузить staging CSV с эмбеддингами")
+    load.add_argument("--csv", type=Path, help="Путь до staging CSV (по умолчанию PRICING_CSV_PATH)")
+    load.add_argument("--no-embeddings", action="store_true", help="Загрузить без векторов")
+    load.add_argument("--changed-by", default=AUDIT_CHANGED_BY, help="Автор изменений в pricing.price_audit")
+    code = sub.add_parser("code", help="Найти услуги по кодам")
+    code.add_argument("codes", nargs="+")
+    search = sub.add_parser("search", help="Гибридный поиск")
+    search.add_argument("query")
+    search.add_argument("--top", type=int, default=5)
+    search.add_argument("--text-only", action="store_true", help="Только полнотекстовый поиск")
+    history = sub.add_parser("history", help="История изменений кода")
+    history.add_argument("code")
+    history.add_argument("--limit", type=int, default=50)
+    sub.add_parser("runs", help="Последние загрузки прайса")
+    run = sub.add_parser("run", help="Изменения одной загрузки")
+    run.add_argument("run_id")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    repo = PricingRepository(catalog=args.catalog)
+
+    if args.command == "init":
+        repo.apply_schema()
+        print("Схема pricing применена")
+    elif args.command == "load":
+        from scripts.catalog_snapshot import CSV_PATH
+        from scripts.ingest_pricing import load_catalog
+
+        items = load_catalog(args.csv or CSV_PATH)
+        embeddings = None
+        if not args.no_embeddings:
+            from scripts.embeddings import CachedEncoder, EmbeddingCache
+            from scripts.search_price import MODEL_NAME
+
+            embeddings = CachedEncoder(MODEL_NAME, cache=EmbeddingCache()).encode(
+                items["text"], items["content_hash"]
+            )
+        summary = repo.sync_catalog(items, embeddings, changed_by=args.changed_by)
+        print(
+            f"Каталог {args.catalog}: {summary['total']} позиций — новых {summary['created']}, "
+            f"изменённых {summary['updated']}, без изменений {summary['unchanged']}, "
+            f"в архив {summary['archived']}"
+        )
+        print(f"Аудит: {summary['audited']} событий, загрузка {summary['run_id']}")
+    elif args.command == "code":
+        found = repo.get_items(args.codes)
+        for code in args.codes:
+            item = found.get(code)
+            if item is None:
+                print(f"{code}: не найден")
+            else:
+                print(f"{code}: {item['display_name']} | {item['base_price']} ₽ | {item['section']}")
+    elif args.command == "search":
+        embedding = None
+        if not args.text_only:
+            from scripts.search_price import load_model
+
+            embedding = load_model().encode(args.query)
+        for idx, item in enumerate(repo.search(args.query, embedding, args.top), start=1):
+            print(f"{idx}. [{item['score']:.3f}] код {item['code']} | {item['display_name']} | {item['base_price']} ₽")
+    elif args.command in ("history", "run"):
+        events = repo.price_history(args.code, args.limit) if args.command == "history" else repo.run_changes(args.run_id)
+        for event in events:
+            print(f"{event['changed_at']}  {event['change_type']:<7}  {json.dumps(event['payload'], ensure_ascii=False)}")
+        if not events:
+            print("Изменений не найдено")
+    elif args.command == "runs":
+        for run_info in repo.audit_runs():
+            print(
+                f"{run_info['changed_at']}  {run_info['run_id']}  новых {run_info['created']}, "
+                f"изменённых {run_info['updated']}, в архив {run_info['archived']} ({run_info['changed_by']})"
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,7 @@
 create extension if not exists "uuid-ossp";
 create extension if not exists pgcrypto;
-create extension if not exists pgvector;
+create extension if not exists citext;
+create extension if not exists vector;
 create extension if not exists btree_gin;
 
 create schema if not exists pricing;
@@ -32,6 +33,12 @@ create table if not exists pricing.price_category (
     unique (catalog_id, code)
 );
 
+-- array_to_string не immutable, а generated-колонка требует immutable-выражение
+create or replace function pricing.immutable_array_to_string(arr text[], sep text)
+returns text language sql immutable parallel safe as $$
+    select coalesce(array_to_string(arr, sep), '')
+$$;
+
 create table if not exists pricing.price_item (
     id uuid primary key default uuid_generate_v4(),
     catalog_id uuid not null references pricing.price_catalog(id) on delete cascade,
@@ -45,13 +52,13 @@ create table if not exists pricing.price_item (
     contraindications text[],
     metadata jsonb not null default '{}',
     search_vector tsvector generated always as (
-        to_tsvector('russian', coalesce(name,'') || ' ' || coalesce(clinical_guideline_ref,'') || ' ' || array_to_string(contraindications, ' '))
+        to_tsvector('russian', coalesce(name,'') || ' ' || coalesce(clinical_guideline_ref,'') || ' ' || pricing.immutable_array_to_string(contraindications, ' '))
     ) stored,
-    embeddings vector(1536),
+    -- размерность EMBEDDING_MODEL_NAME (cointegrated/rubert-tiny2 = 312)
+    embeddings vector(312),
     created_at timestamptz not null default now(),
     updated_at timestamptz not null default now(),
-    archived boolean not null default false,
-    unique (catalog_id, coalesce(external_code, name))
+    archived boolean not null default false
 );
 
 create table if not exists pricing.price_modifier (
@@ -72,9 +79,13 @@ create table if not exists pricing.price_audit (
     change_type text not null check (change_type in ('create','update','archive')),
     changed_by text not null,
     payload jsonb not null,
-    changed_at timestamptz not null default now()
+    changed_at timestamptz not null default now(),
+    run_id uuid
 );
 
+-- run_id появился позже: базы, созданные до него, получают колонку здесь
+alter table pricing.price_audit add column if not exists run_id uuid;
+
 create or replace function pricing.touch_updated_at()
 returns trigger language plpgsql as $$
 begin
@@ -83,16 +94,23 @@ begin
 end;
 $$;
 
-create trigger trg_price_catalog_updated
+create or replace trigger trg_price_catalog_updated
 before update on pricing.price_catalog
 for each row execute function pricing.touch_updated_at();
 
-create trigger trg_price_item_updated
+create or replace trigger trg_price_item_updated
 before update on pricing.price_item
 for each row execute function pricing.touch_updated_at();
 
 create index if not exists idx_price_item_catalog on pricing.price_item (catalog_id);
 create index if not exists idx_price_item_category on pricing.price_item (category_id);
 create index if not exists idx_price_item_search on pricing.price_item using gin (search_vector);
-create index if not exists idx_price_item_embeddings on pricing.price_item using ivfflat (embeddings vector_cosine_ops) with (lists = 200);
+create unique index if not exists idx_price_item_code_unique on pricing.price_item (catalog_id, coalesce(external_code, name));
+create index if not exists idx_price_item_code on pricing.price_item (external_code) where not archived;
+-- like '809%' по btree работает только с text_pattern_ops (кластер не в локали C)
+create index if not exists idx_price_item_code_pattern on pricing.price_item (external_code text_pattern_ops) where not archived;
+-- HNSW не требует обучения на данных: ivfflat с lists = 200 на сотнях строк почти не находит соседей
+create index if not exists idx_price_item_embeddings on pricing.price_item using hnsw (embeddings vector_cosine_ops);
 create index if not exists idx_price_modifier_validity on pricing.price_modifier (item_id, valid_from, coalesce(valid_to, 'infinity'));
+create index if not exists idx_price_audit_item on pricing.price_audit (item_id, changed_at desc);
+create index if not exists idx_price_audit_run on pricing.price_audit (run_id) where run_id is not null;
@@ -56,3 +56,9 @@ create table if not exists plan_feedback (
     diff_json json,
     created_at text default (datetime('now'))
 );
+
+create table if not exists cache_versions (
+    name text primary key,
+    version integer not null default 0,
+    updated_at text default (datetime('now'))
+);
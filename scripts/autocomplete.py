@@ -0,0 +1,176 @@
+"""As-you-type suggestions over the compact catalog without the model or Qdrant.
+
+Every item gets a rank once (shorter names first, then by code). Normalized
+display-name words are kept in one sorted list, each with the ascending ranks
+of the items that contain it, so a typed prefix is a contiguous slice of the
+word list found by binary search, and the top-N is a lazy merge of the first
+ranks of the words in that slice. Digit-only queries go to the code range
+index of ``CompactCatalog``.
+"""
+
+import argparse
+import heapq
+import os
+import re
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from scripts.compact_catalog import CatalogItem, CompactCatalog, load_compact_catalog
+
+AUTOCOMPLETE_LIMIT = int(os.getenv("AUTOCOMPLETE_LIMIT", "10"))
+# Короткие префиксы («1», «п») покрывают сотни слов — их объединённые списки кэшируем
+MERGE_MIN_WORDS = 8
+MERGED_CACHE_SIZE = 512
+
+_WORD_RE = re.compile(r"[0-9a-zа-я]+")
+# Индекс привязан к объекту каталога: load_compact_catalog отдаёт новый только после смены прайса на диске
+_autocomplete_cache: Optional[Tuple[CompactCatalog, "AutocompleteIndex"]] = None
+
+
+def normalize_words(text: str) -> List[str]:
+    return _WORD_RE.findall((text or "").lower().replace("ё", "е"))
+
+
+class AutocompleteIndex:
+    """Sorted-prefix index over display-name words of one catalog."""
+
+    def __init__(self, catalog: CompactCatalog):
+        self.catalog = catalog
+        self.order = array("I", sorted(range(len(catalog)), key=lambda pos: (len(catalog.name_at(pos)), pos)))
+        postings: Dict[str, array] = {}
+        for rank, pos in enumerate(self.order):
+            for word in set(normalize_words(catalog.name_at(pos))):
+                postings.setdefault(word, array("I")).append(rank)
+        self.words: List[str] = sorted(postings)
+        self.postings: List[array] = [postings[word] for word in self.words]
+        self._merged: Dict[Tuple[int, int], array] = {}
+        # Первая буква — самый частый и самый дорогой запрос, объединяем заранее
+        for first in sorted({word[0] for word in self.words}):
+            bounds = self.word_range(first)
+            if bounds[1] - bounds[0] >= MERGE_MIN_WORDS:
+                self._merged_ranks(bounds)
+
+    def memory_bytes(self) -> int:
+        arrays = sum(sys.getsizeof(ranks) for ranks in self.postings)
+        arrays += sum(sys.getsizeof(ranks) for ranks in self._merged.values())
+        words = sys.getsizeof(self.words) + sum(sys.getsizeof(word) for word in self.words)
+        return arrays + words + sys.getsizeof(self.order)
+
+    def word_range(self, prefix: str) -> Tuple[int, int]:
+        return bisect_left(self.words, prefix), bisect_left(self.words, prefix + "\U0010ffff")
+
+    def _ranks(self, bounds: Tuple[int, int]) -> Iterator[int]:
+        start, end = bounds
+        if end - start == 1:
+            return iter(self.postings[start])
+        if end - start >= MERGE_MIN_WORDS:
+            return iter(self._merged_ranks(bounds))
+        merged = heapq.merge(*self.postings[start:end])
+        # Одно изделие может содержать несколько слов с этим префиксом
+        return (rank for rank, previous in _with_previous(merged) if rank != previous)
+
+    def _merged_ranks(self, bounds: Tuple[int, int]) -> array:
+        ranks = self._merged.get(bounds)
+        if ranks is None:
+            ranks = array("I", sorted(set().union(*self.postings[bounds[0]:bounds[1]])))
+            if len(self._merged) >= MERGED_CACHE_SIZE:
+                self._merged.clear()
+            self._merged[bounds] = ranks
+        return ranks
+
+    def suggest(self, query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[CatalogItem]:
+        """Top ``limit`` items whose name has a word starting with every query word, or codes by prefix."""
+        query = (query or "").strip()
+        if not query or limit <= 0:
+            return []
+        if query.isdigit():
+            return self.catalog.with_prefix(query, limit)
+        prefixes = list(dict.fromkeys(normalize_words(query)))
+        if not prefixes:
+            return []
+        ranges = {prefix: self.word_range(prefix) for prefix in prefixes}
+        if any(start == end for start, end in ranges.values()):
+            return []
+        if len(prefixes) == 1:
+            ranks = list(islice(self._ranks(ranges[prefixes[0]]), limit))
+        else:
+            ranks = self._intersect([ranges[prefix] for prefix in prefixes], limit)
+        return [CatalogItem(self.catalog, self.order[rank]) for rank in ranks]
+
+    def _next_rank(self, bounds: Tuple[int, int], rank: int) -> Optional[int]:
+        """Smallest rank >= ``rank`` among the items containing a word of the range."""
+        if bounds[1] - bounds[0] >= MERGE_MIN_WORDS:
+            ranks = self._merged_ranks(bounds)
+            pos = bisect_left(ranks, rank)
+            return ranks[pos] if pos < len(ranks) else None
+        best: Optional[int] = None
+        for ranks in self.postings[bounds[0]:bounds[1]]:
+            pos = bisect_left(ranks, rank)
+            if pos < len(ranks) and (best is None or ranks[pos] < best):
+                best = ranks[pos]
+        return best
+
+    def _intersect(self, ranges: List[Tuple[int, int]], limit: int) -> List[int]:
+        # Leapfrog: каждый префикс перескакивает к первому рангу не меньше текущего кандидата
+        ranges = sorted(ranges, key=lambda bounds: bounds[1] - bounds[0])
+        found: List[int] = []
+        rank: Optional[int] = 0
+        while rank is not None and len(found) < limit:
+            agreed = True
+            for bounds in ranges:
+                candidate = self._next_rank(bounds, rank)
+                if candidate is None:
+                    return found
+                if candidate != rank:
+                    rank, agreed = candidate, False
+            if agreed:
+                found.append(rank)
+                rank += 1
+        return found
+
+
+def _with_previous(values: Iterator[int]) -> Iterator[Tuple[int, Optional[int]]]:
+    previous: Optional[int] = None
+    for value in values:
+        yield value, previous
+        previous = value
+
+
+def load_autocomplete_index() -> AutocompleteIndex:
+    global _autocomplete_cache
+    catalog = load_compact_catalog()
+    if _autocomplete_cache is None or _autocomplete_cache[0] is not catalog:
+        _autocomplete_cache = (catalog, AutocompleteIndex(catalog))
+    return _autocomplete_cache[1]
+
+
+def suggest(query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[CatalogItem]:
+    return load_autocomplete_index().suggest(query, limit)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Подсказки по мере ввода (названия и коды прайса)")
+    parser.add_argument("query", help="Начало названия или кода")
+    parser.add_argument("--limit", type=int, default=AUTOCOMPLETE_LIMIT)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    started = time.perf_counter()
+    index = load_autocomplete_index()
+    print(f"Индекс: {len(index.words)} слов, построен за {time.perf_counter() - started:.3f} с")
+    started = time.perf_counter()
+    items = index.suggest(args.query, args.limit)
+    elapsed_us = (time.perf_counter() - started) * 1_000_000
+    for item in items:
+        print(f"{item.code} | {item.display_name} | {item.base_price} ₽")
+    print(f"Найдено {len(items)} за {elapsed_us:.0f} мкс")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,221 @@
+"""Scale benchmark on synthetic catalogs: load time, memory, lookup/search latency, ingest throughput.
+
+For every size a catalog and a query set are generated with
+``scripts.synthetic_catalog`` into ``--workdir``; the real catalog is never
+touched. Qdrant ingest is measured only with ``--ingest`` (temporary
+collection, dropped afterwards).
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from bot.plans import combine_plans
+from scripts.catalog_snapshot import BASE_DIR, load_catalog, read_csv, write_snapshot
+from scripts.compact_catalog import load_compact_catalog
+from scripts.retrieval import LexicalIndex
+from scripts.synthetic_catalog import generate_items, generate_queries, write_catalog
+
+DEFAULT_SIZES = [50_000, 100_000, 500_000]
+DEFAULT_WORKDIR = BASE_DIR / "storage" / "synthetic"
+LOOKUPS = 10_000
+PLAN_LINES = 12
+PLANS = 500
+SEARCH_DEPTH = 10
+
+
+def percentiles(samples_ms: Sequence[float]) -> Dict[str, float]:
+    return {
+        "p50": round(float(np.percentile(samples_ms, 50)), 4),
+        "p95": round(float(np.percentile(samples_ms, 95)), 4),
+        "p99": round(float(np.percentile(samples_ms, 99)), 4),
+    }
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def bench_loading(csv_path: Path, snapshot_path: Path) -> Dict[str, Any]:
+    missing = csv_path.with_suffix(".missing.arrow")
+    report: Dict[str, Any] = {}
+
+    started = time.perf_counter()
+    write_snapshot(read_csv(csv_path), snapshot_path, source=csv_path.name)
+    report["snapshot_write_s"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    load_compact_catalog(csv_path, missing)
+    report["compact_from_csv_s"] = round(time.perf_counter() - started, 3)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    catalog = load_compact_catalog(csv_path, snapshot_path)
+    report["compact_from_snapshot_s"] = round(time.perf_counter() - started, 3)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report["compact_load_peak_bytes"] = peak
+    report["compact_memory"] = catalog.memory_report()
+
+    started = time.perf_counter()
+    frame = load_catalog(csv_path, missing)
+    report["dataframe_from_csv_s"] = round(time.perf_counter() - started, 3)
+    started = time.perf_counter()
+    frame = load_catalog(csv_path, snapshot_path)
+    report["dataframe_from_snapshot_s"] = round(time.perf_counter() - started, 3)
+    frame_bytes = int(frame.memory_usage(deep=True).sum())
+    report["dataframe_bytes_per_item"] = round(frame_bytes / len(frame), 1)
+    return report
+
+
+def bench_lookups(csv_path: Path, snapshot_path: Path, codes: List[str], rng: random.Random) -> Dict[str, Any]:
+    from db.price_modifiers import ModifierIndex, evaluate_plan
+
+    catalog = load_compact_catalog(csv_path, snapshot_path)
+    frame = load_catalog(csv_path, snapshot_path)
+    probes = [rng.choice(codes) for _ in range(LOOKUPS)]
+    compact_ms = [timed(lambda code=code: catalog.get(code)) for code in probes]
+    # DataFrame-скан — то, как /code и агент искали коды до компактного каталога
+    frame_ms = [timed(lambda code=code: frame.loc[frame["code"] == code]) for code in probes[:200]]
+
+    index = ModifierIndex()
+    plan_ms: List[float] = []
+    combine_ms: List[float] = []
+    for _ in range(PLANS):
+        plan_codes = [rng.choice(codes) for _ in range(PLAN_LINES)]
+
+        def price_plan() -> dict:
+            found = catalog.items_for(plan_codes)
+            lines = [{**found[code], "count": 1} for code in plan_codes]
+            return evaluate_plan({"items": lines}, index)
+
+        started = time.perf_counter()
+        plan = price_plan()
+        plan_ms.append((time.perf_counter() - started) * 1000)
+        extra = {"items": [{**item, "count": 1} for item in catalog.items_for(rng.sample(codes, 3)).values()]}
+        combine_ms.append(timed(lambda: combine_plans(plan, extra, plan_codes)))
+
+    return {
+        "code_lookup_ms": {"compact": percentiles(compact_ms), "dataframe_scan": percentiles(frame_ms)},
+        "plan_pricing_ms": percentiles(plan_ms),
+        "combine_plans_ms": percentiles(combine_ms),
+    }
+
+
+def bench_lexical(csv_path: Path, snapshot_path: Path, queries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    catalog = load_compact_catalog(csv_path, snapshot_path)
+    started = time.perf_counter()
+    index = LexicalIndex(catalog)
+    build_s = time.perf_counter() - started
+
+    text_queries = [query for query in queries if query["kind"] in ("exact", "partial")]
+    latencies: List[float] = []
+    hits = 0
+    for query in text_queries:
+        started = time.perf_counter()
+        found = [code for code, _, _ in index.search(query["query"], SEARCH_DEPTH)]
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += int(query["expected"][0] in found)
+    return {
+        "build_s": round(build_s, 3),
+        "terms": len(index.postings),
+        "queries": len(text_queries),
+        "latency_ms": percentiles(latencies) if latencies else None,
+        "recall@10": round(hits / len(text_queries), 4) if text_queries else None,
+    }
+
+
+def bench_ingest(csv_path: Path, size: int, model_name: str) -> Dict[str, Any]:
+    from scripts.embeddings import CachedEncoder
+    from scripts.ingest_pricing import create_collection, load_catalog as load_ingest_items, sync_collection
+    from scripts.search_price import make_qdrant_client
+
+    items = load_ingest_items(csv_path)
+    encoder = CachedEncoder(model_name)
+    started = time.perf_counter()
+    encoder.encode(items["text"], items["content_hash"])
+    encode_s = time.perf_counter() - started
+
+    client = make_qdrant_client()
+    collection = f"bench_scale_{size}"
+    create_collection(client, collection, encoder.dimension)
+    try:
+        started = time.perf_counter()
+        sync_collection(client, collection, items, encoder)
+        upsert_s = time.perf_counter() - started
+    finally:
+        client.delete_collection(collection)
+    return {
+        "encode_items_per_s": round(len(items) / encode_s, 1),
+        # sync_collection кодирует повторно — вычитаем время энкодера
+        "upsert_items_per_s": round(len(items) / max(upsert_s - encode_s, 1e-6), 1),
+        "total_s": round(encode_s + upsert_s, 3),
+    }
+
+
+def run_size(size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    csv_path = args.workdir / f"price_items_{size}.csv"
+    snapshot_path = csv_path.with_suffix(".arrow")
+
+    started = time.perf_counter()
+    items = generate_items(size, args.seed)
+    write_catalog(items, csv_path)
+    queries = generate_queries(items, args.queries, args.seed)
+    report: Dict[str, Any] = {"size": size, "generate_s": round(time.perf_counter() - started, 3)}
+
+    codes = [code for _, code, _, _ in items]
+    del items
+    report["load"] = bench_loading(csv_path, snapshot_path)
+    report["lookup"] = bench_lookups(csv_path, snapshot_path, codes, rng)
+    report["lexical"] = bench_lexical(csv_path, snapshot_path, queries)
+    if args.ingest:
+        report["ingest"] = bench_ingest(csv_path, size, args.model)
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Бенчмарк масштабирования на синтетическом прайсе")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="Размеры прайса")
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help="Куда писать синтетические файлы")
+    parser.add_argument("--queries", type=int, default=1000, help="Запросов на размер")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ingest", action="store_true", help="Замерить эмбеддинги и загрузку в Qdrant")
+    parser.add_argument(
+        "--model",
+        default=os.getenv("EMBEDDING_MODEL_NAME", "cointegrated/rubert-tiny2"),
+        help="Модель для --ingest",
+    )
+    parser.add_argument("--output", type=Path, help="Куда сохранить JSON-отчёт")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    results: List[Dict[str, Any]] = []
+    for size in args.sizes:
+        try:
+            result = run_size(size, args)
+        except Exception as exc:
+            result = {"size": size, "error": f"{type(exc).__name__}: {exc}"}
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+
+    payload = json.dumps({"results": results}, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(payload, encoding="utf-8")
+    print(payload)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
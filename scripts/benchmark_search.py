@@ -0,0 +1,218 @@
+"""Search quality/latency benchmark over a golden set built from real data.
+
+Golden queries come from three sources:
+- ``config/service_aliases.json``: alias phrase -> alias codes;
+- ``HELP_SNIPPETS`` in ``bot/main.py``: the quoted example, with codes resolved
+  through the alias table (snippets without a match only count for latency);
+- ``training/plans.jsonl``: intake text -> codes confirmed in the plan.
+
+Answers of the first two sources come from the alias table itself, so the
+``alias`` backend (and ``cascade``, whose first stage it is) score 1.0 there by
+construction. The headline numbers of every backend are therefore computed
+over ``plan`` queries only; alias and snippet sources are reported under
+``by_source`` as sanity checks.
+"""
+
+import argparse
+import ast
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from scripts.retrieval import load_aliases, load_lexical_index, match_aliases, retrieve
+from scripts.search_price import BASE_DIR, search_by_query
+
+BOT_MAIN_PATH = BASE_DIR / "bot" / "main.py"
+PLANS_PATH = BASE_DIR / "training" / "plans.jsonl"
+SEARCH_DEPTH = 10
+HEADLINE_SOURCES = ("plan",)
+SANITY_SOURCES = ("alias", "help_snippet")
+
+Backend = Callable[[str, int], List[str]]
+
+
+def _alias_backend(query: str, top_k: int) -> List[str]:
+    return list(dict.fromkeys(match_aliases(query)))[:top_k]
+
+
+def _lexical_backend(query: str, top_k: int) -> List[str]:
+    return [code for code, _, _ in load_lexical_index().search(query, top_k)]
+
+
+def _semantic_backend(query: str, top_k: int) -> List[str]:
+    codes = [str((point.payload or {}).get("code", "")) for point in search_by_query(query, top_k)]
+    return list(dict.fromkeys(code for code in codes if code))
+
+
+def _cascade_backend(query: str, top_k: int) -> List[str]:
+    return [item["code"] for item in retrieve(query, top_k).items]
+
+
+BACKENDS: Dict[str, Backend] = {
+    "alias": _alias_backend,
+    "lexical": _lexical_backend,
+    "semantic": _semantic_backend,
+    "cascade": _cascade_backend,
+}
+
+
+def load_help_snippets(path: Path = BOT_MAIN_PATH) -> List[str]:
+    # bot.main поднимает бота и Whisper при импорте, поэтому читаем литерал через ast
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == "HELP_SNIPPETS" for target in node.targets
+        ):
+            return list(ast.literal_eval(node.value))
+    return []
+
+
+def build_golden_set(plans_path: Path = PLANS_PATH) -> List[Dict[str, Any]]:
+    golden: List[Dict[str, Any]] = []
+
+    for alias, codes in load_aliases().items():
+        golden.append({"source": "alias", "query": alias, "expected": list(dict.fromkeys(codes))})
+
+    for snippet in load_help_snippets():
+        quoted = re.findall(r"'([^']+)'", snippet)
+        query = quoted[0] if quoted else snippet
+        expected = list(dict.fromkeys(match_aliases(query)))
+        golden.append({"source": "help_snippet", "query": query, "expected": expected})
+
+    if plans_path.exists():
+        with plans_path.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                intake = (record.get("intake") or "").strip()
+                codes = list(dict.fromkeys(record.get("codes") or []))
+                if intake and codes:
+                    golden.append({"source": "plan", "query": intake, "expected": codes})
+
+    return golden
+
+
+def recall_at(found: List[str], expected: List[str], k: int) -> float:
+    # Нормируем на min(k, |expected|), чтобы идеальный ответ давал 1.0 и при k=1
+    relevant = set(expected)
+    return len(relevant & set(found[:k])) / min(k, len(relevant))
+
+
+def reciprocal_rank(found: List[str], expected: List[str]) -> float:
+    relevant = set(expected)
+    for rank, code in enumerate(found, start=1):
+        if code in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def _summary(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    scored = [row for row in rows if row["expected"]]
+    latencies = [row["latency_ms"] for row in rows]
+    summary: Dict[str, Any] = {
+        "queries": len(rows),
+        "scored_queries": len(scored),
+        "answered": round(sum(1 for row in rows if row["found"]) / len(rows), 4) if rows else 0.0,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 3) if latencies else None,
+            "p95": round(float(np.percentile(latencies, 95)), 3) if latencies else None,
+        },
+    }
+    if scored:
+        summary["recall@1"] = round(float(np.mean([recall_at(r["found"], r["expected"], 1) for r in scored])), 4)
+        summary["recall@5"] = round(float(np.mean([recall_at(r["found"], r["expected"], 5) for r in scored])), 4)
+        summary["mrr"] = round(float(np.mean([reciprocal_rank(r["found"], r["expected"]) for r in scored])), 4)
+    return summary
+
+
+def run_backend(name: str, backend: Backend, golden: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Прогрев: загрузка модели/индекса не должна попадать в латентность первого запроса
+    backend(golden[0]["query"], SEARCH_DEPTH)
+
+    rows: List[Dict[str, Any]] = []
+    for entry in golden:
+        started = time.perf_counter()
+        found = backend(entry["query"], SEARCH_DEPTH)
+        rows.append(
+            {
+                **entry,
+                "found": found,
+                "latency_ms": (time.perf_counter() - started) * 1000,
+            }
+        )
+
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_source.setdefault(row["source"], []).append(row)
+
+    # Ответы алиасов и подсказок взяты из таблицы алиасов — в итоговые метрики их не смешиваем
+    headline = [row for row in rows if row["source"] in HEADLINE_SOURCES]
+    return {
+        "backend": name,
+        "headline_sources": list(HEADLINE_SOURCES),
+        **_summary(headline),
+        "by_source": {
+            source: {**_summary(source_rows), "sanity_check": source in SANITY_SOURCES}
+            for source, source_rows in by_source.items()
+        },
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Бенчмарк качества и латентности поиска по прайсу")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=sorted(BACKENDS),
+        default=list(BACKENDS),
+        help="Какие бэкенды прогонять",
+    )
+    parser.add_argument("--plans", type=Path, default=PLANS_PATH, help="Путь до plans.jsonl")
+    parser.add_argument("--output", type=Path, help="Куда сохранить JSON-отчёт")
+    parser.add_argument("--dump-golden", action="store_true", help="Вывести golden set и выйти")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    golden = build_golden_set(args.plans)
+    if not golden:
+        raise SystemExit("Golden set пуст: нет алиасов, подсказок и планов")
+    if not any(entry["source"] in HEADLINE_SOURCES for entry in golden):
+        print(f"В {args.plans} нет планов: итоговые метрики будут пустыми, см. by_source", file=sys.stderr)
+
+    if args.dump_golden:
+        print(json.dumps(golden, ensure_ascii=False, indent=2))
+        return
+
+    results: List[Dict[str, Any]] = []
+    for name in args.backends:
+        try:
+            result = run_backend(name, BACKENDS[name], golden)
+        except Exception as exc:
+            result = {"backend": name, "error": f"{type(exc).__name__}: {exc}"}
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+
+    report = {
+        "golden_queries": len(golden),
+        "golden_sources": {
+            source: sum(1 for entry in golden if entry["source"] == source)
+            for source in (*SANITY_SOURCES, *HEADLINE_SOURCES)
+        },
+        "results": results,
+    }
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(payload, encoding="utf-8")
+    print(payload)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
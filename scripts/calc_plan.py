@@ -1,8 +1,9 @@
 import sys
 import ctypes
 import pandas as pd
-from pathlib import Path
 
+from scripts.catalog_snapshot import BASE_DIR
+from scripts.compact_catalog import load_compact_catalog
 from scripts.search_price import match_guideline, load_guidelines
 
 # Настраиваем вывод UTF-8 независимо от текущей кодировки консоли
@@ -18,8 +19,7 @@ for stream_name in ("stdout", "stderr"):
     if hasattr(stream, "reconfigure"):
         stream.reconfigure(encoding="utf-8")
 
-CSV_PATH = Path(r"C:\dent_ai\staging_price_items.csv")
-OUTPUT_PATH = Path(r"C:\dent_ai\plan_result.txt")
+OUTPUT_PATH = BASE_DIR / "plan_result.txt"
 
 # При необходимости можно задать человеко-читаемые синонимы
 CODE_ALIASES = {
@@ -38,14 +38,14 @@ codes = [
     "800000",
 ]
 
-items = pd.read_csv(CSV_PATH, dtype={"code": str})
+catalog = load_compact_catalog()
 
 rows = []
 for code in codes:
-    match = items.loc[items["code"] == code]
-    if match.empty:
+    item = catalog.get(code)
+    if item is None:
         raise SystemExit(f"код {code} не найден в прайсе")
-    row = match.iloc[0].copy()
+    row = item.to_dict()
     row["display_name"] = CODE_ALIASES.get(code, row["display_name"])
     rows.append(row)
 
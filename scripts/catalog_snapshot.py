@@ -0,0 +1,260 @@
+"""Typed columnar snapshot of the price catalog (Arrow IPC, memory-mapped on load)."""
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+BASE_DIR = Path(os.getenv("DENT_AI_BASE", Path(__file__).resolve().parents[1]))
+CSV_PATH = Path(os.getenv("PRICING_CSV_PATH", BASE_DIR / "staging_price_items.csv"))
+SNAPSHOT_PATH = Path(os.getenv("PRICING_SNAPSHOT_PATH", BASE_DIR / "staging_price_items.arrow"))
+CLINICS_DIR = Path(os.getenv("PRICING_CLINICS_DIR", BASE_DIR / "storage" / "clinics"))
+SIMILAR_PATH = Path(os.getenv("PRICING_SIMILAR_PATH", BASE_DIR / "staging_price_items.similar.arrow"))
+SIMILAR_TOP_K = 10
+SNAPSHOT_FORMAT = "1"
+PRICE_TYPE = pa.decimal128(12, 2)
+SCHEMA = pa.schema(
+    [
+        pa.field("section", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("code", pa.string()),
+        pa.field("display_name", pa.string()),
+        pa.field("base_price", PRICE_TYPE),
+    ]
+)
+# (подпись файла, DataFrame, версия каталога)
+_catalog_cache: Optional[Tuple[Tuple[str, int, int], pd.DataFrame, str]] = None
+_similar_cache: Optional[Tuple[Tuple[str, int, int], Dict[str, List[Tuple[str, float]]]]] = None
+
+
+def rows_version(rows: Iterable[Tuple[Any, Any, Any, Any]]) -> str:
+    """Content hash of (section, code, display_name, base_price) rows in file order."""
+    digest = hashlib.sha256()
+    for section, code, display_name, base_price in rows:
+        line = f"{section}\x1f{code}\x1f{display_name}\x1f{float(base_price):.2f}\n"
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def catalog_version(items: pd.DataFrame) -> str:
+    """Content hash of the catalog rows — stable across re-exports of the same prices."""
+    columns = items[["section", "code", "display_name", "base_price"]]
+    return rows_version(columns.itertuples(index=False, name=None))
+
+
+def read_csv(csv_path: Path = CSV_PATH) -> pd.DataFrame:
+    if not csv_path.exists():
+        raise FileNotFoundError(f"Не найден CSV: {csv_path}")
+    return pd.read_csv(csv_path, dtype={"code": str})
+
+
+def write_snapshot(items: pd.DataFrame, path: Path = SNAPSHOT_PATH, source: str = "") -> str:
+    """Write the catalog as an uncompressed Arrow IPC file and return its version stamp."""
+    items = items.fillna({"section": "", "display_name": ""})
+    version = catalog_version(items)
+    prices = [Decimal(f"{float(price):.2f}") for price in items["base_price"]]
+    table = pa.Table.from_arrays(
+        [
+            pa.array(items["section"].astype(str), pa.string()).dictionary_encode(),
+            pa.array(items["code"].astype(str), pa.string()),
+            pa.array(items["display_name"].astype(str), pa.string()),
+            pa.array(prices, PRICE_TYPE),
+        ],
+        schema=SCHEMA.with_metadata(
+            {
+                "format": SNAPSHOT_FORMAT,
+                "catalog_version": version,
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "source": source,
+                "rows": str(len(items)),
+            }
+        ),
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Пишем во временный файл и подменяем атомарно: читатели не видят половину снапшота
+    tmp_path = path.with_name(path.name + ".tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return version
+
+
+def read_snapshot(path: Path = SNAPSHOT_PATH) -> pa.Table:
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def snapshot_metadata(path: Path = SNAPSHOT_PATH) -> Dict[str, str]:
+    """Schema metadata only — does not touch the column buffers."""
+    with pa.memory_map(str(path), "r") as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return {key.decode("utf-8"): value.decode("utf-8") for key, value in metadata.items()}
+
+
+def snapshot_to_frame(table: pa.Table) -> pd.DataFrame:
+    table = table.set_column(
+        table.schema.get_field_index("base_price"),
+        "base_price",
+        table.column("base_price").cast(pa.float64()),
+    )
+    # section остаётся категорией: коды словаря без копии строк на каждую строку;
+    # self_destruct отпускает буферы таблицы по мере конвертации колонок
+    return table.to_pandas(self_destruct=True, split_blocks=True)
+
+
+def source_signature(path: Path) -> Tuple[str, int, int]:
+    stat = path.stat()
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+def use_snapshot(snapshot_path: Path, csv_path: Path) -> bool:
+    if not snapshot_path.exists():
+        return False
+    if csv_path.exists() and csv_path.stat().st_mtime_ns > snapshot_path.stat().st_mtime_ns:
+        logging.warning("Catalog snapshot %s is older than %s, reading CSV", snapshot_path, csv_path)
+        return False
+    return True
+
+
+def load_catalog(csv_path: Path = CSV_PATH, snapshot_path: Path = SNAPSHOT_PATH) -> pd.DataFrame:
+    """Catalog as a DataFrame: the memory-mapped snapshot if fresh, CSV otherwise.
+
+    The result is cached until the source file changes on disk, so repeated
+    calls cost one ``stat``.
+    """
+    global _catalog_cache
+    source = snapshot_path if use_snapshot(snapshot_path, csv_path) else csv_path
+    if not source.exists():
+        raise FileNotFoundError(f"Не найден прайс: {snapshot_path} / {csv_path}")
+    signature = source_signature(source)
+    if _catalog_cache is None or _catalog_cache[0] != signature:
+        if source == snapshot_path:
+            table = read_snapshot(snapshot_path)
+            version = (table.schema.metadata or {}).get(b"catalog_version", b"").decode("utf-8")
+            frame = snapshot_to_frame(table)
+            del table
+        else:
+            frame = read_csv(csv_path)
+            version = catalog_version(frame.fillna({"section": "", "display_name": ""}))
+        _catalog_cache = (signature, frame, version)
+        logging.info("Catalog loaded from %s: %s rows, version %s", source, len(frame), version)
+    return _catalog_cache[1]
+
+
+def catalog_info() -> Dict[str, object]:
+    """Source, size and version of the catalog currently loaded in this process."""
+    frame = load_catalog()
+    signature, _, version = _catalog_cache  # type: ignore[misc]
+    return {"source": signature[0], "rows": len(frame), "version": version}
+
+
+def top_k_similar(embeddings: np.ndarray, k: int, block: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact cosine top-k neighbours of every row (self excluded), computed block by block."""
+    count = embeddings.shape[0]
+    k = min(k, count - 1)
+    neighbors = np.zeros((count, max(k, 0)), dtype=np.int32)
+    scores = np.zeros((count, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return neighbors, scores
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    vectors = (embeddings / np.clip(norms, 1e-12, None)).astype(np.float32)
+    for start in range(0, count, block):
+        sims = vectors[start:start + block] @ vectors.T
+        rows = np.arange(sims.shape[0])
+        sims[rows, start + rows] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        neighbors[start:start + block] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + block] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbors, scores
+
+
+def write_similar(
+    codes: Sequence[str],
+    neighbors: np.ndarray,
+    scores: np.ndarray,
+    version: str,
+    path: Path = SIMILAR_PATH,
+    model: str = "",
+) -> None:
+    """Store the neighbour table as Arrow lists next to the snapshot, stamped with the catalog version."""
+    count, k = neighbors.shape
+    code_array = np.asarray(list(codes), dtype=object)
+    offsets = pa.array(np.arange(0, count * k + 1, k, dtype=np.int32))
+    table = pa.table(
+        {
+            "code": pa.array(code_array, pa.string()),
+            "similar_codes": pa.ListArray.from_arrays(offsets, pa.array(code_array[neighbors.ravel()], pa.string())),
+            "similar_scores": pa.ListArray.from_arrays(offsets, pa.array(scores.ravel(), pa.float32())),
+        }
+    ).replace_schema_metadata({"catalog_version": version, "model": model, "k": str(k)})
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def load_similar(path: Path = SIMILAR_PATH) -> Dict[str, List[Tuple[str, float]]]:
+    """code -> [(similar code, cosine)] ordered by similarity; empty if the table was never built."""
+    global _similar_cache
+    if not path.exists():
+        return {}
+    signature = source_signature(path)
+    if _similar_cache is None or _similar_cache[0] != signature:
+        table = read_snapshot(path)
+        similar = {
+            code: list(zip(neighbours, scores))
+            for code, neighbours, scores in zip(
+                table.column("code").to_pylist(),
+                table.column("similar_codes").to_pylist(),
+                table.column("similar_scores").to_pylist(),
+            )
+        }
+        _similar_cache = (signature, similar)
+        logging.info("Similar-items table loaded from %s: %s codes", path, len(similar))
+    return _similar_cache[1]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Снапшот прайса в формате Arrow")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="Путь до staging CSV")
+    parser.add_argument("--output", type=Path, default=SNAPSHOT_PATH, help="Куда сохранить снапшот")
+    parser.add_argument("--info", action="store_true", help="Показать версию существующего снапшота")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+
+    if args.info:
+        if not args.output.exists():
+            raise SystemExit(f"Снапшот не найден: {args.output}")
+        for key, value in snapshot_metadata(args.output).items():
+            print(f"{key}: {value}")
+        return
+
+    from scripts.catalog_versions import archive_snapshot
+
+    items = read_csv(args.csv)
+    version = write_snapshot(items, args.output, source=args.csv.name)
+    archive_snapshot(args.output)
+    print(f"Снапшот {args.output}: {len(items)} позиций, версия {version}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
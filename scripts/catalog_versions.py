@@ -0,0 +1,222 @@
+"""Point-in-time price catalog: archived snapshots indexed by their validity interval.
+
+Each published snapshot is copied to ``VERSIONS_DIR`` as
+``<valid_from UTC>_<catalog_version>.arrow``; a version is in force from its
+``valid_from`` until the next one starts. Versions are loaded lazily into
+``code -> row`` dicts and identical rows are shared between versions, so
+keeping a year of monthly price lists costs little more than the rows that
+actually changed.
+"""
+
+import argparse
+import logging
+import os
+import re
+import shutil
+import sys
+from bisect import bisect_right
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from scripts.catalog_snapshot import BASE_DIR, CLINICS_DIR, SNAPSHOT_PATH, read_snapshot, snapshot_metadata
+
+VERSIONS_DIR = Path(os.getenv("PRICING_VERSIONS_DIR", BASE_DIR / "storage" / "catalog_versions"))
+CLINIC_VERSIONS_DIRNAME = "catalog_versions"
+_VERSION_FILE = re.compile(r"^(\d{8}T\d{6}Z)_([0-9a-f]+)\.arrow$")
+_STAMP_FORMAT = "%Y%m%dT%H%M%SZ"
+
+_history: Optional["CatalogHistory"] = None
+
+
+class CatalogRow(NamedTuple):
+    section: str
+    code: str
+    display_name: str
+    base_price: float
+
+
+class VersionEntry(NamedTuple):
+    valid_from: datetime
+    version: str
+    path: Path
+
+
+def as_utc(value: datetime) -> datetime:
+    # Наивные даты (db.TreatmentPlan.created_at) хранятся в UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def list_versions(versions_dir: Path = VERSIONS_DIR) -> List[VersionEntry]:
+    if not versions_dir.exists():
+        return []
+    entries = []
+    for path in versions_dir.iterdir():
+        match = _VERSION_FILE.match(path.name)
+        if match:
+            valid_from = datetime.strptime(match.group(1), _STAMP_FORMAT).replace(tzinfo=timezone.utc)
+            entries.append(VersionEntry(valid_from, match.group(2), path))
+    return sorted(entries)
+
+
+def clinic_versions_dir(clinic_dir: Path) -> Path:
+    return clinic_dir / CLINIC_VERSIONS_DIRNAME
+
+
+def versions_dir_for(snapshot_path: Path) -> Optional[Path]:
+    """Archive of a published snapshot: the deployment's or its clinic's; None for scratch snapshots."""
+    snapshot_path = snapshot_path.resolve()
+    if snapshot_path == SNAPSHOT_PATH.resolve():
+        return VERSIONS_DIR
+    if snapshot_path.name == SNAPSHOT_PATH.name and snapshot_path.parent.parent == CLINICS_DIR.resolve():
+        return clinic_versions_dir(snapshot_path.parent)
+    return None
+
+
+def archive_snapshot(
+    snapshot_path: Path = SNAPSHOT_PATH,
+    valid_from: Optional[datetime] = None,
+    versions_dir: Path = VERSIONS_DIR,
+) -> Optional[Path]:
+    """Add the snapshot to the archive unless the same catalog version is already the latest one.
+
+    With an explicit ``valid_from`` the latest entry of the same version is
+    re-dated instead — e.g. to schedule a price list the extractor has just
+    published.
+    """
+    version = snapshot_metadata(snapshot_path).get("catalog_version", "")
+    existing = list_versions(versions_dir)
+    latest = existing[-1] if existing and existing[-1].version == version else None
+    if latest is not None and valid_from is None:
+        return None
+    valid_from = as_utc(valid_from or datetime.now(timezone.utc))
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    target = versions_dir / f"{valid_from.strftime(_STAMP_FORMAT)}_{version}.arrow"
+    if latest is not None:
+        os.replace(latest.path, target)
+        logging.info("Catalog version %s re-dated to %s", version, valid_from.isoformat())
+        return target
+    tmp_path = target.with_name(target.name + ".tmp")
+    shutil.copyfile(snapshot_path, tmp_path)
+    os.replace(tmp_path, target)
+    logging.info("Catalog version %s archived, valid from %s", version, valid_from.isoformat())
+    return target
+
+
+class CatalogHistory:
+    """Validity-interval index over the archived versions with row sharing between them."""
+
+    def __init__(self, versions_dir: Path = VERSIONS_DIR):
+        self.versions_dir = versions_dir
+        self._entries: List[VersionEntry] = []
+        self._starts: List[datetime] = []
+        self._signature: Optional[Tuple[str, ...]] = None
+        self._items: Dict[str, Dict[str, CatalogRow]] = {}
+        self._rows: Dict[CatalogRow, CatalogRow] = {}
+
+    def refresh(self) -> None:
+        entries = list_versions(self.versions_dir)
+        signature = tuple(entry.path.name for entry in entries)
+        if signature == self._signature:
+            return
+        self._entries = entries
+        self._starts = [entry.valid_from for entry in entries]
+        self._signature = signature
+        present = {entry.version for entry in entries}
+        self._items = {version: items for version, items in self._items.items() if version in present}
+
+    @property
+    def entries(self) -> List[VersionEntry]:
+        self.refresh()
+        return list(self._entries)
+
+    def entry_at(self, at: datetime) -> Optional[VersionEntry]:
+        self.refresh()
+        position = bisect_right(self._starts, as_utc(at)) - 1
+        return self._entries[position] if position >= 0 else None
+
+    def items_at(self, at: datetime) -> Optional[Dict[str, CatalogRow]]:
+        """code -> row of the version in force at ``at``; None if ``at`` predates the archive."""
+        entry = self.entry_at(at)
+        if entry is None:
+            return None
+        if entry.version not in self._items:
+            self._items[entry.version] = self._load(entry.path)
+        return self._items[entry.version]
+
+    def _load(self, path: Path) -> Dict[str, CatalogRow]:
+        table = read_snapshot(path)
+        items: Dict[str, CatalogRow] = {}
+        for section, code, name, price in zip(
+            table.column("section").to_pylist(),
+            table.column("code").to_pylist(),
+            table.column("display_name").to_pylist(),
+            table.column("base_price").to_pylist(),
+        ):
+            row = CatalogRow(sys.intern(section or ""), code, name or "", float(price))
+            # Неизменившиеся позиции — один и тот же объект во всех версиях
+            items[code] = self._rows.setdefault(row, row)
+        logging.info("Catalog version loaded from %s: %s rows, %s distinct rows total", path, len(items), len(self._rows))
+        return items
+
+
+def catalog_history() -> CatalogHistory:
+    global _history
+    if _history is None:
+        _history = CatalogHistory()
+    return _history
+
+
+def items_as_of(
+    codes: Sequence[str],
+    at: datetime,
+    history: Optional[CatalogHistory] = None,
+) -> Optional[Dict[str, Dict[str, object]]]:
+    """Catalog rows for ``codes`` as priced at ``at``; None if no archived version covers that date."""
+    items = (history or catalog_history()).items_at(at)
+    if items is None:
+        return None
+    return {code: items[code]._asdict() for code in codes if code in items}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Архив версий прайса по датам действия")
+    parser.add_argument("--archive", action="store_true", help="Добавить текущий снапшот в архив")
+    parser.add_argument("--snapshot", type=Path, default=SNAPSHOT_PATH, help="Arrow-снапшот для архива")
+    parser.add_argument(
+        "--versions-dir",
+        type=Path,
+        help="Архив версий (по умолчанию PRICING_VERSIONS_DIR, для снапшота клиники — её catalog_versions)",
+    )
+    parser.add_argument("--valid-from", type=datetime.fromisoformat, help="Дата начала действия (ISO, по умолчанию сейчас)")
+    parser.add_argument("--as-of", type=datetime.fromisoformat, help="Показать цены на дату (ISO)")
+    parser.add_argument("codes", nargs="*", help="Коды для --as-of")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    versions_dir = args.versions_dir or versions_dir_for(args.snapshot) or VERSIONS_DIR
+    history = catalog_history() if versions_dir == VERSIONS_DIR else CatalogHistory(versions_dir)
+
+    if args.archive:
+        target = archive_snapshot(args.snapshot, args.valid_from, versions_dir)
+        print(f"Версия добавлена: {target}" if target else "Эта версия прайса уже действует — архив не изменён")
+        return
+    if args.as_of:
+        entry = history.entry_at(args.as_of)
+        found = items_as_of(args.codes, args.as_of, history)
+        if entry is None or found is None:
+            raise SystemExit(f"Нет версии прайса на {args.as_of.isoformat()}")
+        print(f"Версия {entry.version} (действует с {entry.valid_from.isoformat()})")
+        for code in args.codes:
+            item = found.get(code)
+            print(f"{code}: {item['display_name']} | {item['base_price']} ₽" if item else f"{code}: нет в этой версии")
+        return
+
+    for entry in list_versions(versions_dir):
+        print(f"{entry.valid_from.isoformat()}  {entry.version}  {entry.path.name}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
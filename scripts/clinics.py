@@ -0,0 +1,297 @@
+"""Per-clinic price catalogs loaded on demand and kept in a memory-bounded LRU.
+
+The default clinic is the deployment's own catalog (``PRICING_CSV_PATH`` /
+``PRICING_SNAPSHOT_PATH`` / ``QDRANT_COLLECTION``) and stays resident as
+before. Every other clinic lives in ``PRICING_CLINICS_DIR/<clinic_id>/`` with
+the same staging CSV / Arrow snapshot file names and its own Qdrant alias
+``<QDRANT_COLLECTION>_<clinic_id>``. Its compact catalog and autocomplete
+index are built on first request, reloaded when its files change, and the
+least recently used clinics are evicted once ``CLINIC_CACHE_MAX_MB`` is
+exceeded.
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from db.pricing import PricingRepository
+from scripts.autocomplete import AutocompleteIndex, load_autocomplete_index
+from scripts.catalog_snapshot import CLINICS_DIR, CSV_PATH, SNAPSHOT_PATH, source_signature
+from scripts.catalog_versions import VERSIONS_DIR, CatalogHistory, catalog_history, clinic_versions_dir
+from scripts.compact_catalog import CompactCatalog, catalog_source, load_compact_catalog, read_compact_catalog
+from scripts.search_price import COLLECTION
+
+DEFAULT_CLINIC_ID = os.getenv("DEFAULT_CLINIC_ID", "default")
+CLINIC_CACHE_MAX_BYTES = int(float(os.getenv("CLINIC_CACHE_MAX_MB", "512")) * 1024 * 1024)
+CLINIC_REPO_CACHE_SIZE = int(os.getenv("CLINIC_REPO_CACHE_SIZE", "32"))
+CLINIC_SLUGS_TTL_SECONDS = float(os.getenv("CLINIC_SLUGS_TTL_SECONDS", "60"))
+_CLINIC_ID_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+_registry: Optional["ClinicRegistry"] = None
+_repositories: Optional["ClinicRepositories"] = None
+_histories: Dict[str, CatalogHistory] = {}
+
+
+class UnknownClinicError(LookupError):
+    pass
+
+
+@dataclass(frozen=True)
+class ClinicPaths:
+    clinic_id: str
+    csv_path: Path
+    snapshot_path: Path
+    collection: str
+    versions_dir: Path
+
+
+def is_default_clinic(clinic_id: Optional[str]) -> bool:
+    return not clinic_id or clinic_id == DEFAULT_CLINIC_ID
+
+
+def check_clinic_id(clinic_id: str) -> str:
+    if not _CLINIC_ID_RE.match(clinic_id):
+        raise UnknownClinicError(f"Некорректный идентификатор клиники: {clinic_id!r}")
+    return clinic_id
+
+
+def clinic_paths(clinic_id: Optional[str]) -> ClinicPaths:
+    if is_default_clinic(clinic_id):
+        return ClinicPaths(DEFAULT_CLINIC_ID, CSV_PATH, SNAPSHOT_PATH, COLLECTION, VERSIONS_DIR)
+    check_clinic_id(clinic_id)
+    clinic_dir = CLINICS_DIR / clinic_id
+    if not clinic_dir.is_dir():
+        raise UnknownClinicError(f"Клиника {clinic_id} не найдена в {CLINICS_DIR}")
+    return ClinicPaths(
+        clinic_id,
+        clinic_dir / CSV_PATH.name,
+        clinic_dir / SNAPSHOT_PATH.name,
+        f"{COLLECTION}_{clinic_id}",
+        clinic_versions_dir(clinic_dir),
+    )
+
+
+def list_clinics(clinics_dir: Path = CLINICS_DIR) -> List[str]:
+    if not clinics_dir.exists():
+        return []
+    return sorted(path.name for path in clinics_dir.iterdir() if path.is_dir() and _CLINIC_ID_RE.match(path.name))
+
+
+class ClinicIndex:
+    """Compact catalog of one clinic plus its lazily built autocomplete index."""
+
+    def __init__(self, paths: ClinicPaths, signature: Tuple[str, int, int], catalog: CompactCatalog):
+        self.paths = paths
+        self.signature = signature
+        self.catalog = catalog
+        self.autocomplete: Optional[AutocompleteIndex] = None
+        self.bytes = catalog.memory_report()["bytes"]
+
+
+class ClinicRegistry:
+    """LRU of ``ClinicIndex`` bounded by the estimated bytes of the loaded indexes."""
+
+    def __init__(self, max_bytes: int = CLINIC_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, ClinicIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0, "evicted_bytes": 0}
+
+    def get(self, clinic_id: str) -> ClinicIndex:
+        paths = clinic_paths(clinic_id)
+        source = catalog_source(paths.csv_path, paths.snapshot_path)
+        signature = source_signature(source)
+        with self._lock:
+            entry = self._entries.get(paths.clinic_id)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(paths.clinic_id)
+                self.stats["hits"] += 1
+                return entry
+            load_lock = self._load_locks.setdefault(paths.clinic_id, threading.Lock())
+        # Прайс клиники грузим вне общего замка: остальные клиники обслуживаются параллельно
+        with load_lock:
+            with self._lock:
+                current = self._entries.get(paths.clinic_id)
+                if current is not None and current.signature == signature:
+                    self.stats["hits"] += 1
+                    return current
+            entry = ClinicIndex(paths, signature, read_compact_catalog(source, paths.snapshot_path))
+            with self._lock:
+                self.stats["reloads" if paths.clinic_id in self._entries else "misses"] += 1
+                self._entries[paths.clinic_id] = entry
+                self._entries.move_to_end(paths.clinic_id)
+                self._evict()
+        return entry
+
+    def autocomplete(self, clinic_id: str) -> AutocompleteIndex:
+        entry = self.get(clinic_id)
+        index = entry.autocomplete
+        if index is None:
+            index = entry.autocomplete = AutocompleteIndex(entry.catalog)
+            with self._lock:
+                entry.bytes += index.memory_bytes()
+                self._evict()
+        return index
+
+    def _evict(self) -> None:
+        # Последнюю использованную клинику не выселяем, даже если она одна больше лимита
+        while len(self._entries) > 1 and self._total_bytes() > self.max_bytes:
+            clinic_id, entry = self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+            self.stats["evicted_bytes"] += entry.bytes
+            logging.info("Clinic catalog %s evicted (%s bytes, %s clinics resident)", clinic_id, entry.bytes, len(self._entries))
+
+    def _total_bytes(self) -> int:
+        return sum(entry.bytes for entry in self._entries.values())
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            resident = [
+                {"clinic_id": clinic_id, "items": len(entry.catalog), "bytes": entry.bytes, "version": entry.catalog.version}
+                for clinic_id, entry in self._entries.items()
+            ]
+            stats = dict(self.stats)
+        requests = stats["hits"] + stats["misses"] + stats["reloads"]
+        return {
+            **stats,
+            "hit_ratio": round(stats["hits"] / requests, 4) if requests else None,
+            "resident": resident,
+            "resident_bytes": sum(entry["bytes"] for entry in resident),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class ClinicRepositories:
+    """LRU of Postgres repositories of the clinics, keyed by ``price_catalog.slug``.
+
+    Only slugs present in the database are accepted; the slug list is re-read
+    at most every ``CLINIC_SLUGS_TTL_SECONDS``, so unknown header values cost
+    neither memory nor a query per request.
+    """
+
+    def __init__(
+        self,
+        base: PricingRepository,
+        max_entries: int = CLINIC_REPO_CACHE_SIZE,
+        slugs_ttl: float = CLINIC_SLUGS_TTL_SECONDS,
+    ):
+        self.base = base
+        self.max_entries = max_entries
+        self.slugs_ttl = slugs_ttl
+        self._entries: "OrderedDict[str, PricingRepository]" = OrderedDict()
+        self._slugs: Tuple[float, frozenset] = (float("-inf"), frozenset())
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0, "rejected": 0}
+
+    def get(self, clinic_id: str) -> PricingRepository:
+        check_clinic_id(clinic_id)
+        with self._lock:
+            repo = self._entries.get(clinic_id)
+            if repo is not None:
+                self._entries.move_to_end(clinic_id)
+                self.stats["hits"] += 1
+                return repo
+        if clinic_id not in self._known_slugs():
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise UnknownClinicError(f"Каталог клиники {clinic_id} не найден в pricing.price_catalog")
+        with self._lock:
+            repo = self._entries.get(clinic_id)
+            if repo is None:
+                repo = self._entries[clinic_id] = PricingRepository(engine=self.base.engine, catalog=clinic_id)
+                self.stats["misses"] += 1
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+                    logging.info("Clinic repository %s evicted (%s resident)", evicted, len(self._entries))
+            self._entries.move_to_end(clinic_id)
+            return repo
+
+    def _known_slugs(self) -> frozenset:
+        loaded_at, slugs = self._slugs
+        if time.monotonic() - loaded_at >= self.slugs_ttl:
+            slugs = frozenset(self.base.catalog_slugs())
+            self._slugs = (time.monotonic(), slugs)
+        return slugs
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "resident": list(self._entries), "max_entries": self.max_entries}
+
+
+def clinic_repositories(base: PricingRepository) -> ClinicRepositories:
+    global _repositories
+    if _repositories is None or _repositories.base is not base:
+        _repositories = ClinicRepositories(base)
+    return _repositories
+
+
+def clinic_registry() -> ClinicRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ClinicRegistry()
+    return _registry
+
+
+def clinic_catalog(clinic_id: Optional[str] = None) -> CompactCatalog:
+    if is_default_clinic(clinic_id):
+        return load_compact_catalog()
+    return clinic_registry().get(clinic_id).catalog
+
+
+def clinic_autocomplete(clinic_id: Optional[str] = None) -> AutocompleteIndex:
+    if is_default_clinic(clinic_id):
+        return load_autocomplete_index()
+    return clinic_registry().autocomplete(clinic_id)
+
+
+def clinic_history(clinic_id: Optional[str] = None) -> CatalogHistory:
+    """Archived versions of the clinic's price list (``<clinic dir>/catalog_versions``)."""
+    if is_default_clinic(clinic_id):
+        return catalog_history()
+    paths = clinic_paths(clinic_id)
+    # Ключи — только существующие каталоги клиник, поэтому словарь ограничен их числом
+    history = _histories.get(paths.clinic_id)
+    if history is None:
+        history = _histories[paths.clinic_id] = CatalogHistory(paths.versions_dir)
+    return history
+
+
+def clinic_collection(clinic_id: Optional[str] = None) -> str:
+    return clinic_paths(clinic_id).collection
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Прайсы клиник: список и пробная загрузка через LRU")
+    parser.add_argument("clinics", nargs="*", help="Клиники для загрузки (по умолчанию все из PRICING_CLINICS_DIR)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    registry = clinic_registry()
+    for clinic_id in args.clinics or list_clinics():
+        started = time.perf_counter()
+        entry = registry.get(clinic_id)
+        print(
+            f"{clinic_id}: {len(entry.catalog)} позиций, {entry.bytes} байт, "
+            f"коллекция {entry.paths.collection}, {time.perf_counter() - started:.3f} с"
+        )
+    metrics = registry.metrics()
+    print(
+        f"В памяти: {len(metrics['resident'])} клиник, {metrics['resident_bytes']} из {metrics['max_bytes']} байт; "
+        f"выселено {metrics['evictions']}"
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
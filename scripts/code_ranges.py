@@ -0,0 +1,65 @@
+"""Six-digit service code prefixes and ranges as sorted numeric intervals.
+
+Codes share a fixed width, so "all codes under 8091" is the half-open interval
+[809100, 809200): prefix and range checks become binary searches instead of
+string scans.
+"""
+
+import re
+from bisect import bisect_right
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+CODE_WIDTH = 6
+# "8091xx", "8091**", "809*" — кириллическая «х» тоже встречается
+CODE_PATTERN_RE = re.compile(r"^\s*(\d{1,5})(?:[xXхХ]+|\*+)\s*$")
+
+
+def prefix_bounds(prefix: str, width: int = CODE_WIDTH) -> Tuple[int, int]:
+    """Half-open numeric interval of all ``width``-digit codes starting with ``prefix``."""
+    prefix = prefix.strip()
+    if not prefix:
+        return 0, 10 ** width
+    if not prefix.isdigit() or len(prefix) > width:
+        raise ValueError(f"Некорректный префикс кода: {prefix!r}")
+    scale = 10 ** (width - len(prefix))
+    return int(prefix) * scale, (int(prefix) + 1) * scale
+
+
+def code_number(code: str, width: int = CODE_WIDTH) -> Optional[int]:
+    code = str(code).strip()
+    return int(code) if len(code) == width and code.isdigit() else None
+
+
+def parse_code_pattern(raw: str) -> Optional[str]:
+    """'8091xx' / '809*' -> '8091' / '809'; None for anything else."""
+    match = CODE_PATTERN_RE.match(raw or "")
+    return match.group(1) if match else None
+
+
+class CodeRanges:
+    """Membership test for a union of prefixes and inclusive code ranges in O(log m)."""
+
+    def __init__(self, prefixes: Iterable[str] = (), ranges: Iterable[Tuple[str, str]] = ()):
+        intervals = [prefix_bounds(prefix) for prefix in prefixes]
+        intervals += [(int(start), int(end) + 1) for start, end in ranges]
+        merged: List[List[int]] = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._starts = [start for start, _ in merged]
+        self._ends = [end for _, end in merged]
+
+    def __bool__(self) -> bool:
+        return bool(self._starts)
+
+    def __contains__(self, code: object) -> bool:
+        number = code_number(code) if isinstance(code, str) else None
+        if number is None:
+            return False
+        pos = bisect_right(self._starts, number) - 1
+        return pos >= 0 and number < self._ends[pos]
+
+    def select(self, codes: Sequence[str]) -> List[str]:
+        return [code for code in codes if code in self]
@@ -0,0 +1,298 @@
+"""Compact in-process price catalog shared by the API, the bot and the agent.
+
+Columns are flat arrays sorted by code: six-digit codes as ``uint32`` (binary
+search instead of a hash table of strings), prices as ``float64``, sections
+dictionary-coded into small integer ids, and display names concatenated into
+one string with an offsets array. Rows are exposed through ``CatalogItem``
+views with ``__slots__`` that read the columns on access, so no per-item dict
+or DataFrame row is kept alive.
+"""
+
+import argparse
+import csv
+import logging
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from scripts.catalog_snapshot import (
+    CSV_PATH,
+    SNAPSHOT_PATH,
+    read_snapshot,
+    rows_version,
+    source_signature,
+    use_snapshot,
+)
+from scripts.code_ranges import CODE_WIDTH, prefix_bounds
+
+ITEM_FIELDS = ("code", "display_name", "base_price", "section", "score")
+
+_compact_cache: Optional[Tuple[Tuple[str, int, int], "CompactCatalog"]] = None
+
+Row = Tuple[str, str, str, float]
+
+
+class CatalogItem:
+    """Read-only view of one catalog row; supports ``item["code"]``, ``item.get`` and ``{**item}``."""
+
+    __slots__ = ("_catalog", "_pos")
+
+    def __init__(self, catalog: "CompactCatalog", pos: int):
+        self._catalog = catalog
+        self._pos = pos
+
+    @property
+    def code(self) -> str:
+        return self._catalog.code_at(self._pos)
+
+    @property
+    def display_name(self) -> str:
+        return self._catalog.name_at(self._pos)
+
+    @property
+    def base_price(self) -> float:
+        return self._catalog.prices[self._pos]
+
+    @property
+    def section(self) -> str:
+        return self._catalog.sections[self._catalog.section_ids[self._pos]]
+
+    @property
+    def score(self) -> None:
+        return None
+
+    def keys(self) -> Tuple[str, ...]:
+        return ITEM_FIELDS
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in ITEM_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in ITEM_FIELDS else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in ITEM_FIELDS}
+
+    def __repr__(self) -> str:
+        return f"CatalogItem({self.code!r}, {self.display_name!r}, {self.base_price})"
+
+
+class CompactCatalog:
+    """Catalog columns sorted by code; read-only mapping ``code -> CatalogItem``."""
+
+    __slots__ = ("codes", "prices", "section_ids", "sections", "_names", "_name_offsets", "_numeric", "source", "version")
+
+    def __init__(self, rows: Iterable[Row], source: str = "", version: str = ""):
+        unique: List[Row] = []
+        seen = set()
+        for row in rows:
+            if row[1] not in seen:
+                seen.add(row[1])
+                unique.append(row)
+        unique.sort(key=lambda row: row[1])
+
+        codes = [row[1] for row in unique]
+        self._numeric = all(len(code) == CODE_WIDTH and code.isdigit() for code in codes)
+        # Коды прайса — ровно 6 цифр: 4 байта на код и тот же порядок, что у строк
+        self.codes: Union[array, List[str]] = array("I", map(int, codes)) if self._numeric else codes
+        self.prices = array("d", (row[3] for row in unique))
+
+        section_index: Dict[str, int] = {}
+        self.sections: List[str] = []
+        ids: List[int] = []
+        for row in unique:
+            section = row[0]
+            if section not in section_index:
+                section_index[section] = len(self.sections)
+                self.sections.append(sys.intern(section))
+            ids.append(section_index[section])
+        self.section_ids = array("H" if len(self.sections) <= 0xFFFF else "I", ids)
+
+        offsets = array("I", [0])
+        for row in unique:
+            offsets.append(offsets[-1] + len(row[2]))
+        self._names = "".join(row[2] for row in unique)
+        self._name_offsets = offsets
+        self.source = source
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.code_at(pos) for pos in range(len(self)))
+
+    def __contains__(self, code: object) -> bool:
+        return isinstance(code, str) and self.position(code) is not None
+
+    def __getitem__(self, code: str) -> CatalogItem:
+        pos = self.position(code)
+        if pos is None:
+            raise KeyError(code)
+        return CatalogItem(self, pos)
+
+    def get(self, code: str, default: Any = None) -> Any:
+        pos = self.position(code)
+        return CatalogItem(self, pos) if pos is not None else default
+
+    def position(self, code: str) -> Optional[int]:
+        """Index of ``code`` in the sorted columns (binary search) or None."""
+        code = str(code).strip()
+        if self._numeric:
+            if len(code) != CODE_WIDTH or not code.isdigit():
+                return None
+            key: Any = int(code)
+        else:
+            key = code
+        pos = bisect_left(self.codes, key)
+        if pos < len(self.codes) and self.codes[pos] == key:
+            return pos
+        return None
+
+    def prefix_slice(self, prefix: str) -> Tuple[int, int]:
+        """[start, end) positions of the codes starting with ``prefix`` — two binary searches."""
+        prefix = str(prefix).strip()
+        if not self._numeric:
+            return bisect_left(self.codes, prefix), bisect_left(self.codes, prefix + "\U0010ffff")
+        try:
+            low, high = prefix_bounds(prefix)
+        except ValueError:
+            return 0, 0
+        return bisect_left(self.codes, low), bisect_left(self.codes, high)
+
+    def range_slice(self, start: str, end: str) -> Tuple[int, int]:
+        """[start, end) positions of the codes between ``start`` and ``end`` inclusive."""
+        low: Any = int(start) if self._numeric else start
+        high: Any = int(end) if self._numeric else end
+        return bisect_left(self.codes, low), bisect_right(self.codes, high)
+
+    def slice_items(self, bounds: Tuple[int, int], limit: Optional[int] = None) -> List[CatalogItem]:
+        start, end = bounds
+        if limit is not None:
+            end = min(end, start + limit)
+        return [CatalogItem(self, pos) for pos in range(start, end)]
+
+    def with_prefix(self, prefix: str, limit: Optional[int] = None) -> List[CatalogItem]:
+        """Items whose code starts with ``prefix`` in code order: O(log n + k)."""
+        return self.slice_items(self.prefix_slice(prefix), limit)
+
+    def code_at(self, pos: int) -> str:
+        return f"{self.codes[pos]:0{CODE_WIDTH}d}" if self._numeric else self.codes[pos]
+
+    def name_at(self, pos: int) -> str:
+        return self._names[self._name_offsets[pos]:self._name_offsets[pos + 1]]
+
+    def items_for(self, codes: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """code -> plain dict for the requested codes present in the catalog."""
+        found: Dict[str, Dict[str, Any]] = {}
+        for code in codes:
+            item = self.get(code)
+            if item is not None:
+                found[code] = item.to_dict()
+        return found
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Bytes held by the catalog columns, total and per item."""
+        arrays = sum(sys.getsizeof(column) for column in (self.codes, self.prices, self.section_ids, self._name_offsets))
+        if not self._numeric:
+            arrays += sum(sys.getsizeof(code) for code in self.codes)
+        strings = sys.getsizeof(self._names) + sys.getsizeof(self.sections)
+        strings += sum(sys.getsizeof(section) for section in self.sections)
+        total = arrays + strings
+        return {
+            "items": len(self),
+            "sections": len(self.sections),
+            "bytes": total,
+            "bytes_per_item": round(total / len(self), 1) if len(self) else 0.0,
+            "names_bytes": sys.getsizeof(self._names),
+        }
+
+    def info(self) -> Dict[str, Any]:
+        return {"source": self.source, "rows": len(self), "version": self.version}
+
+
+def _snapshot_rows(path: Path) -> Tuple[List[Row], str]:
+    table = read_snapshot(path)
+    version = (table.schema.metadata or {}).get(b"catalog_version", b"").decode("utf-8")
+    rows = [
+        (section or "", code, name or "", float(price))
+        for section, code, name, price in zip(
+            table.column("section").to_pylist(),
+            table.column("code").to_pylist(),
+            table.column("display_name").to_pylist(),
+            table.column("base_price").to_pylist(),
+        )
+    ]
+    return rows, version
+
+
+def _csv_rows(path: Path) -> Tuple[List[Row], str]:
+    with path.open("r", encoding="utf-8-sig", newline="") as fh:
+        rows = [
+            (row.get("section") or "", str(row["code"]).strip(), row.get("display_name") or "", float(row["base_price"]))
+            for row in csv.DictReader(fh)
+        ]
+    return rows, rows_version(rows)
+
+
+def catalog_source(csv_path: Path = CSV_PATH, snapshot_path: Path = SNAPSHOT_PATH) -> Path:
+    """The file the catalog is read from: the snapshot when it is current, else the CSV."""
+    source = snapshot_path if use_snapshot(snapshot_path, csv_path) else csv_path
+    if not source.exists():
+        raise FileNotFoundError(f"Не найден прайс: {snapshot_path} / {csv_path}")
+    return source
+
+
+def read_compact_catalog(source: Path, snapshot_path: Path = SNAPSHOT_PATH) -> CompactCatalog:
+    rows, version = _snapshot_rows(source) if source == snapshot_path else _csv_rows(source)
+    catalog = CompactCatalog(rows, source=str(source), version=version)
+    report = catalog.memory_report()
+    logging.info(
+        "Compact catalog loaded from %s: %s items, %s bytes/item, version %s",
+        source,
+        report["items"],
+        report["bytes_per_item"],
+        version,
+    )
+    return catalog
+
+
+def load_compact_catalog(csv_path: Path = CSV_PATH, snapshot_path: Path = SNAPSHOT_PATH) -> CompactCatalog:
+    """The catalog in compact form, rebuilt only when the snapshot/CSV changes on disk."""
+    global _compact_cache
+    source = catalog_source(csv_path, snapshot_path)
+    signature = source_signature(source)
+    if _compact_cache is None or _compact_cache[0] != signature:
+        _compact_cache = (signature, read_compact_catalog(source, snapshot_path))
+    return _compact_cache[1]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Память компактного каталога прайса")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="Путь до staging CSV")
+    parser.add_argument("--snapshot", type=Path, default=SNAPSHOT_PATH, help="Arrow-снапшот")
+    parser.add_argument("--compare", action="store_true", help="Сравнить с DataFrame (нужен pandas)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    catalog = load_compact_catalog(args.csv, args.snapshot)
+    report = catalog.memory_report()
+    print(f"Источник: {catalog.source}, версия {catalog.version}")
+    print(f"Позиций: {report['items']}, разделов: {report['sections']}")
+    print(f"Память: {report['bytes']} байт, {report['bytes_per_item']} байт на позицию")
+    if args.compare and len(catalog):
+        from scripts.catalog_snapshot import load_catalog
+
+        frame = load_catalog(args.csv, args.snapshot)
+        frame_bytes = int(frame.memory_usage(deep=True).sum())
+        print(f"DataFrame: {frame_bytes} байт, {frame_bytes / len(frame):.1f} байт на позицию")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
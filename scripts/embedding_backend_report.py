@@ -0,0 +1,145 @@
+"""Parity and latency of the ONNX int8 encoder against the PyTorch SentenceTransformer."""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from scripts.embeddings import CachedEncoder, EmbeddingCache, OnnxEncoder, export_onnx, onnx_model_dir
+from scripts.ingest_pricing import CSV_PATH, MODEL_NAME, load_catalog
+from scripts.quantization_report import default_queries
+
+DEFAULT_K = 10
+DEFAULT_MAX_QUERIES = 300
+DEFAULT_MIN_COSINE = 0.99
+BATCH_SIZE = 64
+
+
+def cosine_rows(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    left = left / np.linalg.norm(left, axis=1, keepdims=True)
+    right = right / np.linalg.norm(right, axis=1, keepdims=True)
+    return np.sum(left * right, axis=1)
+
+
+def top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    docs = doc_vectors / np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+    queries = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+
+
+def single_query_latency(encoder: Any, queries: List[str]) -> Dict[str, float]:
+    encoder.encode(queries[0])
+    latencies: List[float] = []
+    for query in queries:
+        started = time.perf_counter()
+        encoder.encode(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50": round(float(np.percentile(latencies, 50)), 3),
+        "p95": round(float(np.percentile(latencies, 95)), 3),
+        "mean": round(float(np.mean(latencies)), 3),
+    }
+
+
+def batch_throughput(encoder: Any, texts: List[str]) -> float:
+    started = time.perf_counter()
+    encoder.encode(texts, batch_size=BATCH_SIZE)
+    return round(len(texts) / (time.perf_counter() - started), 1)
+
+
+def summarize(cosines: np.ndarray) -> Dict[str, float]:
+    return {
+        "mean": round(float(np.mean(cosines)), 5),
+        "min": round(float(np.min(cosines)), 5),
+        "p01": round(float(np.percentile(cosines, 1)), 5),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Отчёт: ONNX int8 энкодер против PyTorch")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="Путь до staging CSV")
+    parser.add_argument("--model", default=MODEL_NAME, help="Модель эмбеддингов")
+    parser.add_argument("--queries", type=Path, help="Файл с запросами, по одному на строку")
+    parser.add_argument("--max-queries", type=int, default=DEFAULT_MAX_QUERIES)
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="Глубина сравнения top-k")
+    parser.add_argument("--export", action="store_true", help="Пересоздать ONNX-экспорт перед проверкой")
+    parser.add_argument("--fp32", action="store_true", help="Проверять ONNX без int8-квантизации")
+    parser.add_argument(
+        "--min-cosine",
+        type=float,
+        default=DEFAULT_MIN_COSINE,
+        help="Минимальный средний косинус с PyTorch; ниже — код выхода 1",
+    )
+    parser.add_argument("--output", type=Path, help="Куда сохранить JSON-отчёт")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+
+    items = load_catalog(args.csv)
+    if args.queries:
+        queries = [line.strip() for line in args.queries.read_text(encoding="utf-8").splitlines() if line.strip()]
+    else:
+        queries = default_queries(items, args.max_queries)
+    texts = items["text"].tolist()
+
+    model_dir = onnx_model_dir(args.model)
+    if args.fp32:
+        model_dir = model_dir.with_name(model_dir.name + "_fp32")
+    if args.export or not (model_dir / "export.json").exists():
+        export_onnx(args.model, model_dir, quantize=not args.fp32)
+    onnx_encoder = OnnxEncoder(args.model, model_dir)
+    torch_encoder = SentenceTransformer(args.model, device="cpu")
+
+    torch_queries = np.asarray(torch_encoder.encode(queries, batch_size=BATCH_SIZE), dtype=np.float32)
+    onnx_queries = onnx_encoder.encode(queries, batch_size=BATCH_SIZE)
+    torch_docs = CachedEncoder(args.model, cache=EmbeddingCache()).encode(items["text"], items["content_hash"])
+    onnx_docs = onnx_encoder.encode(texts, batch_size=BATCH_SIZE)
+
+    query_cosines = cosine_rows(torch_queries, onnx_queries)
+    doc_cosines = cosine_rows(torch_docs, onnx_docs)
+    k = min(args.k, len(items))
+    # Индекс остаётся на PyTorch-векторах: сравниваем выдачу для запросов, закодированных каждым бэкендом
+    torch_top = top_k(torch_docs, torch_queries, k)
+    onnx_top = top_k(torch_docs, onnx_queries, k)
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(torch_top, onnx_top)]
+    top1 = float(np.mean(torch_top[:, 0] == onnx_top[:, 0]))
+
+    report = {
+        "model": args.model,
+        "onnx_model": str(model_dir / onnx_encoder.meta["model_file"]),
+        "quantized": bool(onnx_encoder.meta.get("quantized")),
+        "queries": len(queries),
+        "catalog_texts": len(texts),
+        "cosine": {"queries": summarize(query_cosines), "catalog": summarize(doc_cosines)},
+        "retrieval": {"k": k, "overlap_at_k": round(float(np.mean(overlap)), 4), "top1_agreement": round(top1, 4)},
+        "latency_ms": {
+            "torch": single_query_latency(torch_encoder, queries),
+            "onnx": single_query_latency(onnx_encoder, queries),
+        },
+        "throughput_texts_per_second": {
+            "torch": batch_throughput(torch_encoder, texts),
+            "onnx": batch_throughput(onnx_encoder, texts),
+        },
+    }
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(payload, encoding="utf-8")
+    print(payload)
+
+    if report["cosine"]["queries"]["mean"] < args.min_cosine:
+        print(
+            f"Средний косинус {report['cosine']['queries']['mean']} ниже порога {args.min_cosine}",
+            file=sys.stderr,
+        )
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
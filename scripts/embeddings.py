@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from scripts.catalog_snapshot import BASE_DIR
+
+EMBEDDING_CACHE_PATH = Path(
+    os.getenv("EMBEDDING_CACHE_PATH", BASE_DIR / "storage" / "embedding_cache.sqlite")
+)
+DEFAULT_BATCH_SIZE = 64
+# torch — SentenceTransformer как есть; onnx — экспорт в ONNX + динамическая int8-квантизация
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", BASE_DIR / "storage" / "onnx"))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+ONNX_OPSET = 17
+# SQLite ограничивает число параметров в запросе
+_LOOKUP_CHUNK = 500
+
+
+class EmbeddingCache:
+    """Persistent (model, text hash) -> float32 vector store in a single SQLite file."""
+
+    def __init__(self, path: Path = EMBEDDING_CACHE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute(
+            "create table if not exists embeddings ("
+            " model text not null,"
+            " text_hash text not null,"
+            " dim integer not null,"
+            " vector blob not null,"
+            " primary key (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _LOOKUP_CHUNK):
+            chunk = unique[start:start + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"select text_hash, vector from embeddings where model = ? and text_hash in ({placeholders})",
+                [model, *chunk],
+            )
+            for text_hash, blob in rows:
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, np.ndarray]) -> None:
+        self._conn.executemany(
+            "insert or replace into embeddings (model, text_hash, dim, vector) values (?, ?, ?, ?)",
+            (
+                (model, text_hash, int(vector.shape[0]), np.asarray(vector, dtype=np.float32).tobytes())
+                for text_hash, vector in vectors.items()
+            ),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CachedEncoder:
+    """Encodes catalog texts, re-using cached vectors and batching the misses.
+
+    With ``workers > 1`` misses are spread over a sentence-transformers
+    multi-process pool (CPU), which pays off from a few thousand texts.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: int = 1,
+    ):
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self._model: Optional[SentenceTransformer] = None
+
+    @property
+    def model(self) -> SentenceTransformer:
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if self.workers > 1 and len(texts) >= self.batch_size * self.workers:
+            pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+            try:
+                vectors = self.model.encode(texts, batch_size=self.batch_size, pool=pool)
+            finally:
+                self.model.stop_multi_process_pool(pool)
+        else:
+            vectors = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                show_progress_bar=len(texts) > 1000,
+            )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def encode(self, texts: Iterable[str], hashes: Iterable[str]) -> np.ndarray:
+        texts = list(texts)
+        hashes = list(hashes)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        cached = self.cache.get_many(self.model_name, hashes) if self.cache else {}
+        missing = [idx for idx, text_hash in enumerate(hashes) if text_hash not in cached]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            fresh = self._encode([texts[idx] for idx in missing])
+            fresh_by_hash = {hashes[idx]: vector for idx, vector in zip(missing, fresh)}
+            if self.cache:
+                self.cache.put_many(self.model_name, fresh_by_hash)
+            cached.update(fresh_by_hash)
+
+        logging.info(
+            "Embeddings: %s from cache, %s encoded (%s)", len(texts) - len(missing), len(missing), self.model_name
+        )
+        return np.stack([cached[text_hash] for text_hash in hashes])
+
+
+def onnx_model_dir(model_name: str, root: Path = ONNX_MODEL_DIR) -> Path:
+    return root / re.sub(r"[^0-9a-z]+", "_", model_name.lower()).strip("_")
+
+
+def export_onnx(model_name: str, output_dir: Optional[Path] = None, quantize: bool = True) -> Path:
+    """Export the transformer of a sentence-transformers model to ONNX (+ dynamic int8).
+
+    Pooling/normalisation settings and the fast tokenizer are saved next to the
+    graph, so ``OnnxEncoder`` needs neither torch nor sentence-transformers.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers.models import Normalize, Pooling
+
+    output_dir = output_dir or onnx_model_dir(model_name)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+            ).last_hidden_state
+
+    sample = tokenizer(["пример запроса", "удаление зуба"], padding=True, return_tensors="pt")
+    inputs = ("input_ids", "attention_mask", "token_type_ids")
+    fp32_path = output_dir / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer),
+            tuple(sample[name] for name in inputs),
+            str(fp32_path),
+            input_names=list(inputs),
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in (*inputs, "last_hidden_state")},
+            opset_version=ONNX_OPSET,
+            dynamo=False,
+        )
+
+    model_path = fp32_path
+    if quantize:
+        model_path = output_dir / "model_int8.onnx"
+        quantize_dynamic(str(fp32_path), str(model_path), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(str(output_dir))
+    pooling = next(module for module in st_model if isinstance(module, Pooling))
+    meta = {
+        "model_name": model_name,
+        "model_file": model_path.name,
+        "quantized": quantize,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+        "max_seq_length": st_model.max_seq_length,
+        "pooling": pooling.get_config_dict(),
+        "normalize": any(isinstance(module, Normalize) for module in st_model),
+        "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    (output_dir / "export.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    logging.info("Exported %s to %s (%s)", model_name, model_path, "int8" if quantize else "fp32")
+    return output_dir
+
+
+class OnnxEncoder:
+    """ONNX Runtime drop-in for ``SentenceTransformer.encode`` on CPU.
+
+    The export is cached in ``ONNX_MODEL_DIR`` and created on first use.
+    """
+
+    def __init__(self, model_name: str, model_dir: Optional[Path] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.model_dir = model_dir or onnx_model_dir(model_name)
+        if not (self.model_dir / "export.json").exists():
+            export_onnx(model_name, self.model_dir)
+        self.meta: Dict[str, Any] = json.loads((self.model_dir / "export.json").read_text(encoding="utf-8"))
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=int(self.meta["max_seq_length"]))
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(
+            str(self.model_dir / self.meta["model_file"]),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.meta["dimension"])
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        pooling = self.meta["pooling"]
+        if pooling.get("pooling_mode_cls_token"):
+            return hidden[:, 0]
+        if pooling.get("pooling_mode_max_tokens"):
+            return np.where(mask[..., None] > 0, hidden, -1e9).max(axis=1)
+        weights = mask[..., None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        sentences: Union[str, Sequence[str]],
+        batch_size: int = 32,
+        **_: Any,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batches: List[np.ndarray] = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            feed = {
+                "input_ids": np.array([item.ids for item in encodings], dtype=np.int64),
+                "attention_mask": np.array([item.attention_mask for item in encodings], dtype=np.int64),
+                "token_type_ids": np.array([item.type_ids for item in encodings], dtype=np.int64),
+            }
+            feed = {name: value for name, value in feed.items() if name in self.input_names}
+            hidden = self.session.run(["last_hidden_state"], feed)[0]
+            vectors = self._pool(hidden, feed["attention_mask"])
+            if self.meta.get("normalize"):
+                vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+            batches.append(vectors.astype(np.float32))
+        result = np.concatenate(batches) if batches else np.zeros((0, self.get_sentence_embedding_dimension()))
+        return result[0] if single else result
+
+
+def load_encoder(model_name: str, backend: str = EMBEDDING_BACKEND) -> Union[SentenceTransformer, OnnxEncoder]:
+    """Query-time encoder for the configured backend (EMBEDDING_BACKEND)."""
+    if backend == "onnx":
+        return OnnxEncoder(model_name)
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    return SentenceTransformer(model_name)
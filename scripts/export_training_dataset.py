@@ -1,12 +1,14 @@
 import argparse
 import json
+import os
 from pathlib import Path
 from typing import Dict, Any, List
 
 from db import SessionLocal, TreatmentPlan, PlanFeedback
 from db import Session as SessionModel  # noqa: N812
 
-DEFAULT_OUTPUT = Path(r"C:\dent_ai\training\plans.jsonl")
+BASE_DIR = Path(os.getenv("DENT_AI_BASE", Path(__file__).resolve().parents[1]))
+DEFAULT_OUTPUT = BASE_DIR / "training" / "plans.jsonl"
 
 
 def plan_to_text(plan: Dict[str, Any]) -> str:
@@ -1,10 +1,22 @@
-import sys
+import argparse
+import csv
 import ctypes
-import pandas as pd
+import sys
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
 
-SOURCE_PATH = Path(r"C:\dent_ai\pricing_catalog.xlsx")
-OUTPUT_CSV = Path(r"C:\dent_ai\staging_price_items.csv")
+from scripts.catalog_snapshot import BASE_DIR, CSV_PATH, SNAPSHOT_PATH, read_csv, write_snapshot
+from scripts.catalog_versions import archive_snapshot, versions_dir_for
+
+SOURCE_PATH = BASE_DIR / "pricing_catalog.xlsx"
+OUTPUT_COLUMNS = ["section", "code", "display_name", "base_price"]
+ERROR_COLUMNS = ["file", "sheet", "row", "reason", "value"]
+# Строки обрабатываются пачками: векторные операции pandas без загрузки всей книги
+CHUNK_ROWS = 5000
 
 try:
     kernel32 = ctypes.windll.kernel32  # type: ignore[attr-defined]
@@ -16,41 +28,191 @@ except Exception:
 if hasattr(sys.stdout, "reconfigure"):
     sys.stdout.reconfigure(encoding="utf-8")
 
-if not SOURCE_PATH.exists():
-    raise FileNotFoundError(f"Не найден Excel: {SOURCE_PATH}")
-
-df = pd.read_excel(
-    SOURCE_PATH,
-    header=None,
-    names=["section_or_code", "name", "price"],
-    dtype={0: str, 1: str}
-).dropna(how="all")
-
-df["section_or_code"] = df["section_or_code"].astype(str).str.strip()
-df["name"] = df["name"].astype(str).str.strip()
-
-def is_code(value: str) -> bool:
-    return isinstance(value, str) and value.isdigit() and len(value) == 6
-
-section_mask = ~df["section_or_code"].apply(is_code)
-df["section"] = df.loc[section_mask, "section_or_code"].replace({"nan": pd.NA})
-df["section"] = df["section"].ffill()
-
-items = (
-    df.loc[~section_mask]
-      .assign(
-          code=lambda d: d["section_or_code"],
-          display_name=lambda d: d["name"],
-          base_price=lambda d: pd.to_numeric(d["price"], errors="coerce")
-      )
-      .drop(columns=["section_or_code", "name", "price"])
-      .dropna(subset=["base_price"])
-      .reset_index(drop=True)
-)
-
-print("Первые строки:")
-print(items.head(10))
-print(f"Всего услуг: {len(items)}; уникальных разделов: {items['section'].nunique()}")
-
-items.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
-print(f"Сохранено в {OUTPUT_CSV}")
+
+@dataclass
+class ExtractStats:
+    items: int = 0
+    rows: int = 0
+    sections: Set[str] = field(default_factory=set)
+    errors: int = 0
+    per_source: Dict[str, int] = field(default_factory=dict)
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    # Excel хранит коды как числа: 202202 приходит int или float 202202.0
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def iter_rows(path: Path, sheets: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, int, tuple]]:
+    """Yield (sheet, row number, first three cell values) using read-only streaming."""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            if sheets and worksheet.title not in sheets:
+                continue
+            for row_number, values in enumerate(worksheet.iter_rows(max_col=3, values_only=True), start=1):
+                values = tuple(values) + (None,) * (3 - len(values))
+                if all(value is None or _cell_text(value) == "" for value in values):
+                    continue
+                yield worksheet.title, row_number, values
+    finally:
+        workbook.close()
+
+
+def _process_chunk(
+    chunk: List[Tuple[str, int, tuple]],
+    source: str,
+    carry: Tuple[str, str],
+    seen_codes: Set[str],
+    writer,
+    error_writer,
+    stats: ExtractStats,
+) -> Tuple[str, str]:
+    """Validate one chunk of rows, stream good items and errors; return the section carry."""
+    frame = pd.DataFrame(
+        {
+            "sheet": [sheet for sheet, _, _ in chunk],
+            "row": [row for _, row, _ in chunk],
+            "head": [_cell_text(values[0]) for _, _, values in chunk],
+            "name": [_cell_text(values[1]) for _, _, values in chunk],
+            "raw_price": [values[2] for _, _, values in chunk],
+        }
+    )
+    is_code = frame["head"].str.fullmatch(r"\d{6}")
+    is_numeric_head = frame["head"].str.fullmatch(r"\d+(?:\.\d+)?")
+    frame["price"] = pd.to_numeric(frame["raw_price"], errors="coerce")
+
+    # Раздел — любая непустая строка без кода; последний раздел переносим между пачками,
+    # но не между листами
+    previous_sheet, previous_section = carry
+    section_rows = ~is_code & ~is_numeric_head & (frame["head"] != "")
+    frame["section"] = frame["head"].where(section_rows)
+    new_sheet = frame["sheet"] != frame["sheet"].shift(fill_value=previous_sheet)
+    frame.loc[new_sheet & ~section_rows, "section"] = ""
+    if not new_sheet.iloc[0] and not section_rows.iloc[0]:
+        frame.loc[0, "section"] = previous_section
+    frame["section"] = frame["section"].ffill().fillna("")
+
+    reasons = pd.Series("", index=frame.index)
+    reasons[is_numeric_head & ~is_code] = "код должен состоять из 6 цифр"
+    reasons[(frame["head"] == "") & (frame["name"] != "")] = "нет кода услуги"
+    reasons[is_code & (frame["name"] == "")] = "пустое название услуги"
+    reasons[is_code & (frame["name"] != "") & frame["price"].isna()] = "некорректная цена"
+    reasons[is_code & (frame["price"] < 0)] = "отрицательная цена"
+
+    valid = is_code & (reasons == "")
+    for idx in frame.index[valid]:
+        code = frame.at[idx, "head"]
+        if code in seen_codes:
+            reasons[idx] = "дубль кода (оставлена первая строка)"
+            continue
+        seen_codes.add(code)
+        writer.writerow([frame.at[idx, "section"], code, frame.at[idx, "name"], float(frame.at[idx, "price"])])
+        stats.items += 1
+        stats.per_source[source] = stats.per_source.get(source, 0) + 1
+        stats.sections.add(frame.at[idx, "section"])
+
+    for idx in frame.index[reasons != ""]:
+        stats.errors += 1
+        error_writer.writerow(
+            [
+                source,
+                frame.at[idx, "sheet"],
+                frame.at[idx, "row"],
+                reasons[idx],
+                " | ".join(str(value) for value in chunk[idx][2] if value is not None),
+            ]
+        )
+
+    stats.rows += len(frame)
+    return frame["sheet"].iloc[-1], frame["section"].iloc[-1]
+
+
+def extract(
+    sources: Sequence[Path],
+    output: Path,
+    errors_path: Path,
+    sheets: Optional[Sequence[str]] = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> ExtractStats:
+    stats = ExtractStats()
+    seen_codes: Set[str] = set()
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    with output.open("w", encoding="utf-8-sig", newline="") as out_fh, \
+            errors_path.open("w", encoding="utf-8-sig", newline="") as err_fh:
+        writer = csv.writer(out_fh)
+        error_writer = csv.writer(err_fh)
+        writer.writerow(OUTPUT_COLUMNS)
+        error_writer.writerow(ERROR_COLUMNS)
+
+        for source in sources:
+            if not source.exists():
+                raise FileNotFoundError(f"Не найден Excel: {source}")
+            carry = ("", "")
+            chunk: List[Tuple[str, int, tuple]] = []
+            for row in iter_rows(source, sheets):
+                chunk.append(row)
+                if len(chunk) >= chunk_rows:
+                    carry = _process_chunk(chunk, source.name, carry, seen_codes, writer, error_writer, stats)
+                    chunk = []
+            if chunk:
+                _process_chunk(chunk, source.name, carry, seen_codes, writer, error_writer, stats)
+
+    return stats
+
+
+def is_production_path(path: Path, production: Path) -> bool:
+    return path.resolve() == production.resolve()
+
+
+def default_snapshot_path(output: Path) -> Path:
+    # Снапшот рядом с чужим CSV: иначе use_snapshot() отдал бы пробную выгрузку API и боту
+    if is_production_path(output, CSV_PATH):
+        return SNAPSHOT_PATH
+    return output.with_suffix(".arrow")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Извлечение прайса из Excel в staging CSV")
+    parser.add_argument("sources", nargs="*", type=Path, default=[SOURCE_PATH], help="Файлы .xlsx")
+    parser.add_argument("--sheets", nargs="+", help="Обрабатывать только эти листы (по умолчанию все)")
+    parser.add_argument("--output", type=Path, default=CSV_PATH, help="Куда сохранить staging CSV")
+    parser.add_argument("--errors", type=Path, help="CSV с ошибками разбора (по умолчанию рядом с output)")
+    parser.add_argument(
+        "--snapshot",
+        type=Path,
+        help="Куда сохранить Arrow-снапшот (по умолчанию рядом с output; для рабочего CSV — PRICING_SNAPSHOT_PATH)",
+    )
+    parser.add_argument("--no-snapshot", action="store_true", help="Не публиковать Arrow-снапшот")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    errors_path = args.errors or args.output.with_name(args.output.stem + "_errors.csv")
+
+    stats = extract(args.sources, args.output, errors_path, args.sheets)
+
+    for source, count in stats.per_source.items():
+        print(f"{source}: {count} услуг")
+    print(f"Всего услуг: {stats.items}; уникальных разделов: {len(stats.sections)}; строк: {stats.rows}")
+    print(f"Сохранено в {args.output}")
+    if not args.no_snapshot:
+        snapshot_path = args.snapshot or default_snapshot_path(args.output)
+        version = write_snapshot(read_csv(args.output), snapshot_path, source=args.output.name)
+        print(f"Снапшот {snapshot_path}, версия {version}")
+        # В архив версий попадают только рабочие снапшоты (развёртывания и клиник) — пробная выгрузка не должна менять as_of
+        versions_dir = versions_dir_for(snapshot_path)
+        if versions_dir is not None:
+            archive_snapshot(snapshot_path, versions_dir=versions_dir)
+    if stats.errors:
+        print(f"Ошибок разбора: {stats.errors} — см. {errors_path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
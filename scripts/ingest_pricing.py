@@ -1,48 +1,556 @@
-import pandas as pd
+import argparse
+import hashlib
+import json
+import re
+import sys
+import time
+import uuid
+from datetime import datetime
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 
-CSV_PATH = Path(r"C:\dent_ai\staging_price_items.csv")
-COLLECTION = "price_items_v1"
-MODEL_NAME = "cointegrated/rubert-tiny2"
+from scripts.catalog_snapshot import (
+    CSV_PATH,
+    SIMILAR_PATH,
+    SIMILAR_TOP_K,
+    catalog_version,
+    top_k_similar,
+    write_similar,
+)
+from scripts.embeddings import DEFAULT_BATCH_SIZE, EMBEDDING_CACHE_PATH, CachedEncoder, EmbeddingCache
+from scripts.search_price import CODE_FACET_FIELDS, COLLECTION, MODEL_NAME, make_qdrant_client
 
-if not CSV_PATH.exists():
-    raise FileNotFoundError(f"Не найден CSV: {CSV_PATH}")
+QUANTIZATION_CHOICES = ("none", "scalar", "binary")
+PAYLOAD_COLUMNS = [
+    "code",
+    "code_prefixes",
+    *CODE_FACET_FIELDS.values(),
+    "display_name",
+    "section",
+    "base_price",
+    "content_hash",
+]
+# Индексы для фильтров /search и фасетов; префиксы кода для фильтра хранятся списком
+# ("8", "80", "809", ...), для фасетов — по одному полю на длину (code_prefix3 = "809")
+PAYLOAD_INDEXES = {
+    "section": models.PayloadSchemaType.KEYWORD,
+    "code": models.PayloadSchemaType.KEYWORD,
+    "code_prefixes": models.PayloadSchemaType.KEYWORD,
+    **{field: models.PayloadSchemaType.KEYWORD for field in CODE_FACET_FIELDS.values()},
+    "base_price": models.PayloadSchemaType.FLOAT,
+}
+# Фиксированный namespace: id точки зависит только от кода услуги
+POINT_NAMESPACE = uuid.UUID("6f1c3c52-8d0e-4f4e-9a57-3f0f6c2b9d41")
+SCROLL_BATCH = 1000
+DEFAULT_KEEP_VERSIONS = 2
+SMOKE_TOP_K = 3
+UPLOAD_BATCH = 256
 
-items = pd.read_csv(CSV_PATH, dtype={"code": str})
-items["section"] = items["section"].fillna("")
-items["display_name"] = items["display_name"].fillna("")
 
-items["text"] = (
-    items["display_name"]
-    + " | код " + items["code"]
-    + " | раздел " + items["section"]
-    + items["base_price"].map(lambda x: f" | {x:.2f} RUB")
-)
+def point_id(code: str) -> str:
+    return str(uuid.uuid5(POINT_NAMESPACE, code))
 
-print("Записей в прайсе:", len(items))
 
-model = SentenceTransformer(MODEL_NAME)
-embeddings = model.encode(items["text"].tolist(), show_progress_bar=True)
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-client = QdrantClient(host="127.0.0.1", port=6333)
 
-if client.collection_exists(COLLECTION):
-    client.delete_collection(COLLECTION)
+def code_prefixes(code: str) -> List[str]:
+    return [code[:length] for length in range(1, len(code))]
 
-client.create_collection(
-    collection_name=COLLECTION,
-    vectors_config=models.VectorParams(size=embeddings.shape[1], distance=models.Distance.COSINE),
-)
 
-payloads = items[["code", "display_name", "section", "base_price"]].to_dict("records")
-points = [
-    models.PointStruct(id=int(idx), vector=embeddings[idx], payload=payloads[idx])
-    for idx in range(len(items))
-]
+def load_catalog(csv_path: Path) -> pd.DataFrame:
+    if not csv_path.exists():
+        raise FileNotFoundError(f"Не найден CSV: {csv_path}")
+
+    items = pd.read_csv(csv_path, dtype={"code": str})
+    items["section"] = items["section"].fillna("")
+    items["display_name"] = items["display_name"].fillna("")
+
+    duplicated = items["code"].duplicated(keep="first")
+    if duplicated.any():
+        print(
+            "Пропущены дубли кодов:",
+            ", ".join(sorted(set(items.loc[duplicated, "code"]))),
+            file=sys.stderr,
+        )
+        items = items.loc[~duplicated].reset_index(drop=True)
+
+    items["text"] = build_texts(items)
+    items["point_id"] = items["code"].map(point_id)
+    items["code_prefixes"] = items["code"].map(code_prefixes)
+    for length, field in CODE_FACET_FIELDS.items():
+        items[field] = items["code"].str[:length]
+    items["content_hash"] = items["text"].map(content_hash)
+    return items
+
+
+def build_texts(items: pd.DataFrame) -> pd.Series:
+    return (
+        items["display_name"]
+        + " | код " + items["code"]
+        + " | раздел " + items["section"]
+        + items["base_price"].map(lambda x: f" | {x:.2f} RUB")
+    )
+
+
+def quantization_config(kind: str, always_ram: bool = True) -> Optional[models.QuantizationConfig]:
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=always_ram,
+            )
+        )
+    if kind == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=always_ram),
+        )
+    return None
+
+
+def create_collection(
+    client: QdrantClient,
+    collection: str,
+    dim: int,
+    quantization: str = "none",
+    always_ram: bool = True,
+    on_disk: bool = False,
+) -> None:
+    # При квантизации оригинальные float32 нужны только для rescoring — их можно держать на диске
+    client.create_collection(
+        collection_name=collection,
+        vectors_config=models.VectorParams(
+            size=dim,
+            distance=models.Distance.COSINE,
+            on_disk=on_disk,
+        ),
+        quantization_config=quantization_config(quantization, always_ram),
+    )
+    ensure_payload_indexes(client, collection)
+
+
+def ensure_payload_indexes(client: QdrantClient, collection: str) -> List[str]:
+    """Create missing payload indexes; returns the fields that were indexed now."""
+    existing = client.get_collection(collection).payload_schema or {}
+    created: List[str] = []
+    for field_name, schema in PAYLOAD_INDEXES.items():
+        if field_name in existing:
+            continue
+        client.create_payload_index(
+            collection_name=collection,
+            field_name=field_name,
+            field_schema=schema,
+            wait=True,
+        )
+        created.append(field_name)
+    return created
+
+
+def update_quantization(client: QdrantClient, collection: str, quantization: str, always_ram: bool = True) -> None:
+    config = quantization_config(quantization, always_ram) or models.Disabled.DISABLED
+    client.update_collection(collection_name=collection, quantization_config=config)
+
+
+def upload(
+    client: QdrantClient,
+    collection: str,
+    items: pd.DataFrame,
+    embeddings,
+    batch_size: int = UPLOAD_BATCH,
+    parallel: int = 1,
+) -> None:
+    # upload_collection режет numpy-массив на батчи сам, без PointStruct на каждую строку
+    client.upload_collection(
+        collection_name=collection,
+        vectors=embeddings,
+        payload=items[PAYLOAD_COLUMNS].to_dict("records"),
+        ids=items["point_id"].tolist(),
+        batch_size=batch_size,
+        parallel=parallel,
+        wait=True,
+    )
+
+
+def fetch_existing_hashes(client: QdrantClient, collection: str) -> Dict[str, Optional[str]]:
+    """content_hash per point; None for points missing any payload field (forces re-upload)."""
+    hashes: Dict[str, Optional[str]] = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=SCROLL_BATCH,
+            offset=offset,
+            with_payload=PAYLOAD_COLUMNS,
+            with_vectors=False,
+        )
+        for point in points:
+            payload = point.payload or {}
+            complete = all(column in payload for column in PAYLOAD_COLUMNS)
+            hashes[str(point.id)] = payload.get("content_hash") if complete else None
+        if offset is None:
+            return hashes
+
+
+def sync_collection(
+    client: QdrantClient,
+    collection: str,
+    items: pd.DataFrame,
+    encoder: CachedEncoder,
+    dry_run: bool = False,
+    upload_batch: int = UPLOAD_BATCH,
+    upload_workers: int = 1,
+) -> Dict[str, Any]:
+    """Upsert only new/changed rows and delete codes that left the catalog.
+
+    Points are matched by ``point_id(code)`` and compared by ``content_hash``,
+    so reordering rows or re-running on an unchanged CSV is a no-op.
+    """
+    started = time.perf_counter()
+    indexed = [] if dry_run else ensure_payload_indexes(client, collection)
+    existing = fetch_existing_hashes(client, collection)
+
+    known = items["point_id"].isin(existing.keys())
+    stale = items["content_hash"] != items["point_id"].map(existing)
+    changed = items.loc[~known | stale]
+    removed_ids = sorted(set(existing) - set(items["point_id"]))
+
+    summary: Dict[str, Any] = {
+        "collection": collection,
+        "total": len(items),
+        "created": int((~known).sum()),
+        "updated": int((known & stale).sum()),
+        "unchanged": int((known & ~stale).sum()),
+        "deleted": len(removed_ids),
+        "created_codes": items.loc[~known, "code"].tolist(),
+        "updated_codes": items.loc[known & stale, "code"].tolist(),
+        "dry_run": dry_run,
+        "indexed_fields": indexed,
+    }
+
+    if not dry_run:
+        if not changed.empty:
+            embeddings = encoder.encode(changed["text"], changed["content_hash"])
+            upload(
+                client,
+                collection,
+                changed.reset_index(drop=True),
+                embeddings,
+                batch_size=upload_batch,
+                parallel=upload_workers,
+            )
+        if removed_ids:
+            client.delete(
+                collection_name=collection,
+                points_selector=models.PointIdsList(points=removed_ids),
+                wait=True,
+            )
+
+    summary["embeddings_cached"] = encoder.hits
+    summary["embeddings_encoded"] = encoder.misses
+    summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def versioned_name(alias: str, model_name: str) -> str:
+    model_slug = re.sub(r"[^0-9a-z]+", "_", model_name.lower()).strip("_")
+    return f"{alias}__{model_slug}__{datetime.now():%Y%m%d%H%M%S}"
+
+
+def list_versions(client: QdrantClient, alias: str) -> List[str]:
+    """Versioned collections behind ``alias``, oldest first (names sort by timestamp)."""
+    pattern = re.compile(rf"^{re.escape(alias)}__.+__\d{{14}}$")
+    names = [item.name for item in client.get_collections().collections if pattern.match(item.name)]
+    return sorted(names, key=lambda name: name.rsplit("__", 1)[1])
+
+
+def resolve_alias(client: QdrantClient, alias: str) -> Optional[str]:
+    for item in client.get_aliases().aliases:
+        if item.alias_name == alias:
+            return item.collection_name
+    return None
+
+
+def resolve_target(client: QdrantClient, alias: str) -> Optional[str]:
+    """Collection that incremental ingest should write to: alias target or a plain collection."""
+    target = resolve_alias(client, alias)
+    if target:
+        return target
+    if client.collection_exists(alias):
+        return alias
+    return None
+
+
+def check_alias_name(client: QdrantClient, alias: str) -> Optional[str]:
+    """Current target of ``alias``; exits if ``alias`` is a plain collection that cannot become an alias."""
+    previous = resolve_alias(client, alias)
+    if previous is None and client.collection_exists(alias):
+        raise SystemExit(
+            f"{alias} — обычная коллекция, а не алиас. Укажи другое имя алиаса в QDRANT_COLLECTION"
+        )
+    return previous
+
+
+def switch_alias(client: QdrantClient, alias: str, collection: str) -> Optional[str]:
+    """Atomically repoint ``alias`` to ``collection``; returns the previous target."""
+    if not client.collection_exists(collection):
+        raise SystemExit(f"Коллекция {collection} не существует")
+    previous = check_alias_name(client, alias)
+
+    operations: List[Any] = []
+    if previous:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(
+        models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=collection, alias_name=alias)
+        )
+    )
+    client.update_collection_aliases(change_aliases_operations=operations)
+    return previous
+
+
+def smoke_check(client: QdrantClient, collection: str, items: pd.DataFrame, encoder: CachedEncoder) -> None:
+    """Fail the rebuild unless the collection is complete and finds known items by their own text."""
+    count = client.count(collection_name=collection, exact=True).count
+    if count != len(items):
+        raise RuntimeError(f"Smoke-check: в {collection} {count} точек вместо {len(items)}")
+
+    sample = items.iloc[:: max(1, len(items) // 5)].head(5)
+    vectors = encoder.encode(sample["text"], sample["content_hash"])
+    for (_, row), vector in zip(sample.iterrows(), vectors):
+        hits = client.search(collection_name=collection, query_vector=vector, limit=SMOKE_TOP_K)
+        if row["point_id"] not in {str(hit.id) for hit in hits}:
+            raise RuntimeError(f"Smoke-check: код {row['code']} не находится по собственному тексту")
+
+
+def prune_versions(client: QdrantClient, alias: str, keep: int) -> List[str]:
+    current = resolve_alias(client, alias)
+    versions = list_versions(client, alias)
+    removable = [name for name in versions[: max(0, len(versions) - keep)] if name != current]
+    for name in removable:
+        client.delete_collection(name)
+    return removable
+
+
+def rollback(client: QdrantClient, alias: str) -> str:
+    current = resolve_alias(client, alias)
+    versions = list_versions(client, alias)
+    older = versions[: versions.index(current)] if current in versions else []
+    if not older:
+        raise SystemExit("Нет предыдущей версии для отката — укажи коллекцию явно через --promote")
+    switch_alias(client, alias, older[-1])
+    return older[-1]
+
+
+def rebuild(
+    client: QdrantClient,
+    alias: str,
+    items: pd.DataFrame,
+    encoder: CachedEncoder,
+    quantization: str = "none",
+    always_ram: bool = True,
+    on_disk: bool = False,
+    promote: bool = True,
+    upload_batch: int = UPLOAD_BATCH,
+    upload_workers: int = 1,
+) -> Dict[str, Any]:
+    """Blue/green rebuild: fill a new versioned collection, smoke-check it, then swap the alias."""
+    # Проверяем имя алиаса до сборки: иначе готовая коллекция осталась бы ни на что не привязанной
+    previous = check_alias_name(client, alias) if promote else resolve_alias(client, alias)
+    collection = versioned_name(alias, encoder.model_name)
+    create_collection(
+        client,
+        collection,
+        encoder.dimension,
+        quantization=quantization,
+        always_ram=always_ram,
+        on_disk=on_disk,
+    )
+    try:
+        summary = sync_collection(
+            client,
+            collection,
+            items,
+            encoder,
+            upload_batch=upload_batch,
+            upload_workers=upload_workers,
+        )
+        smoke_check(client, collection, items, encoder)
+    except Exception:
+        client.delete_collection(collection)
+        raise
+
+    summary["previous"] = switch_alias(client, alias, collection) if promote else previous
+    summary["promoted"] = promote
+    return summary
+
+
+def publish_similar(
+    items: pd.DataFrame,
+    encoder: CachedEncoder,
+    path: Path = SIMILAR_PATH,
+    k: int = SIMILAR_TOP_K,
+) -> Dict[str, Any]:
+    """Precompute top-k neighbours of every catalog item from its embedding (cache hits after sync)."""
+    started = time.perf_counter()
+    embeddings = encoder.encode(items["text"], items["content_hash"])
+    neighbors, scores = top_k_similar(embeddings, k)
+    version = catalog_version(items)
+    write_similar(items["code"].tolist(), neighbors, scores, version, path, model=encoder.model_name)
+    return {
+        "path": str(path),
+        "k": int(neighbors.shape[1]),
+        "catalog_version": version,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Загрузка прайса в Qdrant")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="Путь до staging CSV")
+    parser.add_argument(
+        "--collection",
+        default=COLLECTION,
+        help="Алиас, который читают API и бот (QDRANT_COLLECTION)",
+    )
+    parser.add_argument("--model", default=MODEL_NAME, help="Модель эмбеддингов")
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATION_CHOICES,
+        help="Квантизация векторов: scalar (int8) или binary; для существующей коллекции меняет её настройку",
+    )
+    parser.add_argument(
+        "--quantized-on-disk",
+        action="store_true",
+        help="Не держать квантизованные векторы в RAM (always_ram=false)",
+    )
+    parser.add_argument(
+        "--vectors-on-disk",
+        action="store_true",
+        help="Хранить исходные float32 векторы на диске (имеет смысл вместе с --quantization)",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Собрать новую версионированную коллекцию и переключить на неё алиас (смена модели)",
+    )
+    parser.add_argument(
+        "--no-promote",
+        action="store_true",
+        help="С --rebuild: собрать и проверить коллекцию, но не переключать алиас",
+    )
+    parser.add_argument("--promote", metavar="COLLECTION", help="Переключить алиас на указанную коллекцию")
+    parser.add_argument("--rollback", action="store_true", help="Вернуть алиас на предыдущую версию")
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=DEFAULT_KEEP_VERSIONS,
+        help="Сколько версионированных коллекций хранить после rebuild (текущая + предыдущие)",
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Размер батча энкодера")
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        default=1,
+        help="Процессов для кодирования (multi-process pool sentence-transformers)",
+    )
+    parser.add_argument("--upload-batch", type=int, default=UPLOAD_BATCH, help="Точек в одном запросе к Qdrant")
+    parser.add_argument("--upload-workers", type=int, default=1, help="Параллельных загрузчиков в Qdrant")
+    parser.add_argument(
+        "--embedding-cache",
+        type=Path,
+        default=EMBEDDING_CACHE_PATH,
+        help="SQLite-кэш эмбеддингов по (модель, hash текста)",
+    )
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Не использовать кэш эмбеддингов")
+    parser.add_argument(
+        "--similar-top-k",
+        type=int,
+        default=SIMILAR_TOP_K,
+        help="Сколько похожих услуг хранить для каждого кода",
+    )
+    parser.add_argument("--similar-output", type=Path, default=SIMILAR_PATH, help="Файл таблицы похожих услуг")
+    parser.add_argument("--no-similar", action="store_true", help="Не пересчитывать таблицу похожих услуг")
+    parser.add_argument("--dry-run", action="store_true", help="Только посчитать изменения")
+    parser.add_argument("--summary", type=Path, help="Куда сохранить JSON со сводкой изменений")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+
+    client = make_qdrant_client()
+    alias = args.collection
+
+    # Переключение алиаса не читает прайс: откат должен работать и при битом staging CSV
+    if args.promote:
+        previous = switch_alias(client, alias, args.promote)
+        print(f"Алиас {alias}: {previous or '—'} → {args.promote}")
+        return
+    if args.rollback:
+        target = rollback(client, alias)
+        print(f"Алиас {alias} откатен на {target}")
+        return
+
+    items = load_catalog(args.csv)
+    print("Записей в прайсе:", len(items))
+
+    cache = None if args.no_embedding_cache else EmbeddingCache(args.embedding_cache)
+    encoder = CachedEncoder(args.model, cache=cache, batch_size=args.batch_size, workers=args.encode_workers)
+    always_ram = not args.quantized_on_disk
+
+    target = resolve_target(client, alias)
+    if args.rebuild or target is None:
+        if args.dry_run:
+            raise SystemExit("dry-run доступен только для инкрементальной загрузки")
+        summary = rebuild(
+            client,
+            alias,
+            items,
+            encoder,
+            quantization=args.quantization or "none",
+            always_ram=always_ram,
+            on_disk=args.vectors_on_disk,
+            promote=not args.no_promote,
+            upload_batch=args.upload_batch,
+            upload_workers=args.upload_workers,
+        )
+        if summary["promoted"]:
+            summary["pruned"] = prune_versions(client, alias, args.keep_versions)
+            print(f"Алиас {alias}: {summary['previous'] or '—'} → {summary['collection']}")
+        else:
+            print(f"Коллекция {summary['collection']} собрана; переключение: --promote {summary['collection']}")
+    else:
+        if args.quantization and not args.dry_run:
+            update_quantization(client, target, args.quantization, always_ram)
+        summary = sync_collection(
+            client,
+            target,
+            items,
+            encoder,
+            dry_run=args.dry_run,
+            upload_batch=args.upload_batch,
+            upload_workers=args.upload_workers,
+        )
+
+    if not args.dry_run and not args.no_similar:
+        summary["similar"] = publish_similar(items, encoder, args.similar_output, args.similar_top_k)
+        print(f"Похожие услуги: top-{summary['similar']['k']} → {args.similar_output}")
+
+    print(
+        f"Готово: {summary['total']} записей в {summary['collection']} — "
+        f"новых {summary['created']}, изменённых {summary['updated']}, "
+        f"без изменений {summary['unchanged']}, удалено {summary['deleted']} "
+        f"за {summary['elapsed_seconds']} с (эмбеддингов из кэша {summary['embeddings_cached']}, посчитано {summary['embeddings_encoded']})"
+    )
+    if args.summary:
+        args.summary.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
 
-client.upload_points(collection_name=COLLECTION, points=points)
 
-print("Готово:", len(items), "записей в Qdrant")
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,287 @@
+"""One-shot pricing pipeline: xlsx -> staging CSV -> embeddings -> Qdrant -> Arrow snapshot(s).
+
+Every stage is keyed by a hash of its inputs and skipped when the key matches
+the last successful run. Heavy modules (pandas, sentence-transformers, Qdrant)
+are imported inside the stages, so a no-op run only stats files and reads the
+state JSON.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BASE_DIR = Path(os.getenv("DENT_AI_BASE", Path(__file__).resolve().parents[1]))
+SOURCE_PATHS = [BASE_DIR / "pricing_catalog.xlsx"]
+CSV_PATH = Path(os.getenv("PRICING_CSV_PATH", BASE_DIR / "staging_price_items.csv"))
+SNAPSHOT_PATH = Path(os.getenv("PRICING_SNAPSHOT_PATH", BASE_DIR / "staging_price_items.arrow"))
+SIMILAR_PATH = Path(os.getenv("PRICING_SIMILAR_PATH", BASE_DIR / "staging_price_items.similar.arrow"))
+STATE_PATH = Path(os.getenv("PRICING_PIPELINE_STATE", BASE_DIR / "storage" / "pricing_pipeline_state.json"))
+# Куда отправить POST после обновления прайса (API: /catalog/reload), через запятую
+RELOAD_URLS = [url.strip() for url in os.getenv("CATALOG_RELOAD_URLS", "").split(",") if url.strip()]
+RELOAD_TIMEOUT_SECONDS = 5.0
+STAGES = ("extract", "embeddings", "index", "snapshot")
+_HASH_CHUNK = 1 << 20
+
+
+class PipelineContext:
+    """Per-run state shared by stages: parsed args, cached file digests, lazy encoder."""
+
+    def __init__(self, args: argparse.Namespace, state: Dict[str, Any]):
+        self.args = args
+        self.state = state
+        self.files: Dict[str, Dict[str, Any]] = state.setdefault("files", {})
+        self._items = None
+        self._encoder = None
+
+    def digest(self, path: Path) -> Optional[str]:
+        """sha256 of a file; re-hashed only when size or mtime changed since the last run."""
+        if not path.exists():
+            return None
+        stat = path.stat()
+        cached = self.files.get(str(path))
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+        digest = hashlib.sha256()
+        with path.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(_HASH_CHUNK), b""):
+                digest.update(chunk)
+        self.files[str(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+        return digest.hexdigest()
+
+    @property
+    def items(self):
+        if self._items is None:
+            from scripts.ingest_pricing import load_catalog
+
+            self._items = load_catalog(self.args.csv)
+        return self._items
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            from scripts.embeddings import CachedEncoder, EmbeddingCache
+
+            self._encoder = CachedEncoder(
+                self.args.model,
+                cache=EmbeddingCache(),
+                batch_size=self.args.batch_size,
+                workers=self.args.encode_workers,
+            )
+        return self._encoder
+
+
+def stage_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def extract_key(ctx: PipelineContext) -> str:
+    sources = [[str(path), ctx.digest(path)] for path in ctx.args.sources]
+    return stage_key("extract", sources, ctx.args.sheets or [], ctx.digest(ctx.args.csv))
+
+
+def run_extract(ctx: PipelineContext) -> Dict[str, Any]:
+    from scripts.extract_pricing import extract
+
+    errors_path = ctx.args.csv.with_name(ctx.args.csv.stem + "_errors.csv")
+    stats = extract(ctx.args.sources, ctx.args.csv, errors_path, ctx.args.sheets)
+    print(f"extract: {stats.items} услуг, ошибок разбора {stats.errors}")
+    return {"items": stats.items, "errors": stats.errors, "per_source": stats.per_source}
+
+
+def embeddings_key(ctx: PipelineContext) -> str:
+    return stage_key("embeddings", ctx.digest(ctx.args.csv), ctx.args.model)
+
+
+def run_embeddings(ctx: PipelineContext) -> Dict[str, Any]:
+    items = ctx.items
+    ctx.encoder.encode(items["text"], items["content_hash"])
+    print(f"embeddings: из кэша {ctx.encoder.hits}, посчитано {ctx.encoder.misses}")
+    return {"cached": ctx.encoder.hits, "encoded": ctx.encoder.misses}
+
+
+def index_key(ctx: PipelineContext) -> str:
+    host = f"{os.getenv('QDRANT_HOST', '127.0.0.1')}:{os.getenv('QDRANT_PORT', '6333')}"
+    endpoint = os.getenv("QDRANT_URL") or host
+    return stage_key("index", ctx.digest(ctx.args.csv), ctx.args.model, ctx.args.collection, endpoint)
+
+
+def run_index(ctx: PipelineContext) -> Dict[str, Any]:
+    from scripts.ingest_pricing import rebuild, resolve_target, sync_collection
+    from scripts.search_price import make_qdrant_client
+
+    client = make_qdrant_client()
+    target = resolve_target(client, ctx.args.collection)
+    if target is None:
+        summary = rebuild(client, ctx.args.collection, ctx.items, ctx.encoder)
+    else:
+        summary = sync_collection(client, target, ctx.items, ctx.encoder)
+    print(
+        f"index: {summary['collection']} — новых {summary['created']}, изменённых {summary['updated']}, "
+        f"удалено {summary['deleted']}"
+    )
+    return {key: summary[key] for key in ("collection", "created", "updated", "unchanged", "deleted")}
+
+
+def snapshot_key(ctx: PipelineContext) -> str:
+    return stage_key(
+        "snapshot",
+        ctx.digest(ctx.args.csv),
+        ctx.digest(ctx.args.snapshot),
+        ctx.digest(SIMILAR_PATH),
+        ctx.args.model,
+    )
+
+
+def run_snapshot(ctx: PipelineContext) -> Dict[str, Any]:
+    from scripts.catalog_snapshot import read_csv, write_snapshot
+    from scripts.catalog_versions import archive_snapshot
+    from scripts.ingest_pricing import publish_similar
+
+    version = write_snapshot(read_csv(ctx.args.csv), ctx.args.snapshot, source=ctx.args.csv.name)
+    archive_snapshot(ctx.args.snapshot)
+    similar = publish_similar(ctx.items, ctx.encoder, SIMILAR_PATH)
+    print(f"snapshot: {ctx.args.snapshot}, версия {version}; похожие услуги top-{similar['k']}")
+    return {"version": version, "similar_k": similar["k"]}
+
+
+STAGE_KEYS: Dict[str, Callable[[PipelineContext], str]] = {
+    "extract": extract_key,
+    "embeddings": embeddings_key,
+    "index": index_key,
+    "snapshot": snapshot_key,
+}
+STAGE_RUNNERS: Dict[str, Callable[[PipelineContext], Dict[str, Any]]] = {
+    "extract": run_extract,
+    "embeddings": run_embeddings,
+    "index": run_index,
+    "snapshot": run_snapshot,
+}
+
+
+def load_state(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        print(f"Состояние пайплайна {path} повреждено — все этапы будут выполнены", file=sys.stderr)
+        return {}
+
+
+def save_state(path: Path, state: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def notify_reload(urls: List[str], version: Optional[str]) -> Dict[str, str]:
+    """POST the new catalog version to running services; failures are reported, not raised."""
+    results: Dict[str, str] = {}
+    body = json.dumps({"version": version}).encode("utf-8")
+    for url in urls:
+        request = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=RELOAD_TIMEOUT_SECONDS) as response:
+                results[url] = f"HTTP {response.status}"
+        except Exception as exc:  # noqa: BLE001 - сервис может быть не запущен
+            results[url] = f"error: {exc}"
+            print(f"Не удалось уведомить {url}: {exc}", file=sys.stderr)
+    return results
+
+
+def run_pipeline(args: argparse.Namespace) -> Dict[str, Any]:
+    state = load_state(args.state)
+    stages_state: Dict[str, Any] = state.setdefault("stages", {})
+    ctx = PipelineContext(args, state)
+    report: Dict[str, Any] = {"stages": {}}
+    started = time.perf_counter()
+
+    for name in STAGES:
+        if name in args.skip:
+            report["stages"][name] = "disabled"
+            continue
+        key = STAGE_KEYS[name](ctx)
+        if name not in args.force and "all" not in args.force and stages_state.get(name, {}).get("key") == key:
+            report["stages"][name] = "skipped"
+            continue
+
+        stage_started = time.perf_counter()
+        result = STAGE_RUNNERS[name](ctx)
+        # Ключ пересчитываем после этапа: он мог переписать свой же выход (CSV, снапшот)
+        stages_state[name] = {
+            "key": STAGE_KEYS[name](ctx),
+            "completed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "elapsed_seconds": round(time.perf_counter() - stage_started, 3),
+            "result": result,
+        }
+        save_state(args.state, state)
+        report["stages"][name] = stages_state[name]
+
+    snapshot_stage = report["stages"].get("snapshot")
+    if isinstance(snapshot_stage, dict):
+        urls = args.reload_url or RELOAD_URLS
+        report["reload"] = notify_reload(urls, snapshot_stage["result"]["version"])
+    else:
+        save_state(args.state, state)
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Обновление прайса: Excel → CSV → эмбеддинги → Qdrant → снапшот")
+    parser.add_argument("sources", nargs="*", type=Path, default=SOURCE_PATHS, help="Файлы .xlsx")
+    parser.add_argument("--sheets", nargs="+", help="Обрабатывать только эти листы")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="Staging CSV")
+    parser.add_argument("--snapshot", type=Path, default=SNAPSHOT_PATH, help="Arrow-снапшот")
+    parser.add_argument("--state", type=Path, default=STATE_PATH, help="JSON с хэшами входов этапов")
+    parser.add_argument(
+        "--model",
+        default=os.getenv("EMBEDDING_MODEL_NAME", "cointegrated/rubert-tiny2"),
+        help="Модель эмбеддингов",
+    )
+    parser.add_argument("--collection", default=os.getenv("QDRANT_COLLECTION", "price_items"), help="Алиас Qdrant")
+    parser.add_argument("--batch-size", type=int, default=64, help="Размер батча энкодера")
+    parser.add_argument("--encode-workers", type=int, default=1, help="Процессов для кодирования")
+    parser.add_argument(
+        "--force",
+        nargs="+",
+        default=[],
+        choices=STAGES + ("all",),
+        help="Выполнить этапы, даже если входы не менялись",
+    )
+    parser.add_argument(
+        "--skip",
+        nargs="+",
+        default=[],
+        choices=STAGES,
+        help="Не выполнять этапы (например, index без Qdrant)",
+    )
+    parser.add_argument(
+        "--reload-url",
+        action="append",
+        help="POST-уведомление о новом прайсе (по умолчанию CATALOG_RELOAD_URLS)",
+    )
+    parser.add_argument("--report", type=Path, help="Куда сохранить JSON-отчёт запуска")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    report = run_pipeline(args)
+
+    done = [name for name, value in report["stages"].items() if isinstance(value, dict)]
+    print(f"Этапы выполнены: {', '.join(done) or 'нет (всё актуально)'} за {report['elapsed_seconds']} с")
+    if args.report:
+        args.report.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
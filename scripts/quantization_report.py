@@ -0,0 +1,172 @@
+"""Compare recall@k and latency of quantized Qdrant collections against float32."""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from qdrant_client.http import models
+from scripts.embeddings import CachedEncoder, EmbeddingCache
+from scripts.ingest_pricing import CSV_PATH, MODEL_NAME, create_collection, load_catalog, upload
+from scripts.retrieval import load_aliases
+from scripts.search_price import make_qdrant_client
+
+COLLECTION_PREFIX = "price_items_qbench"
+DEFAULT_K = 10
+DEFAULT_MAX_QUERIES = 300
+
+# (название варианта, тип квантизации, rescore, oversampling)
+VARIANTS = [
+    ("float", "none", None, None),
+    ("scalar", "scalar", False, 1.0),
+    ("scalar+rescore", "scalar", True, 2.0),
+    ("binary", "binary", False, 1.0),
+    ("binary+rescore", "binary", True, 3.0),
+]
+
+VECTOR_BYTES = {
+    "none": lambda dim: dim * 4,
+    "scalar": lambda dim: dim,
+    "binary": lambda dim: (dim + 7) // 8,
+}
+
+
+def default_queries(items, limit: int) -> List[str]:
+    queries: List[str] = list(load_aliases())
+    queries.extend(section for section in items["section"].unique() if section)
+    queries.extend(" ".join(name.split()[:4]) for name in items["display_name"])
+    unique = list(dict.fromkeys(query.strip() for query in queries if query.strip()))
+    return unique[:limit]
+
+
+def exact_top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> List[set]:
+    docs = doc_vectors / np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+    queries = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    scores = queries @ docs.T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [set(int(idx) for idx in row) for row in top]
+
+
+def run_variant(client, collection: str, query_vectors: np.ndarray, truth: List[set], k: int,
+                index_by_id: Dict[str, int], rescore: Optional[bool],
+                oversampling: Optional[float]) -> Dict[str, Any]:
+    params = None
+    if rescore is not None:
+        params = models.SearchParams(
+            quantization=models.QuantizationSearchParams(
+                ignore=False,
+                rescore=rescore,
+                oversampling=oversampling,
+            )
+        )
+
+    latencies: List[float] = []
+    recalls: List[float] = []
+    for vector, expected in zip(query_vectors, truth):
+        started = time.perf_counter()
+        points = client.search(
+            collection_name=collection,
+            query_vector=vector,
+            limit=k,
+            search_params=params,
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = {index_by_id[str(point.id)] for point in points}
+        recalls.append(len(found & expected) / len(expected))
+
+    return {
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p95": round(float(np.percentile(latencies, 95)), 3),
+            "mean": round(float(np.mean(latencies)), 3),
+        },
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Отчёт: квантизация векторов vs float32")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="Путь до staging CSV")
+    parser.add_argument("--model", default=MODEL_NAME, help="Модель эмбеддингов")
+    parser.add_argument("--prefix", default=COLLECTION_PREFIX, help="Префикс временных коллекций")
+    parser.add_argument("--queries", type=Path, help="Файл с запросами, по одному на строку")
+    parser.add_argument("--max-queries", type=int, default=DEFAULT_MAX_QUERIES)
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="Глубина recall@k")
+    parser.add_argument("--output", type=Path, help="Куда сохранить JSON-отчёт")
+    parser.add_argument("--keep", action="store_true", help="Не удалять временные коллекции")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+
+    items = load_catalog(args.csv)
+    if args.queries:
+        queries = [line.strip() for line in args.queries.read_text(encoding="utf-8").splitlines() if line.strip()]
+    else:
+        queries = default_queries(items, args.max_queries)
+
+    encoder = CachedEncoder(args.model, cache=EmbeddingCache())
+    doc_vectors = encoder.encode(items["text"], items["content_hash"])
+    query_vectors = np.asarray(encoder.model.encode(queries))
+    k = min(args.k, len(items))
+    truth = exact_top_k(doc_vectors, query_vectors, k)
+    dim = doc_vectors.shape[1]
+    index_by_id = {pid: idx for idx, pid in enumerate(items["point_id"])}
+
+    client = make_qdrant_client()
+    created: List[str] = []
+    results: List[Dict[str, Any]] = []
+    try:
+        for name, quantization, rescore, oversampling in VARIANTS:
+            collection = f"{args.prefix}_{quantization}"
+            if collection not in created:
+                if client.collection_exists(collection):
+                    client.delete_collection(collection)
+                create_collection(client, collection, dim, quantization=quantization)
+                upload(client, collection, items, doc_vectors)
+                created.append(collection)
+
+            metrics = run_variant(
+                client, collection, query_vectors, truth, k, index_by_id, rescore, oversampling
+            )
+            results.append(
+                {
+                    "name": name,
+                    "quantization": quantization,
+                    "rescore": rescore,
+                    "oversampling": oversampling,
+                    "vector_bytes_per_point": VECTOR_BYTES[quantization](dim),
+                    **metrics,
+                }
+            )
+            print(
+                f"{name:>16}: recall@{k}={metrics['recall_at_k']:.3f} "
+                f"p50={metrics['latency_ms']['p50']:.2f}ms p95={metrics['latency_ms']['p95']:.2f}ms",
+                file=sys.stderr,
+            )
+    finally:
+        if not args.keep:
+            for collection in created:
+                client.delete_collection(collection)
+
+    report = {
+        "model": args.model,
+        "points": len(items),
+        "dim": dim,
+        "queries": len(queries),
+        "k": k,
+        "baseline": "exact cosine top-k over float32 embeddings",
+        "results": results,
+    }
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(payload, encoding="utf-8")
+    print(payload)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
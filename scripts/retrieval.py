@@ -0,0 +1,275 @@
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from scripts.catalog_snapshot import load_similar
+from scripts.compact_catalog import CompactCatalog, load_compact_catalog
+from scripts.search_price import BASE_DIR, search_by_query
+
+ALIASES_PATH = Path(os.getenv("SERVICE_ALIASES_PATH", BASE_DIR / "config" / "service_aliases.json"))
+RETRIEVAL_BUDGET_SECONDS = float(
+    os.getenv("RETRIEVAL_BUDGET_SECONDS", os.getenv("SEMANTIC_TIMEOUT_SECONDS", "6.0"))
+)
+SEMANTIC_MIN_BUDGET_SECONDS = float(os.getenv("SEMANTIC_MIN_BUDGET_SECONDS", "0.5"))
+LEXICAL_CONFIDENCE_THRESHOLD = float(os.getenv("LEXICAL_CONFIDENCE_THRESHOLD", "0.6"))
+DEFAULT_TOP_K = 7
+
+STAGE_ALIAS = "alias"
+STAGE_CODE = "code"
+STAGE_LEXICAL = "lexical"
+STAGE_SEMANTIC = "semantic"
+STAGE_SIMILAR = "similar"
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+_CODE_RE = re.compile(r"(?<!\d)\d{6}(?!\d)")
+# Грубый стемминг: первые символы слова достаточно устойчивы к падежным окончаниям
+STEM_LENGTH = 5
+MIN_TOKEN_LENGTH = 3
+
+_aliases_cache: Optional[Dict[str, List[str]]] = None
+# Индекс привязан к объекту каталога: load_compact_catalog отдаёт новый только после смены прайса на диске
+_lexical_cache: Optional[Tuple[CompactCatalog, "LexicalIndex"]] = None
+_semantic_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="semantic")
+
+
+def load_aliases() -> Dict[str, List[str]]:
+    global _aliases_cache
+    if _aliases_cache is None:
+        if ALIASES_PATH.exists():
+            with ALIASES_PATH.open("r", encoding="utf-8") as fh:
+                _aliases_cache = json.load(fh)
+        else:
+            _aliases_cache = {}
+    return _aliases_cache
+
+
+def match_aliases(query: str) -> List[str]:
+    query_lower = query.lower()
+    matched_codes: List[str] = []
+    for alias, codes in load_aliases().items():
+        if alias in query_lower:
+            matched_codes.extend(codes)
+    return matched_codes
+
+
+def catalog_rows() -> CompactCatalog:
+    """code -> row view; rows expose code/display_name/base_price/section/score like dicts."""
+    return load_compact_catalog()
+
+
+def tokenize(text: str) -> List[str]:
+    text = (text or "").lower().replace("ё", "е")
+    return [
+        token[:STEM_LENGTH]
+        for token in _TOKEN_RE.findall(text)
+        if len(token) >= MIN_TOKEN_LENGTH
+    ]
+
+
+class LexicalIndex:
+    """BM25 over stemmed display names and sections; coverage doubles as confidence."""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, rows: CompactCatalog):
+        self.codes: List[str] = list(rows)
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_lengths: List[int] = []
+        for doc_id, code in enumerate(self.codes):
+            row = rows[code]
+            terms = tokenize(f"{row.get('display_name', '')} {row.get('section', '')}")
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term][doc_id] = tf
+
+        total = len(self.codes) or 1
+        self.avg_length = (sum(self.doc_lengths) / total) or 1.0
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        self.max_idf = max(self.idf.values(), default=1.0)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float, float]]:
+        """Return (code, bm25 score, share of query idf covered by the item)."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        query_weight = sum(self.idf.get(term, self.max_idf) for term in terms)
+
+        scores: Dict[int, float] = defaultdict(float)
+        covered: Dict[int, float] = defaultdict(float)
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in docs.items():
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+                covered[doc_id] += idf
+
+        ranked = sorted(scores, key=lambda doc_id: (covered[doc_id], scores[doc_id]), reverse=True)
+        return [
+            (self.codes[doc_id], scores[doc_id], covered[doc_id] / query_weight)
+            for doc_id in ranked[:top_k]
+        ]
+
+
+def load_lexical_index() -> LexicalIndex:
+    global _lexical_cache
+    rows = catalog_rows()
+    if _lexical_cache is None or _lexical_cache[0] is not rows:
+        _lexical_cache = (rows, LexicalIndex(rows))
+    return _lexical_cache[1]
+
+
+@dataclass
+class RetrievalResult:
+    query: str
+    items: List[Dict[str, Any]] = field(default_factory=list)
+    stage: Optional[str] = None
+    confidence: float = 0.0
+    elapsed: float = 0.0
+    timings: Dict[str, float] = field(default_factory=dict)
+    degraded: bool = False
+    error: Optional[str] = None
+
+
+def _rows_for_codes(codes: List[str], stage: str) -> List[Dict[str, Any]]:
+    rows = catalog_rows()
+    seen = set()
+    items: List[Dict[str, Any]] = []
+    for code in codes:
+        row = rows.get(code)
+        if row and code not in seen:
+            seen.add(code)
+            items.append({**row, "stage": stage})
+    return items
+
+
+def similar_items(code: str, limit: int = DEFAULT_TOP_K) -> List[Dict[str, Any]]:
+    """Neighbouring services from the precomputed table — no model or Qdrant call."""
+    rows = catalog_rows()
+    items: List[Dict[str, Any]] = []
+    # Таблица может отставать от прайса: коды, которых уже нет, пропускаем
+    for similar_code, score in load_similar().get(code, []):
+        row = rows.get(similar_code)
+        if row:
+            items.append({**row, "score": float(score), "stage": STAGE_SIMILAR})
+            if len(items) >= limit:
+                break
+    return items
+
+
+def _semantic_items(query: str, top_k: int) -> List[Dict[str, Any]]:
+    seen_codes = set()
+    items: List[Dict[str, Any]] = []
+    for point in search_by_query(query, top_k=top_k):
+        payload = point.payload or {}
+        code = str(payload.get("code", "")).strip()
+        if not code or code in seen_codes:
+            continue
+        seen_codes.add(code)
+        items.append(
+            {
+                "code": code,
+                "display_name": payload.get("display_name", ""),
+                "base_price": payload.get("base_price", 0),
+                "section": payload.get("section", ""),
+                "score": point.score,
+                "stage": STAGE_SEMANTIC,
+            }
+        )
+    return items
+
+
+def retrieve(
+    query: str,
+    top_k: int = DEFAULT_TOP_K,
+    budget: Optional[float] = None,
+    semantic: Optional[Callable[[str, int], List[Dict[str, Any]]]] = None,
+) -> RetrievalResult:
+    """Serve the query from the cheapest stage that is confident enough.
+
+    The semantic stage only runs when the lexical answer is below
+    ``LEXICAL_CONFIDENCE_THRESHOLD`` and at least ``SEMANTIC_MIN_BUDGET_SECONDS``
+    of the budget remain. If it fails or times out, the best cheap answer is
+    returned with ``degraded=True`` instead of raising.
+    """
+    budget = RETRIEVAL_BUDGET_SECONDS if budget is None else budget
+    semantic = semantic or _semantic_items
+    started = time.perf_counter()
+    result = RetrievalResult(query=query)
+
+    def finish(items: List[Dict[str, Any]], stage: str, confidence: float) -> RetrievalResult:
+        result.items = items[:top_k]
+        result.stage = stage
+        result.confidence = confidence
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def mark(stage: str, stage_started: float) -> None:
+        result.timings[stage] = time.perf_counter() - stage_started
+
+    stage_started = time.perf_counter()
+    items = _rows_for_codes(match_aliases(query), STAGE_ALIAS)
+    mark(STAGE_ALIAS, stage_started)
+    if items:
+        return finish(items, STAGE_ALIAS, 1.0)
+
+    stage_started = time.perf_counter()
+    items = _rows_for_codes(_CODE_RE.findall(query), STAGE_CODE)
+    mark(STAGE_CODE, stage_started)
+    if items:
+        return finish(items, STAGE_CODE, 1.0)
+
+    stage_started = time.perf_counter()
+    rows = catalog_rows()
+    lexical_hits = load_lexical_index().search(query, top_k)
+    lexical_items = [
+        {**rows[code], "score": round(coverage, 4), "stage": STAGE_LEXICAL}
+        for code, _, coverage in lexical_hits
+    ]
+    lexical_confidence = lexical_hits[0][2] if lexical_hits else 0.0
+    mark(STAGE_LEXICAL, stage_started)
+    if lexical_items and lexical_confidence >= LEXICAL_CONFIDENCE_THRESHOLD:
+        return finish(lexical_items, STAGE_LEXICAL, lexical_confidence)
+
+    remaining = budget - (time.perf_counter() - started)
+    if remaining < SEMANTIC_MIN_BUDGET_SECONDS:
+        result.degraded = True
+        result.error = "budget exhausted"
+        return finish(lexical_items, STAGE_LEXICAL, lexical_confidence)
+
+    stage_started = time.perf_counter()
+    future = _semantic_executor.submit(semantic, query, top_k)
+    try:
+        semantic_items = future.result(timeout=remaining)
+    except FutureTimeoutError:
+        logging.error("Semantic search timed out for query '%s'", query)
+        semantic_items = None
+        result.error = "semantic timeout"
+    except Exception:
+        logging.exception("Semantic search failed for query: %s", query)
+        semantic_items = None
+        result.error = "semantic failure"
+    mark(STAGE_SEMANTIC, stage_started)
+
+    if semantic_items is None:
+        result.degraded = True
+        return finish(lexical_items, STAGE_LEXICAL, lexical_confidence)
+    if not semantic_items:
+        return finish(lexical_items, STAGE_LEXICAL, lexical_confidence)
+
+    top_score = semantic_items[0].get("score") if semantic_items else None
+    return finish(semantic_items, STAGE_SEMANTIC, float(top_score or 0.0))
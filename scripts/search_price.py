@@ -1,14 +1,19 @@
 import argparse
+import asyncio
 import sys
 import ctypes
 import os
+import time
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models
-from sentence_transformers import SentenceTransformer
+from scripts.catalog_snapshot import BASE_DIR, CSV_PATH, load_catalog
+from scripts.code_ranges import CodeRanges
+from scripts.compact_catalog import CatalogItem, load_compact_catalog
+from scripts.embeddings import load_encoder
 
 try:
     kernel32 = ctypes.windll.kernel32  # type: ignore[attr-defined]
@@ -22,30 +27,33 @@ for stream_name in ("stdout", "stderr"):
     if hasattr(stream, "reconfigure"):
         stream.reconfigure(encoding="utf-8")
 
-BASE_DIR = Path(os.getenv("DENT_AI_BASE", Path(__file__).resolve().parents[1]))
-CSV_PATH = Path(os.getenv("PRICING_CSV_PATH", BASE_DIR / "staging_price_items.csv"))
 GUIDELINES_PATH = Path(os.getenv("GUIDELINES_PATH", BASE_DIR / "knowledge" / "guidelines.json"))
-COLLECTION = os.getenv("QDRANT_COLLECTION", "price_items_v1")
+# Алиас Qdrant: ingest переключает его на новую версионированную коллекцию атомарно
+COLLECTION = os.getenv("QDRANT_COLLECTION", "price_items")
 MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "cointegrated/rubert-tiny2")
 DEFAULT_TOP_K = 5
-_items_cache: Optional[pd.DataFrame] = None
-_model_cache: Optional[SentenceTransformer] = None
+# Фасеты по коду — поля с префиксом фиксированной длины: в code_prefixes лежат все длины сразу
+CODE_FACET_FIELDS = {length: f"code_prefix{length}" for length in (2, 3, 4)}
+DEFAULT_OVERSAMPLING = {"scalar": 2.0, "binary": 3.0, "product": 2.0}
+# Алиас может переехать на коллекцию с другой квантизацией — параметры перечитываем
+SEARCH_PARAMS_TTL_SECONDS = 60.0
+_model_cache: Optional[Any] = None
 _guidelines_cache: Optional[List[dict]] = None
+_guideline_index_cache: Optional[Tuple[Dict[str, dict], List[Tuple[CodeRanges, dict]]]] = None
+_client_cache: Optional[QdrantClient] = None
+_async_client_cache: Optional[AsyncQdrantClient] = None
+_search_params_cache: Dict[str, Tuple[float, Optional[models.SearchParams]]] = {}
 
 
 def load_items() -> pd.DataFrame:
-    global _items_cache
-    if _items_cache is None:
-        if not CSV_PATH.exists():
-            raise FileNotFoundError(f"Не найден CSV: {CSV_PATH}")
-        _items_cache = pd.read_csv(CSV_PATH, dtype={"code": str})
-    return _items_cache
+    return load_catalog()
 
 
-def load_model() -> SentenceTransformer:
+def load_model() -> Any:
+    """Query encoder: SentenceTransformer or OnnxEncoder depending on EMBEDDING_BACKEND."""
     global _model_cache
     if _model_cache is None:
-        _model_cache = SentenceTransformer(MODEL_NAME)
+        _model_cache = load_encoder(MODEL_NAME)
     return _model_cache
 
 
@@ -59,39 +67,152 @@ def load_guidelines() -> List[dict]:
     return _guidelines_cache
 
 
-def search_by_code(code: str) -> pd.DataFrame:
-    items = load_items()
-    match = items.loc[items["code"] == code]
-    if match.empty:
+def search_by_code(code: str) -> CatalogItem:
+    item = load_compact_catalog().get(code)
+    if item is None:
         raise SystemExit(f"Код {code} не найден в прайсе")
-    return match
+    return item
 
 
-def search_by_query(query: str, top_k: int = DEFAULT_TOP_K) -> List[models.ScoredPoint]:
+def make_qdrant_client(default_host: str = "127.0.0.1", client_class: type = QdrantClient) -> Any:
+    qdrant_url = os.getenv("QDRANT_URL")
+    if qdrant_url:
+        return client_class(url=qdrant_url)
+    host = os.getenv("QDRANT_HOST", default_host)
+    port = int(os.getenv("QDRANT_PORT", "6333"))
+    return client_class(host=host, port=port)
+
+
+def get_client() -> QdrantClient:
+    global _client_cache
+    if _client_cache is None:
+        _client_cache = make_qdrant_client()
+    return _client_cache
+
+
+def get_async_client() -> AsyncQdrantClient:
+    global _async_client_cache
+    if _async_client_cache is None:
+        _async_client_cache = make_qdrant_client(client_class=AsyncQdrantClient)
+    return _async_client_cache
+
+
+def quantization_kind(config: Optional[models.QuantizationConfig]) -> Optional[str]:
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    if isinstance(config, models.ProductQuantization):
+        return "product"
+    return None
+
+
+def cached_search_params(collection: str) -> Tuple[bool, Optional[models.SearchParams]]:
+    """(is the cached value still fresh, cached params) without touching Qdrant."""
+    cached = _search_params_cache.get(collection)
+    if cached and time.monotonic() - cached[0] < SEARCH_PARAMS_TTL_SECONDS:
+        return True, cached[1]
+    return False, None
+
+
+def quantization_search_params(client: QdrantClient, collection: str) -> Optional[models.SearchParams]:
+    """Rescoring params for quantized collections, cached per collection/alias.
+
+    Oversampling defaults depend on the quantization kind and can be overridden
+    with QDRANT_OVERSAMPLING / QDRANT_RESCORE.
+    """
+    fresh, params = cached_search_params(collection)
+    if fresh:
+        return params
+    cached = _search_params_cache.get(collection)
+
+    try:
+        info = client.get_collection(collection)
+    except Exception:
+        return cached[1] if cached else None
+    kind = quantization_kind(info.config.quantization_config)
+    params = None
+    if kind:
+        oversampling = float(os.getenv("QDRANT_OVERSAMPLING", DEFAULT_OVERSAMPLING[kind]))
+        rescore = os.getenv("QDRANT_RESCORE", "1").lower() not in {"0", "false", "no"}
+        params = models.SearchParams(
+            quantization=models.QuantizationSearchParams(
+                ignore=False,
+                rescore=rescore,
+                oversampling=oversampling,
+            )
+        )
+    _search_params_cache[collection] = (time.monotonic(), params)
+    return params
+
+
+def build_filter(
+    sections: Optional[List[str]] = None,
+    code_prefix: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+) -> Optional[models.Filter]:
+    """Qdrant filter over the indexed payload fields; None when nothing is restricted."""
+    must: List[models.Condition] = []
+    if sections:
+        must.append(models.FieldCondition(key="section", match=models.MatchAny(any=list(sections))))
+    if code_prefix:
+        # Полный код ищем по индексу code, неполный — по списку префиксов
+        key = "code" if len(code_prefix) >= 6 else "code_prefixes"
+        must.append(models.FieldCondition(key=key, match=models.MatchValue(value=code_prefix)))
+    if min_price is not None or max_price is not None:
+        must.append(models.FieldCondition(key="base_price", range=models.Range(gte=min_price, lte=max_price)))
+    return models.Filter(must=must) if must else None
+
+
+def search_by_query(
+    query: str,
+    top_k: int = DEFAULT_TOP_K,
+    query_filter: Optional[models.Filter] = None,
+    collection: str = COLLECTION,
+) -> List[models.ScoredPoint]:
     model = load_model()
     vector = model.encode(query)
 
-    qdrant_url = os.getenv("QDRANT_URL")
-    if qdrant_url:
-        client = QdrantClient(url=qdrant_url)
-    else:
-        host = os.getenv("QDRANT_HOST", "127.0.0.1")
-        port = int(os.getenv("QDRANT_PORT", "6333"))
-        client = QdrantClient(host=host, port=port)
+    client = get_client()
     results = client.search(
-        collection_name=COLLECTION,
+        collection_name=collection,
         query_vector=vector,
+        query_filter=query_filter,
         limit=top_k,
+        search_params=quantization_search_params(client, collection),
     )
     return results
 
 
+async def asearch_by_query(
+    query: str,
+    top_k: int = DEFAULT_TOP_K,
+    query_filter: Optional[models.Filter] = None,
+    collection: str = COLLECTION,
+) -> List[models.ScoredPoint]:
+    """search_by_query for the event loop: the encoder runs in a worker thread, Qdrant is awaited."""
+    # Первый вызов ещё и загружает модель — тоже не на цикле событий
+    vector = await asyncio.to_thread(lambda: load_model().encode(query))
+    fresh, search_params = cached_search_params(collection)
+    if not fresh:
+        # Раз в SEARCH_PARAMS_TTL_SECONDS — через синхронный клиент, как и в search_by_query
+        search_params = await asyncio.to_thread(quantization_search_params, get_client(), collection)
+    return await get_async_client().search(
+        collection_name=collection,
+        query_vector=vector,
+        query_filter=query_filter,
+        limit=top_k,
+        search_params=search_params,
+    )
+
+
 def format_score(score: float) -> str:
     return f"{score:.3f}"
 
 
-def handle_query(query: str, top_k: int) -> None:
-    results = search_by_query(query, top_k)
+def handle_query(query: str, top_k: int, query_filter: Optional[models.Filter] = None) -> None:
+    results = search_by_query(query, top_k, query_filter)
     if not results:
         print("Ничего не найдено")
         return
@@ -116,17 +237,42 @@ def handle_query(query: str, top_k: int) -> None:
 
 
 def handle_code(code: str) -> None:
-    match = search_by_code(code)
-    print(match[["code", "display_name", "base_price", "section"]].to_string(index=False))
+    item = search_by_code(code)
+    print(f"{item.code} | {item.display_name} | {item.base_price:.2f} ₽ | {item.section}")
     guideline = match_guideline(code)
     if guideline:
         print(f"Рекомендация: {guideline['summary']} (см. {guideline['reference']})")
 
 
+def _entry_codes(entry: dict, key: str) -> List[str]:
+    # pd.read_json заполняет отсутствующие ключи NaN
+    value = entry.get(key)
+    return [str(code) for code in value] if isinstance(value, list) else []
+
+
+def guideline_index() -> Tuple[Dict[str, dict], List[Tuple[CodeRanges, dict]]]:
+    """Exact code -> first guideline, plus guidelines bound to code prefixes (``code_prefixes``)."""
+    global _guideline_index_cache
+    if _guideline_index_cache is None:
+        exact: Dict[str, dict] = {}
+        by_prefix: List[Tuple[CodeRanges, dict]] = []
+        for entry in load_guidelines():
+            for code in _entry_codes(entry, "codes"):
+                exact.setdefault(code, entry)
+            ranges = CodeRanges(prefixes=_entry_codes(entry, "code_prefixes"))
+            if ranges:
+                by_prefix.append((ranges, entry))
+        _guideline_index_cache = (exact, by_prefix)
+    return _guideline_index_cache
+
+
 def match_guideline(code: str) -> Optional[dict]:
-    guidelines = load_guidelines()
-    for entry in guidelines:
-        if code in entry.get("codes", []):
+    """Guideline for a code: an exact listing wins over a prefix such as ``809``."""
+    exact, by_prefix = guideline_index()
+    if code in exact:
+        return exact[code]
+    for ranges, entry in by_prefix:
+        if code in ranges:
             return entry
     return None
 
@@ -137,6 +283,10 @@ def build_parser() -> argparse.ArgumentParser:
     group.add_argument("--query", type=str, help="Текстовый запрос")
     group.add_argument("--code", type=str, help="Точный код услуги")
     parser.add_argument("--top", type=int, default=DEFAULT_TOP_K, help="Количество результатов")
+    parser.add_argument("--section", action="append", help="Искать только в разделе (можно несколько)")
+    parser.add_argument("--code-prefix", help="Искать только среди кодов с этим префиксом")
+    parser.add_argument("--min-price", type=float, help="Минимальная цена")
+    parser.add_argument("--max-price", type=float, help="Максимальная цена")
     return parser
 
 
@@ -145,7 +295,8 @@ def main(argv: Optional[List[str]] = None) -> None:
     args = parser.parse_args(argv)
 
     if args.query:
-        handle_query(args.query, args.top)
+        query_filter = build_filter(args.section, args.code_prefix, args.min_price, args.max_price)
+        handle_query(args.query, args.top, query_filter)
     elif args.code:
         handle_code(args.code)
     else:
@@ -0,0 +1,201 @@
+"""Synthetic dental price lists of arbitrary size, plus matching query sets.
+
+The output has the staging CSV format (section, code, display_name,
+base_price): sections are "Направление. Подраздел", each direction owns a
+block of six-digit codes (implantology lives under 8xxxxx like the real
+809xxx codes), names are composed from per-subsection procedures, materials,
+locations and complexity qualifiers, and prices follow a log-normal
+distribution around a per-subsection median rounded to 50 ₽.
+"""
+
+import argparse
+import csv
+import json
+import math
+import random
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from scripts.catalog_snapshot import BASE_DIR
+
+DEFAULT_OUTPUT = BASE_DIR / "storage" / "synthetic" / "price_items_50000.csv"
+DEFAULT_SIZE = 50_000
+DEFAULT_QUERIES = 1000
+CODE_BLOCK = 100_000
+
+# (первая цифра кода, направление, [(подраздел, медиана цены, вес, процедуры)])
+DIRECTIONS: List[Tuple[int, str, List[Tuple[str, int, float, List[str]]]]] = [
+    (1, "Диагностика", [
+        ("Консультации", 1100, 1.0, ["Прием врача-стоматолога", "Консультация специалиста", "Осмотр полости рта"]),
+        ("Рентгенография", 900, 0.8, ["Прицельный внутриротовой снимок", "Ортопантомограмма", "Телерентгенограмма"]),
+        ("Компьютерная томография", 3500, 0.5, ["Конусно-лучевая томография", "КТ височно-нижнечелюстного сустава"]),
+    ]),
+    (2, "Терапевтическая стоматология", [
+        ("Лечение кариеса", 4500, 1.5, ["Лечение поверхностного кариеса", "Лечение среднего кариеса", "Лечение глубокого кариеса"]),
+        ("Эндодонтия", 7800, 1.5, ["Механическая обработка канала", "Пломбирование канала", "Распломбирование канала", "Извлечение инородного тела из канала"]),
+        ("Реставрация", 9000, 1.2, ["Художественная реставрация", "Восстановление коронковой части", "Шинирование зубов"]),
+    ]),
+    (3, "Хирургическая стоматология", [
+        ("Удаление зубов", 3500, 1.5, ["Удаление зуба", "Удаление ретинированного зуба", "Удаление корня зуба"]),
+        ("Амбулаторные операции", 6500, 1.0, ["Резекция верхушки корня", "Цистэктомия", "Пластика уздечки", "Вскрытие абсцесса"]),
+        ("Костная пластика", 28000, 0.6, ["Направленная костная регенерация", "Пересадка костного блока", "Расщепление альвеолярного гребня"]),
+    ]),
+    (4, "Ортопедическая стоматология", [
+        ("Коронки", 22000, 1.5, ["Изготовление коронки", "Временная коронка", "Фиксация коронки"]),
+        ("Виниры и вкладки", 25000, 0.8, ["Винир", "Культевая вкладка", "Вкладка inlay", "Вкладка onlay"]),
+        ("Съемное протезирование", 35000, 0.7, ["Полный съемный протез", "Бюгельный протез", "Починка протеза"]),
+    ]),
+    (5, "Ортодонтия", [
+        ("Брекет-системы", 45000, 0.8, ["Установка брекет-системы", "Активация дуги", "Снятие брекет-системы"]),
+        ("Элайнеры", 120000, 0.4, ["Лечение элайнерами", "Сканирование для элайнеров", "Промежуточная коррекция"]),
+        ("Ретенция", 8000, 0.5, ["Фиксация ретейнера", "Изготовление каппы-ретейнера"]),
+    ]),
+    (6, "Пародонтология", [
+        ("Профессиональная гигиена", 5500, 1.2, ["Ультразвуковая чистка", "Air Flow", "Полировка зубов", "Фторирование"]),
+        ("Кюретаж", 3000, 0.8, ["Закрытый кюретаж пародонтального кармана", "Открытый кюретаж", "Вектор-терапия"]),
+        ("Лоскутные операции", 15000, 0.5, ["Лоскутная операция", "Пластика рецессии десны", "Пересадка соединительнотканного трансплантата"]),
+    ]),
+    (7, "Детская стоматология", [
+        ("Лечение молочных зубов", 3500, 1.0, ["Лечение кариеса молочного зуба", "Пульпотомия молочного зуба", "Удаление молочного зуба"]),
+        ("Профилактика", 2000, 0.8, ["Герметизация фиссур", "Серебрение молочных зубов", "Обучение гигиене"]),
+    ]),
+    (8, "Имплантология", [
+        ("Установка имплантатов", 45000, 1.2, ["Установка имплантата", "Одномоментная имплантация", "Установка мини-имплантата"]),
+        ("Синус-лифтинг", 40000, 0.5, ["Открытый синус-лифтинг", "Закрытый синус-лифтинг"]),
+        ("Формирователи и абатменты", 12000, 0.8, ["Установка формирователя десны", "Индивидуальный абатмент", "Коронка на имплантате"]),
+    ]),
+    (9, "Анестезиология", [
+        ("Местная анестезия", 800, 0.8, ["Инфильтрационная анестезия", "Проводниковая анестезия", "Аппликационная анестезия"]),
+        ("Седация", 9000, 0.3, ["Седация закисью азота", "Внутривенная седация"]),
+    ]),
+]
+QUALIFIERS = ["", "первичный", "повторный", "простое", "сложное", "с применением микроскопа", "под анестезией"]
+MATERIALS = ["", "Filtek", "e.max", "металлокерамика", "диоксид циркония", "Straumann", "Nobel", "Osstem", "композит"]
+LOCATIONS = [
+    "",
+    "на 1 зуб",
+    "на 1 канал",
+    "в области 1 сегмента",
+    "на верхней челюсти",
+    "на нижней челюсти",
+    "во фронтальном отделе",
+    "в боковом отделе",
+]
+
+SyntheticItem = Tuple[str, str, str, float]
+
+
+def _subsections() -> List[Tuple[int, int, str, int, float, List[str]]]:
+    rows = []
+    for digit, direction, subsections in DIRECTIONS:
+        for index, (name, median, weight, procedures) in enumerate(subsections):
+            rows.append((digit, index, f"{direction}. {name}", median, weight, procedures))
+    return rows
+
+
+def _name_variants(procedures: List[str], rng: random.Random) -> Iterator[str]:
+    """Unique names for one subsection: combinations first, then numbered variants."""
+    combos = [
+        (procedure, qualifier, material, location)
+        for procedure in procedures
+        for qualifier in QUALIFIERS
+        for material in MATERIALS
+        for location in LOCATIONS
+    ]
+    rng.shuffle(combos)
+    for combo in combos:
+        yield " ".join(part for part in combo if part)
+    variant = 2
+    while True:
+        for procedure in procedures:
+            yield f"{procedure} (вариант {variant})"
+        variant += 1
+
+
+def generate_items(size: int, seed: int = 42) -> List[SyntheticItem]:
+    rng = random.Random(seed)
+    subsections = _subsections()
+    total_weight = sum(weight for _, _, _, _, weight, _ in subsections)
+    # Подразделы направления идут подряд внутри его блока из 100 000 кодов
+    used: Dict[int, int] = {}
+    items: List[SyntheticItem] = []
+    allocated = 0
+    for position, (digit, _, section, median, weight, procedures) in enumerate(subsections):
+        remaining = size - allocated
+        count = remaining if position == len(subsections) - 1 else min(remaining, round(size * weight / total_weight))
+        allocated += count
+        start = digit * CODE_BLOCK + used.get(digit, 0)
+        used[digit] = used.get(digit, 0) + count
+        if used[digit] > CODE_BLOCK:
+            raise ValueError(f"Направление {digit}xxxxx: {used[digit]} позиций не помещаются в {CODE_BLOCK} кодов")
+        names = _name_variants(procedures, rng)
+        for offset in range(count):
+            price = rng.lognormvariate(math.log(median), 0.45)
+            price = max(100.0, round(price / 50) * 50)
+            items.append((section, f"{start + offset:06d}", next(names), float(price)))
+    return items
+
+
+def generate_queries(items: List[SyntheticItem], count: int, seed: int = 42) -> List[Dict[str, object]]:
+    """Query set with the expected code: full names, partial names, codes and typeahead prefixes."""
+    rng = random.Random(seed + 1)
+    queries: List[Dict[str, object]] = []
+    for section, code, name, _ in rng.sample(items, min(count, len(items))):
+        words = name.split()
+        kind = rng.choice(("exact", "partial", "code", "prefix"))
+        if kind == "exact":
+            query = name.lower()
+        elif kind == "partial":
+            query = " ".join(rng.sample(words, min(len(words), rng.randint(2, 3))))
+        elif kind == "code":
+            query = code
+        else:
+            query = words[0][: rng.randint(3, max(3, len(words[0])))]
+        queries.append({"kind": kind, "query": query, "expected": [code], "section": section})
+    return queries
+
+
+def write_catalog(items: List[SyntheticItem], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8-sig", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["section", "code", "display_name", "base_price"])
+        writer.writerows(items)
+
+
+def write_queries(queries: List[Dict[str, object]], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as fh:
+        for query in queries:
+            fh.write(json.dumps(query, ensure_ascii=False) + "\n")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Синтетический прайс заданного размера и набор запросов")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Количество позиций")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="Куда сохранить CSV")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Сколько запросов сгенерировать")
+    parser.add_argument("--queries-output", type=Path, help="JSONL с запросами (по умолчанию рядом с CSV)")
+    parser.add_argument("--snapshot", action="store_true", help="Сразу записать Arrow-снапшот рядом с CSV")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    items = generate_items(args.size, args.seed)
+    write_catalog(items, args.output)
+    queries_path = args.queries_output or args.output.with_suffix(".queries.jsonl")
+    write_queries(generate_queries(items, args.queries, args.seed), queries_path)
+    print(f"Прайс {args.output}: {len(items)} позиций; запросы: {queries_path}")
+    if args.snapshot:
+        from scripts.catalog_snapshot import read_csv, write_snapshot
+
+        snapshot_path = args.output.with_suffix(".arrow")
+        version = write_snapshot(read_csv(args.output), snapshot_path, source=args.output.name)
+        print(f"Снапшот {snapshot_path}, версия {version}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,50 @@
+from scripts.autocomplete import MERGE_MIN_WORDS, AutocompleteIndex
+from scripts.compact_catalog import CompactCatalog
+
+ROWS = [
+    ("Хирургия", "100001", "Удаление зуба простое", 1500.0),
+    ("Хирургия", "100002", "Удаление зуба сложное с разрезом", 3200.0),
+    ("Хирургия", "100003", "Удаление импланта", 5000.0),
+    ("Терапия", "200001", "Лечение зуба", 4000.0),
+    ("Терапия", "200002", "Лечение кариеса", 3500.0),
+    ("Хирургия", "100004", "Зуб мудрости: удаление", 2500.0),
+]
+
+
+def codes(items):
+    return [item.code for item in items]
+
+
+def test_single_prefix_ranks_short_names_first():
+    index = AutocompleteIndex(CompactCatalog(ROWS))
+    assert codes(index.suggest("удал")) == ["100003", "100001", "100004", "100002"]
+    assert codes(index.suggest("удал", limit=2)) == ["100003", "100001"]
+
+
+def test_leapfrog_intersection_of_several_words():
+    index = AutocompleteIndex(CompactCatalog(ROWS))
+    # Порядок слов в запросе не важен; каждое слово — префикс какого-то слова названия
+    assert codes(index.suggest("уда зуб")) == ["100001", "100004", "100002"]
+    assert codes(index.suggest("зуб уда")) == ["100001", "100004", "100002"]
+    assert codes(index.suggest("зуб уда слож")) == ["100002"]
+    assert codes(index.suggest("зуб уда", limit=1)) == ["100001"]
+    assert index.suggest("уда кариес") == []
+    assert index.suggest("несуществующее") == []
+
+
+def test_intersection_over_merged_postings():
+    # Префикс «к» покрывает больше MERGE_MIN_WORDS слов — ветка с объединённым списком
+    rows = [("Ортопедия", f"3000{pos:02d}", f"Коронка к{pos}x керамика", 10000.0 + pos) for pos in range(MERGE_MIN_WORDS * 2)]
+    rows.append(("Ортопедия", "300099", "Вкладка культевая", 7000.0))
+    index = AutocompleteIndex(CompactCatalog(rows))
+    start, end = index.word_range("к")
+    assert end - start >= MERGE_MIN_WORDS
+    found = codes(index.suggest("к керам", limit=50))
+    assert len(found) == MERGE_MIN_WORDS * 2 and "300099" not in found
+    assert codes(index.suggest("к7x к")) == ["300007"]
+
+
+def test_digits_query_uses_code_prefix():
+    index = AutocompleteIndex(CompactCatalog(ROWS))
+    assert codes(index.suggest("1000")) == ["100001", "100002", "100003", "100004"]
+    assert codes(index.suggest("2000", limit=1)) == ["200001"]
@@ -0,0 +1,50 @@
+import pytest
+
+from scripts.code_ranges import CodeRanges, code_number, parse_code_pattern, prefix_bounds
+
+
+def test_prefix_bounds():
+    assert prefix_bounds("8091") == (809100, 809200)
+    assert prefix_bounds("809") == (809000, 810000)
+    assert prefix_bounds("809102") == (809102, 809103)
+    assert prefix_bounds("") == (0, 1_000_000)
+
+
+@pytest.mark.parametrize("prefix", ["80a", "8091023", "-1"])
+def test_prefix_bounds_rejects_bad_prefixes(prefix):
+    with pytest.raises(ValueError):
+        prefix_bounds(prefix)
+
+
+def test_code_number_needs_six_digits():
+    assert code_number("809102") == 809102
+    assert code_number("80910") is None
+    assert code_number("80910a") is None
+
+
+def test_merged_prefixes_and_ranges():
+    ranges = CodeRanges(prefixes=("809", "8091"), ranges=[("810001", "810050"), ("810040", "810099")])
+    # Вложенный префикс и перекрывающиеся диапазоны сливаются в два интервала
+    assert ranges._starts == [809000, 810001]
+    assert ranges._ends == [810000, 810100]
+    assert "809000" in ranges and "809999" in ranges and "810000" not in ranges
+    assert "810099" in ranges and "810100" not in ranges
+    assert "808999" not in ranges
+    assert "8091" not in ranges
+    assert ranges.select(["809102", "202209", "810050"]) == ["809102", "810050"]
+    assert not CodeRanges()
+    # Соседние интервалы тоже сливаются
+    assert CodeRanges(prefixes=("809",), ranges=[("810000", "810009")])._starts == [809000]
+
+
+@pytest.mark.parametrize(
+    "raw, prefix",
+    [("8091xx", "8091"), ("809*", "809"), ("8091**", "8091"), ("8091хх", "8091"), (" 80XX ", "80")],
+)
+def test_parse_code_pattern(raw, prefix):
+    assert parse_code_pattern(raw) == prefix
+
+
+@pytest.mark.parametrize("raw", ["809102", "xx", "80x9", "809102x", "", "*"])
+def test_parse_code_pattern_rejects_non_patterns(raw):
+    assert parse_code_pattern(raw) is None
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from db.price_modifiers import ModifierIndex, PriceModifier, evaluate_plan
+
+START = datetime(2025, 3, 1, tzinfo=timezone.utc)
+END = datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+
+def modifier(code="100001", value="10", modifier_type="discount", is_percentage=True, condition=None, **dates):
+    return PriceModifier(
+        code=code,
+        modifier_type=modifier_type,
+        label=f"{modifier_type} {value}",
+        value=Decimal(value),
+        is_percentage=is_percentage,
+        valid_from=dates.get("valid_from", START),
+        valid_to=dates.get("valid_to", END),
+        condition=condition or {},
+    )
+
+
+def plan(*lines):
+    return {"items": [{"code": code, "base_price": price, "count": count} for code, price, count in lines]}
+
+
+def test_validity_window_edges():
+    index = ModifierIndex([modifier()])
+    assert index.active("100001", START - timedelta(microseconds=1)) == []
+    assert len(index.active("100001", START)) == 1
+    assert len(index.active("100001", END - timedelta(microseconds=1))) == 1
+    assert index.active("100001", END) == []
+    assert len(ModifierIndex([modifier(valid_to=None)]).active("100001", END + timedelta(days=365))) == 1
+
+
+def test_unknown_condition_disables_modifier():
+    index = ModifierIndex([modifier(condition={"min_count": 1, "weekday": "mon"})])
+    priced = evaluate_plan(plan(("100001", 1000, 1)), index, START)
+    assert priced["items"][0]["adjustments"] == []
+    assert priced["total"] == 1000.0
+
+
+def test_min_plan_total_and_requires_codes():
+    index = ModifierIndex(
+        [
+            modifier(condition={"min_plan_total": 5000}),
+            modifier(code="100002", value="500", modifier_type="surcharge", is_percentage=False,
+                     condition={"requires_codes": ["100001"]}),
+        ]
+    )
+    small = evaluate_plan(plan(("100001", 1000, 1), ("100002", 2000, 1)), index, START)
+    assert small["items"][0]["adjustments"] == []
+    assert small["items"][1]["sum"] == 2500.0
+
+    large = evaluate_plan(plan(("100001", 1000, 3), ("100002", 2000, 1)), index, START)
+    assert large["items"][0]["sum"] == 2700.0
+    assert large["adjustments_total"] == 200.0
+
+    without_required = evaluate_plan(plan(("100002", 2000, 1)), index, START)
+    assert without_required["items"][0]["sum"] == 2000.0
+
+
+def test_line_sum_is_clamped_at_zero():
+    index = ModifierIndex([modifier(value="800", is_percentage=False)])
+    priced = evaluate_plan(plan(("100001", 500, 1)), index, START)
+    assert priced["items"][0]["adjustments"][0]["amount"] == -800.0
+    assert priced["items"][0]["sum"] == 0.0
+    assert priced["total"] == 0.0
+
+
+def test_cents_round_half_up():
+    # 10% от 1.25 = 0.125: ROUND_HALF_UP даёт 0.13, банковское округление дало бы 0.12
+    index = ModifierIndex([modifier(modifier_type="surcharge")])
+    priced = evaluate_plan(plan(("100001", "1.25", 1)), index, START)
+    assert priced["items"][0]["adjustments"][0]["amount"] == 0.13
+    assert priced["total"] == 1.38